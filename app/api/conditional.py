@@ -0,0 +1,97 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request, Response, status
+
+from database.pagination import encode_cursor, decode_cursor
+
+
+def list_etag(count: int, last_modified: Optional[datetime], params: Any) -> str:
+    """
+    ETag списка: число строк и max(updated_at) выборки плюс параметры запроса
+
+    Любая вставка или удаление меняет число строк, любое изменение - max(updated_at)
+    """
+    raw = json.dumps([count, last_modified, params], sort_keys=True, default=str)
+    return f'"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def detail_etag(id_: int, updated_at: datetime) -> str:
+    """
+    ETag объекта: закодированные id и updated_at (обратимо, см. parse_detail_etag)
+    """
+    return f'"{encode_cursor([id_, updated_at])}"'
+
+
+def parse_detail_etag(etag: str) -> Optional[tuple[int, datetime]]:
+    """
+    id и updated_at из ETag объекта или None, если ETag не выдавался сервисом
+    """
+    etag = etag.strip()
+    if etag.startswith("W/") or not (etag.startswith('"') and etag.endswith('"')):
+        return None
+    try:
+        id_, updated_at = decode_cursor(etag[1:-1], [int, datetime])
+    except ValueError:
+        return None
+    return id_, updated_at
+
+
+def parse_if_match(if_match: Optional[str], id_: int) -> Optional[list[datetime]]:
+    """
+    Допустимые значения updated_at из заголовка If-Match
+
+    Output:
+        None - условие не задано (нет заголовка или "*"),
+        иначе список updated_at из ETag этого объекта (пустой - ни один ETag не подходит)
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for etag in if_match.split(","):
+        parsed = parse_detail_etag(etag)
+        if parsed is not None and parsed[0] == id_:
+            versions.append(parsed[1])
+    return versions
+
+
+def http_date(value: datetime) -> str:
+    # updated_at хранится без часового пояса в UTC
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Проверка If-None-Match (приоритетно) и If-Modified-Since
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP-дата имеет точность до секунды
+    modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    return modified <= since
+
+
+def not_modified(etag: str, last_modified: Optional[datetime]) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers=validator_headers(etag, last_modified))
@@ -1,8 +1,33 @@
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
 from fastapi import Depends
 
 from unitofwork import AbstractUnitOfWork
-from modules.uow import BookshelfUnitofWork
+from modules.uow import BookshelfUnitofWork, ShardedUnitOfWork
+from settings import settings
 
-UOWBookshelf = Annotated[AbstractUnitOfWork, Depends(BookshelfUnitofWork)]
+
+def create_uow(read_only: bool = False) -> AbstractUnitOfWork:
+    if settings.DB_SHARD_URLS:
+        return ShardedUnitOfWork(read_only=read_only)
+    return BookshelfUnitofWork(read_only=read_only)
+
+
+async def uow() -> AsyncIterator[AbstractUnitOfWork]:
+    """
+    Единица работы запроса: одна сессия и транзакция на все вызовы сервисов
+
+    Соединение берется из пула при первом запросе к БД и возвращается при выходе
+    из эндпоинта, до кодирования ответа (см. utils.serialize)
+    """
+    async with create_uow().request_scope() as unit:
+        yield unit
+
+
+async def read_only_uow() -> AsyncIterator[AbstractUnitOfWork]:
+    async with create_uow(read_only=True).request_scope() as unit:
+        yield unit
+
+
+UOWBookshelf = Annotated[AbstractUnitOfWork, Depends(uow)]
+UOWBookshelfReadOnly = Annotated[AbstractUnitOfWork, Depends(read_only_uow)]
@@ -0,0 +1,89 @@
+"""
+Сравнение стоимости сериализации страницы списка материалов
+
+Было: utils.validation (model_validate + model_dump на каждый объект)
+и повторная валидация FastAPI по аннотации эндпоинта с рендером JSONResponse.
+Стало: utils.serialize (закэшированный TypeAdapter, один вызов на всю страницу).
+
+Запуск: python benchmarks/serialization.py [--page-size 100] [--rounds 2000] [--include]
+"""
+import argparse
+import asyncio
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(Path(__file__).parent.parent.__str__())  # pylint: disable=C2801
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from loguru import logger
+
+from modules.items_manager.schemas.responses import ItemResponse
+from modules.items_manager.schemas.units import Kind, Status, Priority
+from utils import serialize
+
+
+def make_page(page_size: int, include: bool) -> list[SimpleNamespace]:
+    user, tags = None, []
+    if include:
+        user = SimpleNamespace(id=1, email="user@example.ru", display_name="Иван Натаныч")
+        tags = [SimpleNamespace(id=i, user_id=1, name=f"тег {i}") for i in range(3)]
+    return [
+        SimpleNamespace(id=i, user_id=1, title=f"Материал {i}", kind=Kind.BOOK,
+                        status=Status.READING, priority=Priority.NORMAL,
+                        notes="Заметки к материалу " * 5, user=user, tags=tags,
+                        created_at=datetime.now(), updated_at=datetime.now())
+        for i in range(page_size)
+    ]
+
+
+def legacy_validation(validation_model, instance_object) -> list[dict]:
+    return [
+        validation_model.model_validate(instance, from_attributes=True).model_dump()
+        for instance in instance_object
+    ]
+
+
+RESPONSE_FIELD = create_model_field(name="Response", type_=list[ItemResponse], mode="serialization")
+LOOP = asyncio.new_event_loop()
+
+
+def legacy_pipeline(page) -> bytes:
+    content = legacy_validation(ItemResponse, page)
+    content = LOOP.run_until_complete(serialize_response(field=RESPONSE_FIELD,
+                                                         response_content=content,
+                                                         is_coroutine=True))
+    return JSONResponse(content).body
+
+
+def serializer_pipeline(page) -> bytes:
+    return serialize(ItemResponse, page).render_body()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--include", action="store_true",
+                        help="страница с загруженными user и tags (include=user,tags)")
+    args = parser.parse_args()
+
+    page = make_page(args.page_size, args.include)
+    timings = {}
+    for name, pipeline in (("utils.validation + FastAPI", legacy_pipeline),
+                           ("utils.serialize", serializer_pipeline)):
+        pipeline(page)
+        elapsed = min(timeit.repeat(lambda: pipeline(page), number=args.rounds // 10, repeat=10))
+        per_item = timings[name] = elapsed / (args.rounds // 10) / args.page_size * 1e6
+        logger.info(f"{name:<30} {per_item:8.2f} мкс/объект "
+                    f"({per_item * args.page_size / 1000:.3f} мс на страницу из {args.page_size})")
+    legacy, current = timings.values()
+    logger.success(f"utils.serialize быстрее в {legacy / current:.1f} раз")
+
+
+if __name__ == '__main__':
+    main()
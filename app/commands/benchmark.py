@@ -0,0 +1,112 @@
+import json
+import random
+import statistics
+import time
+
+from loguru import logger
+from sqlalchemy import text
+
+from database import connection
+from database.connection import async_session_maker
+from database.repository import DatabaseRepository
+from modules import models
+from modules.items_manager.schemas import filters as items_filters
+
+# листовые таблицы: секции секционированной таблицы или сама таблица, если она не секционирована
+LEAF_RELATIONS = text("""
+    SELECT tree.relid::regclass::text, pg_relation_size(tree.relid)
+    FROM pg_partition_tree(CAST(:table AS regclass)) AS tree
+    WHERE tree.isleaf
+    UNION ALL
+    SELECT CAST(:table AS text), pg_relation_size(CAST(:table AS regclass))
+    WHERE NOT EXISTS (SELECT FROM pg_partition_tree(CAST(:table AS regclass)))
+    ORDER BY 1
+""")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def sample_users(users: int, seed: int) -> list[int]:
+    """
+    Случайные (воспроизводимо по seed) пользователи, у которых есть материалы
+    """
+    async with async_session_maker() as session:
+        user_ids = (await session.scalars(text(
+            "SELECT user_id FROM user_item_stats WHERE total > 0 ORDER BY user_id"))).all()
+    return random.Random(seed).sample(list(user_ids), min(users, len(user_ids)))
+
+
+async def list_latency(user_ids: list[int], repeats: int) -> dict:
+    """
+    Время первой страницы материалов пользователя (apply_filters с сортировкой по умолчанию)
+
+    Первый проход прогревает кэш страниц и подготовленных выражений и не учитывается
+    """
+    sort_params = items_filters.PaginationAndSorting.model_validate({}).model_dump(exclude={"count"})
+    timings = []
+    async with async_session_maker() as session:
+        repository = DatabaseRepository(models.Items, session)
+        for attempt in range(repeats + 1):
+            for user_id in user_ids:
+                started = time.perf_counter()
+                await repository.apply_filters({"user_id": user_id}, sort_params)
+                if attempt:
+                    timings.append((time.perf_counter() - started) * 1000)
+                session.expunge_all()
+    return {
+        "queries": len(timings),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(percentile(timings, 0.5), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+    }
+
+
+async def vacuum_cost(user_ids: list[int]) -> dict:
+    """
+    Стоимость VACUUM после изменения всех материалов выбранных пользователей
+
+    Каждая листовая таблица очищается отдельно, как это делает autovacuum:
+    max_ms - самый долгий отдельный проход (и его таблица), total_ms - сумма
+    """
+    table = models.Items.__tablename__
+    async with connection.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        leaves = (await conn.execute(LEAF_RELATIONS, {"table": table})).all()
+        for leaf, _ in leaves:
+            await conn.execute(text(f"VACUUM {leaf}"))
+        # мертвые версии строк: обновление без изменения значений
+        updated = (await conn.execute(
+            text(f"UPDATE {table} SET notes = notes WHERE user_id = ANY(:user_ids)"),
+            {"user_ids": user_ids})).rowcount
+        timings = {}
+        for leaf, _ in leaves:
+            started = time.perf_counter()
+            await conn.execute(text(f"VACUUM {leaf}"))
+            timings[leaf] = (time.perf_counter() - started) * 1000
+    largest_leaf = max(timings, key=timings.get)
+    return {
+        "relations": len(leaves),
+        "updated_rows": updated,
+        "largest_relation_mb": round(max(size for _, size in leaves) / 2 ** 20, 1),
+        "total_ms": round(sum(timings.values()), 1),
+        "max_ms": round(timings[largest_leaf], 1),
+        "max_relation": largest_leaf,
+    }
+
+
+async def run(users: int = 200, repeats: int = 5, seed: int = 0) -> dict:
+    """
+    Замер задержки выборки материалов пользователя и стоимости VACUUM items
+
+    Запускается до и после секционирования на одних данных (тот же seed)
+    """
+    user_ids = await sample_users(users, seed)
+    report = {
+        "list": await list_latency(user_ids, repeats),
+        "vacuum": await vacuum_cost(user_ids),
+    }
+    logger.success(f"Результаты замера:\n{json.dumps(report, indent=2, ensure_ascii=False)}")
+    return report
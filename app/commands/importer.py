@@ -0,0 +1,292 @@
+import csv
+import itertools
+import json
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import func, select, text
+
+from database.connection import async_session_maker
+from modules import models
+from modules.items_manager.schemas.requests import CreatePutItem
+from modules.users_manager.schemas.requests import CreatePutUser
+
+# разделитель имен тегов в CSV-колонке tags
+CSV_TAGS_SEPARATOR = "|"
+# предел кэша (user_id, имя тега) -> id, чтобы память не росла с размером файла
+TAG_CACHE_LIMIT = 100_000
+# пары (user_id, имя) передаются двумя массивами: текст запроса не зависит от размера пачки
+INSERT_TAGS = text("""
+    INSERT INTO tags (user_id, name)
+    SELECT * FROM unnest(CAST(:user_ids AS integer[]), CAST(:names AS varchar[]))
+    ON CONFLICT ON CONSTRAINT unique_name_for_user DO NOTHING
+""")
+SELECT_USERS = text("SELECT id FROM users WHERE id = ANY(CAST(:ids AS integer[]))")
+# пачка пользователей копируется во временную таблицу: строки, нарушающие уникальность
+# (id, email, display_name), пропускаются при переносе, а не обрывают COPY
+CREATE_USERS_STAGE = text(
+    "CREATE TEMP TABLE import_users (line integer, id integer, email varchar(255), "
+    "display_name varchar(50)) ON COMMIT DROP")
+INSERT_USERS = text("""
+    INSERT INTO users (id, email, display_name)
+    SELECT id, email, display_name FROM import_users ORDER BY line
+    ON CONFLICT DO NOTHING
+    RETURNING id, email
+""")
+SELECT_TAGS = text("""
+    SELECT tags.user_id, tags.name, tags.id
+    FROM tags
+    JOIN unnest(CAST(:user_ids AS integer[]), CAST(:names AS varchar[])) AS keys(user_id, name)
+      ON tags.user_id = keys.user_id AND tags.name = keys.name
+""")
+
+
+class TagRow(BaseModel):
+    user_id: int = Field(description="ID пользователя")
+    name: str = Field(description="Название тега", min_length=1, max_length=50)
+
+
+IMPORT_SCHEMAS: dict[str, type[BaseModel]] = {
+    "users": CreatePutUser,
+    "items": CreatePutItem,
+    "tags": TagRow,
+}
+
+
+def read_rows(path: Path, file_format: str) -> Iterator[dict]:
+    """
+    Потоковое чтение CSV (с заголовком) или NDJSON: в памяти одна строка файла
+    """
+    with path.open(newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            for row in csv.DictReader(file):
+                # пустые ячейки CSV - отсутствующие значения (действуют умолчания схемы)
+                row = {key: value for key, value in row.items() if value != ""}
+                if "tags" in row:
+                    row["tags"] = row["tags"].split(CSV_TAGS_SEPARATOR)
+                yield row
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Importer:
+    """
+    Загрузка пользователей, материалов или тегов из файла пачками через COPY
+
+    Каждая пачка загружается в отдельной транзакции вместе с обновлением
+    import_checkpoints, поэтому после сбоя импорт продолжается с первой
+    незагруженной строки без дублей
+    """
+
+    def __init__(self, kind: str, path: Path, file_format: str,
+                 batch_size: int, job: Optional[str] = None):
+        self.kind = kind
+        self.path = path
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.job = job or f"{kind}:{path.name}"
+        self.schema = IMPORT_SCHEMAS[kind]
+        self.tag_ids: dict[tuple[int, str], int] = {}
+        self.loaded = 0
+        self.rejected = 0
+
+    async def run(self, restart: bool = False) -> int:
+        """
+        Output:
+            Количество отклоненных (не прошедших валидацию) строк
+        """
+        rows_done = await self.start_checkpoint(restart)
+        if rows_done:
+            logger.info(f"Импорт '{self.job}' продолжается со строки {rows_done + 1}")
+        rows = itertools.islice(read_rows(self.path, self.file_format), rows_done, None)
+        started = time.perf_counter()
+        while batch := list(itertools.islice(rows, self.batch_size)):
+            records = self.validate(batch, rows_done)
+            rows_done += len(batch)
+            await self.load_batch(records, rows_done)
+            elapsed = time.perf_counter() - started
+            logger.info(f"[{self.job}] обработано строк: {rows_done}, загружено: {self.loaded}, "
+                        f"отклонено: {self.rejected}, {self.loaded / elapsed:.0f} строк/с")
+        logger.success(f"Импорт '{self.job}' завершен: загружено {self.loaded}, отклонено {self.rejected}")
+        return self.rejected
+
+    def validate(self, batch: list[dict], offset: int) -> list[dict]:
+        records = []
+        for number, row in enumerate(batch, start=offset + 1):
+            tags = row.pop("tags", None) if self.kind == "items" else None
+            try:
+                record = self.schema.model_validate(row).model_dump()
+                if row.get("id") is not None:
+                    record["id"] = int(row["id"])
+            except (ValidationError, ValueError) as e:
+                self.rejected += 1
+                logger.warning(f"[{self.job}] строка {number} отклонена: {e}")
+                continue
+            record["tags"] = [name.strip() for name in tags or [] if name.strip()]
+            record["line"] = number
+            records.append(record)
+        return records
+
+    def reject(self, record: dict, reason: str) -> None:
+        self.rejected += 1
+        logger.warning(f"[{self.job}] строка {record['line']} отклонена: {reason}")
+
+    async def start_checkpoint(self, restart: bool) -> int:
+        checkpoints = models.ImportCheckpoints
+        async with async_session_maker() as session:
+            checkpoint = await session.scalar(
+                select(checkpoints).where(checkpoints.job == self.job))
+            if checkpoint is None:
+                session.add(checkpoints(job=self.job, kind=self.kind,
+                                        source=str(self.path), rows_done=0))
+            elif checkpoint.kind != self.kind:
+                raise ValueError(f"Задача '{self.job}' уже использовалась для импорта {checkpoint.kind}")
+            elif restart:
+                checkpoint.rows_done = 0
+            await session.commit()
+            return 0 if checkpoint is None or restart else checkpoint.rows_done
+
+    async def load_batch(self, records: list[dict], rows_done: int) -> None:
+        checkpoints = models.ImportCheckpoints
+        async with async_session_maker() as session:
+            # блокировка строки задачи: транзакция начата до COPY,
+            # параллельный запуск той же задачи ждет ее завершения
+            await session.execute(select(checkpoints.id).where(
+                checkpoints.job == self.job).with_for_update())
+            connection = await (await session.connection()).get_raw_connection()
+            driver = connection.driver_connection
+            # строки, которые отклонила бы только БД, отсеиваются до COPY: ошибка
+            # откатила бы всю пачку, и продолжение импорта (--job) повторяло бы ее бесконечно
+            match self.kind:
+                case "users":
+                    records = await self.copy_users(session, driver, records)
+                case "items":
+                    records = await self.existing_owners(session, records)
+                    await self.copy_items(session, driver, records)
+                case "tags":
+                    records = await self.existing_owners(session, records)
+                    await self.resolve_tags(session, {(record["user_id"], record["name"]) for record in records})
+            await session.execute(
+                checkpoints.__table__.update()
+                .where(checkpoints.job == self.job)
+                .values(rows_done=rows_done, updated_at=func.now()))
+            await session.commit()
+        self.loaded += len(records)
+
+    async def existing_owners(self, session, records: list[dict]) -> list[dict]:
+        """
+        Строки пачки, владелец (user_id) которых задан и существует: один запрос на пачку
+        """
+        ids = list({record["user_id"] for record in records if record.get("user_id") is not None})
+        existing = set((await session.scalars(SELECT_USERS, {"ids": ids})).all()) if ids else set()
+        accepted = []
+        for record in records:
+            if record.get("user_id") is None:
+                self.reject(record, "не указан user_id")
+            elif record["user_id"] not in existing:
+                self.reject(record, f"пользователя с id '{record['user_id']}' не существует")
+            else:
+                accepted.append(record)
+        return accepted
+
+    async def allocate_ids(self, session, table: str, records: list[dict]) -> bool:
+        """
+        id из последовательности для строк без id; True, если в пачке были явные id
+        """
+        missing = [record for record in records if record.get("id") is None]
+        if missing:
+            ids = (await session.scalars(
+                text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+                {"table": table, "count": len(missing)})).all()
+            for record, id_ in zip(missing, ids):
+                record["id"] = id_
+        return len(missing) < len(records)
+
+    async def sync_sequence(self, session, table: str) -> None:
+        # явные id из исходной базы: последовательность должна выдавать следующие за ними
+        await session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"GREATEST((SELECT max(id) FROM {table}), 1))"))
+
+    async def copy_users(self, session, driver, records: list[dict]) -> list[dict]:
+        """
+        Output:
+            Загруженные строки; занятые id, email или display_name отклоняются
+        """
+        if not records:
+            return records
+        explicit_ids = await self.allocate_ids(session, "users", records)
+        await session.execute(CREATE_USERS_STAGE)
+        await driver.copy_records_to_table(
+            "import_users", columns=["line", "id", "email", "display_name"],
+            records=[(record["line"], record["id"], record["email"], record["display_name"])
+                     for record in records])
+        # (id, email) однозначно указывает на строку пачки: из повторов вставлена первая
+        inserted = {tuple(row) for row in await session.execute(INSERT_USERS)}
+        loaded = []
+        for record in records:
+            key = (record["id"], record["email"])
+            if key in inserted:
+                inserted.remove(key)
+                loaded.append(record)
+            else:
+                self.reject(record, f"id, email или display_name заняты ({record['email']}, {record['display_name']})")
+        if explicit_ids:
+            await self.sync_sequence(session, "users")
+        return loaded
+
+    async def copy_items(self, session, driver, records: list[dict]) -> None:
+        explicit_ids = await self.allocate_ids(session, "items", records)
+        await driver.copy_records_to_table(
+            "items", columns=["id", "user_id", "title", "kind", "status", "priority", "notes"],
+            records=[(record["id"], record["user_id"], record["title"], record["kind"].name,
+                      record["status"].name, record["priority"].name, record["notes"])
+                     for record in records])
+        if explicit_ids:
+            await self.sync_sequence(session, "items")
+        tag_keys = {(record["user_id"], name) for record in records for name in record["tags"]}
+        if not tag_keys:
+            return
+        await self.resolve_tags(session, tag_keys)
+        links = {
+            (record["id"], self.tag_ids[(record["user_id"], name)], record["user_id"])
+            for record in records for name in record["tags"]
+        }
+        await driver.copy_records_to_table(
+            models.items_tags_association_table.name,
+            columns=["item_id", "tag_id", "user_id"], records=list(links))
+
+    async def resolve_tags(self, session, keys: set[tuple[int, str]]) -> None:
+        """
+        Сопоставление пар (user_id, имя тега) с id, недостающие теги создаются
+        """
+        if len(self.tag_ids) > TAG_CACHE_LIMIT:
+            self.tag_ids.clear()
+        missing = [key for key in keys if key not in self.tag_ids]
+        if not missing:
+            return
+        user_ids, names = zip(*missing)
+        params = {"user_ids": list(user_ids), "names": list(names)}
+        await session.execute(INSERT_TAGS, params)
+        for user_id, name, id_ in await session.execute(SELECT_TAGS, params):
+            self.tag_ids[(user_id, name)] = id_
+
+
+def detect_format(path: Path, file_format: Optional[str]) -> str:
+    if file_format:
+        return file_format
+    return "csv" if path.suffix.lower() == ".csv" else "ndjson"
+
+
+async def run(kind: str, path: str, file_format: Optional[str] = None,
+              batch_size: int = 5000, job: Optional[str] = None,
+              restart: bool = False) -> int:
+    source = Path(path)
+    importer = Importer(kind, source, detect_format(source, file_format), batch_size, job)
+    return await importer.run(restart)
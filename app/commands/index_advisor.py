@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from database.connection import async_session_maker
+from database.repository import DatabaseRepository
+from modules import models
+from modules.items_manager.schemas import filters as items_filters
+from modules.users_manager.schemas import filters as users_filters
+
+DEFAULT_SHAPES = Path(__file__).parent.joinpath("query_shapes.json")
+
+SHAPE_MODELS = {
+    "items": (models.Items, items_filters.ItemsFilter, items_filters.PaginationAndSorting),
+    "users": (models.Users, users_filters.UserFilter, users_filters.PaginationAndSorting),
+}
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    """
+    Рекурсивный поиск узлов Seq Scan в плане EXPLAIN (FORMAT JSON)
+    """
+    relations = []
+    if plan.get("Node Type") == "Seq Scan":
+        relations.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        relations.extend(find_seq_scans(child))
+    return relations
+
+
+async def explain_shape(session, shape: dict, force_index: bool) -> list[str]:
+    """
+    EXPLAIN запроса, который apply_filters строит для записанного набора фильтров
+
+    Args:
+        session: сессия БД
+        shape: {"model": ..., "filters": {...}, "sorting": {...}, "keyset": bool}
+        force_index: запретить планировщику Seq Scan (проверка наличия пригодного индекса)
+
+    Output:
+        Таблицы, которые читаются последовательным сканированием
+    """
+    model, filter_schema, sorting_schema = SHAPE_MODELS[shape["model"]]
+    repository = DatabaseRepository(model, session)
+    filters = filter_schema.model_validate(shape.get("filters", {})).model_dump()
+    sort_params = sorting_schema.model_validate(shape.get("sorting", {})).model_dump()
+    if shape.get("keyset"):
+        first_page = await repository.apply_filters(filters, {**sort_params, "limit": 1})
+        sort_params["cursor"] = repository.get_next_cursor(first_page, {**sort_params, "limit": 1})
+    query = repository.build_filter_query(filters, sort_params)
+    compiled = query.compile(dialect=postgresql.dialect(),
+                             compile_kwargs={"literal_binds": True})
+    if force_index:
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = (await session.execute(
+        text(f"EXPLAIN (FORMAT JSON) {compiled}"))).scalar_one()
+    # SET LOCAL действует до конца транзакции
+    await session.rollback()
+    return find_seq_scans(plan[0]["Plan"])
+
+
+async def run(shapes_path: str, force_index: bool = False) -> int:
+    """
+    Прогон записанных комбинаций фильтров и сортировок через EXPLAIN
+
+    Output:
+        Количество комбинаций, которые по-прежнему выполняются через Seq Scan
+    """
+    shapes = json.loads(Path(shapes_path).read_text())
+    failed = 0
+    async with async_session_maker() as session:
+        for shape in shapes:
+            seq_scans = await explain_shape(session, shape, force_index)
+            description = (f"{shape['model']}: filters={shape.get('filters', {})} "
+                           f"sorting={shape.get('sorting', {})} keyset={shape.get('keyset', False)}")
+            if seq_scans:
+                failed += 1
+                logger.warning(f"[SEQ SCAN: {', '.join(seq_scans)}] {description}")
+            else:
+                logger.success(f"[INDEX] {description}")
+    logger.info(f"Проверено комбинаций: {len(shapes)}, с последовательным сканированием: {failed}")
+    return failed
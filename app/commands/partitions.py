@@ -0,0 +1,170 @@
+import asyncio
+import re
+from datetime import date
+from typing import Optional
+
+import asyncpg
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from database import connection
+from database.connection import async_session_maker
+from database.sharding import shard_session_makers
+from modules import models
+from settings import settings
+
+# секции журнала называются <таблица>_YYYY_MM и покрывают календарный месяц
+PARTITION_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+PARTITIONS_QUERY = text("""
+    SELECT child.relname, inherits.inhdetachpending
+    FROM pg_inherits AS inherits
+    JOIN pg_class AS parent ON parent.oid = inherits.inhparent
+    JOIN pg_class AS child ON child.oid = inherits.inhrelid
+    WHERE parent.relname = :table
+""")
+# создание секции берет ACCESS EXCLUSIVE на родительскую таблицу: при долгой
+# очереди блокировок лучше пропустить запуск, чем остановить запись материалов
+LOCK_TIMEOUT = "5s"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def partition_month(table: str, name: str) -> Optional[date]:
+    match = PARTITION_SUFFIX.search(name)
+    if not name.startswith(table) or match is None:
+        return None
+    return date(int(match[1]), int(match[2]), 1)
+
+
+async def list_partitions(session, table: str) -> dict[str, bool]:
+    """
+    Секции таблицы: имя -> признак незавершенного отсоединения
+    """
+    rows = await session.execute(PARTITIONS_QUERY, {"table": table})
+    return {name: pending for name, pending in rows}
+
+
+async def ensure(months_ahead: Optional[int] = None,
+                 session_maker: async_sessionmaker = async_session_maker) -> list[str]:
+    """
+    Создание секций item_events с текущего месяца на months_ahead месяцев вперед
+
+    Секции по умолчанию нет (с ней невозможно DETACH ... CONCURRENTLY): в месяц
+    без секции триггер пишет только дневную сводку, поэтому команда запускается
+    заранее - при старте сервиса и периодически (maintain). Если блокировку
+    таблицы не удалось получить за LOCK_TIMEOUT, запуск пропускается с предупреждением
+
+    Args:
+        session_maker: фабрика сессий БД (основной или шарда)
+
+    Output:
+        Имена созданных секций
+    """
+    table = models.ItemEvents.__tablename__
+    months_ahead = settings.EVENTS_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    current = date.today().replace(day=1)
+    created = []
+    async with session_maker() as session:
+        existing = await list_partitions(session, table)
+        await session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        try:
+            for offset in range(months_ahead + 1):
+                month = add_months(current, offset)
+                name = partition_name(table, month)
+                if name in existing:
+                    continue
+                await session.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"))
+                created.append(name)
+            await session.commit()
+        except DBAPIError as e:
+            if not isinstance(e.orig.__cause__, asyncpg.exceptions.LockNotAvailableError):
+                raise
+            await session.rollback()
+            logger.warning(f"Секции {table} не созданы: таблица занята дольше {LOCK_TIMEOUT}, "
+                           f"следующая попытка - при следующем запуске")
+            return []
+    if created:
+        logger.info(f"Созданы секции {table}: {', '.join(created)}")
+    return created
+
+
+async def ensure_all(months_ahead: Optional[int] = None) -> list[str]:
+    """
+    ensure на основной БД и на всех шардах (если они настроены)
+    """
+    created = await ensure(months_ahead)
+    for session_maker in shard_session_makers:
+        created += await ensure(months_ahead, session_maker)
+    return created
+
+
+async def maintain(interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача сервиса: ensure_all раз в interval секунд (до отмены задачи)
+
+    Ошибки запуска логируются и не останавливают задачу
+    """
+    interval = settings.EVENTS_PARTITIONS_INTERVAL if interval is None else interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await ensure_all()
+        except Exception as e:
+            logger.error(f"Ошибка создания секций item_events: {e}")
+
+
+async def detach(retention_months: Optional[int] = None, drop: bool = False,
+                 engine: Optional[AsyncEngine] = None) -> list[str]:
+    """
+    Отсоединение секций item_events старше retention_months месяцев
+
+    DETACH PARTITION ... CONCURRENTLY не блокирует чтение и запись журнала
+    (только SHARE UPDATE EXCLUSIVE) и не может выполняться в транзакции, поэтому
+    каждая секция отсоединяется отдельной командой в режиме AUTOCOMMIT.
+    Прерванное отсоединение завершается FINALIZE при следующем запуске.
+    Дневная сводка item_event_rollups при этом сохраняется
+
+    Args:
+        engine: движок БД (по умолчанию основной)
+
+    Output:
+        Имена отсоединенных секций
+    """
+    table = models.ItemEvents.__tablename__
+    retention_months = settings.EVENTS_RETENTION_MONTHS if retention_months is None else retention_months
+    oldest = add_months(date.today().replace(day=1), -retention_months)
+    detached = []
+    engine = connection.engine if engine is None else engine
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        partitions = await list_partitions(conn, table)
+        for name, pending in sorted(partitions.items()):
+            month = partition_month(table, name)
+            if month is None or month >= oldest:
+                continue
+            mode = "FINALIZE" if pending else "CONCURRENTLY"
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name} {mode}"))
+            if drop:
+                await conn.execute(text(f"DROP TABLE {name}"))
+            detached.append(name)
+    if detached:
+        action = "удалены" if drop else "отсоединены"
+        logger.success(f"Секции {table} {action}: {', '.join(detached)}")
+    return detached
+
+
+async def run(months_ahead: Optional[int] = None, retention_months: Optional[int] = None,
+              drop: bool = False) -> None:
+    await ensure(months_ahead)
+    await detach(retention_months, drop)
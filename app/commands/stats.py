@@ -0,0 +1,51 @@
+from loguru import logger
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database.connection import async_session_maker
+from modules import models
+
+
+def stats_counters() -> dict:
+    """
+    Выражения счетчиков user_item_stats по колонкам items (для пересчета одним GROUP BY)
+    """
+    items = models.Items
+    counters = {"total": func.count(items.id)}
+    for dimension, members in models.USER_ITEM_STATS_DIMENSIONS.items():
+        column = getattr(items, dimension)
+        for member in members:
+            counters[f"{dimension}_{member.value}"] = func.count(items.id).filter(column == member)
+    return counters
+
+
+async def rebuild() -> int:
+    """
+    Пересчет user_item_stats с нуля одним INSERT ... SELECT ... GROUP BY
+
+    На время пересчета изменения items блокируются (SHARE), чтобы триггеры
+    не применили изменения поверх уже посчитанных значений
+
+    Output:
+        Количество исправленных (или созданных) строк сводки
+    """
+    stats = models.UserItemStats
+    counters = stats_counters()
+    rows = (select(models.Users.id, *(counter.label(name) for name, counter in counters.items()))
+            .outerjoin(models.Items, models.Items.user_id == models.Users.id)
+            .group_by(models.Users.id))
+    query = pg_insert(stats).from_select(["user_id", *counters], rows)
+    current = tuple_(*(getattr(stats, name) for name in counters))
+    changed = tuple_(*(query.excluded[name] for name in counters))
+    query = query.on_conflict_do_update(
+        index_elements=[stats.user_id],
+        set_={**{name: query.excluded[name] for name in counters}, "updated_at": func.now()},
+        # строки, совпадающие с пересчетом, не перезаписываются
+        where=current.is_distinct_from(changed),
+    )
+    async with async_session_maker() as session:
+        await session.execute(text(f"LOCK TABLE {models.Items.__tablename__} IN SHARE MODE"))
+        repaired = (await session.execute(query)).rowcount
+        await session.commit()
+    logger.success(f"Сводка user_item_stats пересчитана, исправлено строк: {repaired}")
+    return repaired
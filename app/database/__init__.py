@@ -3,5 +3,5 @@ from pathlib import Path
 
 sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
 
-from database.connection import async_session_maker, get_db_session, get_repository, migrate_tables
+from database.connection import async_session_maker, get_db_session, get_repository, migrate_tables, init_engine, dispose_engine
 from database.base import Base
@@ -0,0 +1,509 @@
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import date, datetime
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Optional
+
+from loguru import logger
+from pydantic_core import from_json, to_json
+from sqlalchemy import inspect, Enum as EnumType
+
+from database.base import Base
+from settings import settings
+
+ALL_TAG = "all"
+PENDING_INVALIDATION = "cache_invalidate"
+
+
+class Snapshot(dict):
+    """
+    Снимок строки для кэша: словарь с доступом к полям как к атрибутам
+
+    Сериализуется схемами ответа (from_attributes) и get_next_cursor так же,
+    как ORM-объект, но не привязан к сессии
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(name) from e
+
+
+def snapshot(instance: Any, visited: frozenset = frozenset()) -> Any:
+    """
+    Снимок ORM-объекта (загруженные колонки и связи) или строки RowMapping
+    """
+    if instance is None:
+        return None
+    if isinstance(instance, Mapping):
+        return Snapshot(instance)
+    state = inspect(instance)
+    data = Snapshot({
+        attribute.key: state.dict[attribute.key]
+        for attribute in state.mapper.column_attrs
+        if attribute.key in state.dict
+    })
+    visited = visited | {id(instance)}
+    for relationship in state.mapper.relationships:
+        value = state.dict.get(relationship.key)
+        if value is None:
+            continue
+        if relationship.uselist:
+            data[relationship.key] = [
+                snapshot(related, visited) for related in value
+                if id(related) not in visited
+            ]
+        elif id(value) not in visited:
+            data[relationship.key] = snapshot(value, visited)
+    return data
+
+
+def owner_ids(instance: Any) -> set[int]:
+    """
+    Пользователи, которым принадлежит объект (включая прежнего владельца при смене user_id)
+
+    Владелец - колонка user_id модели, для самих пользователей - id
+    """
+    state = inspect(instance)
+    key = "user_id" if "user_id" in state.mapper.column_attrs else "id"
+    owners = {state.dict.get(key), *state.attrs[key].history.deleted}
+    owners.discard(None)
+    return owners
+
+
+def user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def make_key(model: type, operation: str, *params: Any) -> str:
+    """
+    Ключ кэша: модель, операция и нормализованные параметры запроса
+    """
+
+    def normalize(value: Any) -> Any:
+        if isinstance(value, Enum):
+            return value.value
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, Mapping):
+            return {key: normalize(item) for key, item in value.items() if item is not None}
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sorted(normalize(item) for item in value)
+        return value
+
+    raw = json.dumps([normalize(param) for param in params], sort_keys=True, default=str)
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f"bookshelf:{model.__tablename__}:{operation}:{digest}"
+
+
+@lru_cache(maxsize=None)
+def enum_types() -> dict[str, type[Enum]]:
+    """
+    Перечисления колонок моделей: единственные классы, которые восстанавливаются из кэша
+    """
+    return {
+        column.type.enum_class.__qualname__: column.type.enum_class
+        for mapper in Base.registry.mappers
+        for column in mapper.columns
+        if isinstance(column.type, EnumType) and column.type.enum_class is not None
+    }
+
+
+def encode_value(value: Any) -> bytes:
+    """
+    Кодирование значения кэша в JSON (pydantic_core) с пометкой типов,
+    которые JSON не различает: снимки, кортежи, даты и перечисления
+    """
+
+    def tagged(item: Any) -> Any:
+        if isinstance(item, Snapshot):
+            return {"snapshot": {key: tagged(field) for key, field in item.items()}}
+        if isinstance(item, Mapping):
+            return {"dict": {key: tagged(field) for key, field in item.items()}}
+        if isinstance(item, tuple):
+            return {"tuple": [tagged(element) for element in item]}
+        if isinstance(item, list):
+            return [tagged(element) for element in item]
+        if isinstance(item, datetime):
+            return {"datetime": item.isoformat()}
+        if isinstance(item, date):
+            return {"date": item.isoformat()}
+        if isinstance(item, Enum):
+            return {"enum": type(item).__qualname__, "value": item.value}
+        return item
+
+    return to_json(tagged(value))
+
+
+def decode_value(raw: bytes) -> Any:
+    """
+    Обратное к encode_value преобразование; неизвестное перечисление - ошибка ValueError
+    """
+
+    def untagged(item: Any) -> Any:
+        if isinstance(item, list):
+            return [untagged(element) for element in item]
+        if not isinstance(item, dict):
+            return item
+        if "snapshot" in item:
+            return Snapshot({key: untagged(field) for key, field in item["snapshot"].items()})
+        if "dict" in item:
+            return {key: untagged(field) for key, field in item["dict"].items()}
+        if "tuple" in item:
+            return tuple(untagged(element) for element in item["tuple"])
+        if "datetime" in item:
+            return datetime.fromisoformat(item["datetime"])
+        if "date" in item:
+            return date.fromisoformat(item["date"])
+        if "enum" in item:
+            enum_class = enum_types().get(item["enum"])
+            if enum_class is None:
+                raise ValueError(f"Неизвестное перечисление в кэше: {item['enum']}")
+            return enum_class(item["value"])
+        raise ValueError(f"Неизвестный тип значения в кэше: {sorted(item)}")
+
+    return untagged(from_json(raw))
+
+
+class CacheStatistics:
+    """Счетчики попаданий, промахов, вытеснений, инвалидаций и отклоненных записей кэша"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    def to_dict(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "rejected": self.rejected,
+        }
+
+
+class CacheBackend(ABC):
+    """
+    Хранилище результатов запросов
+
+    Каждая запись помечается тегами (user:<id> или all); запись удаляется,
+    когда коммит изменяет данные с одним из ее тегов.
+
+    Инвалидация увеличивает поколение тегов и запоминает свое время. Поколения
+    снимаются до запроса к БД (generation) и передаются в put: результат,
+    прочитанный до инвалидации, но записываемый после нее, отклоняется. Чтение
+    с реплики может не видеть коммит еще lag_window секунд после инвалидации,
+    поэтому в это время его результат тоже не кэшируется
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.statistics = CacheStatistics()
+
+    @abstractmethod
+    async def get(self, key: str) -> tuple[bool, Any]:
+        ...
+
+    @abstractmethod
+    async def generation(self, tags: set[str]) -> Optional[dict[str, int]]:
+        """Поколения тегов или None, если их не удалось получить (тогда результат не кэшируется)"""
+
+    @abstractmethod
+    async def put(self, key: str, value: Any, tags: set[str],
+                  generation: Optional[dict[str, int]] = None, lag_window: float = 0) -> None:
+        ...
+
+    @abstractmethod
+    async def invalidate(self, tags: set[str]) -> None:
+        ...
+
+    def is_stale(self, generation: Optional[dict[str, int]], current: dict[str, int],
+                 invalidated_at: list[float], lag_window: float, now: float) -> bool:
+        """
+        Проверка перед записью: поколение тегов изменилось или инвалидация была
+        в пределах отставания реплики
+        """
+        stale = ((generation is not None
+                  and any(current.get(tag, 0) != number for tag, number in generation.items()))
+                 or (lag_window > 0 and any(now - moment < lag_window for moment in invalidated_at)))
+        if stale:
+            self.statistics.rejected += 1
+        return stale
+
+    async def stats(self) -> dict:
+        return {"backend": type(self).__name__, "ttl": self.ttl, **self.statistics.to_dict()}
+
+    async def close(self) -> None:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    LRU-кэш в памяти процесса с временем жизни записей
+
+    Инвалидация видна только этому процессу: бэкенд допустим лишь при одном
+    процессе приложения (main.py запускает один воркер uvicorn). При нескольких
+    воркерах или экземплярах нужен общий кэш (CACHE_BACKEND=redis)
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any, set[str]]] = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        # тег -> (поколение, время последней инвалидации)
+        self._generations: dict[str, tuple[int, float]] = {}
+
+    async def get(self, key: str) -> tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.statistics.misses += 1
+            return False, None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.statistics.evictions += 1
+            self.statistics.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.statistics.hits += 1
+        return True, value
+
+    async def generation(self, tags: set[str]) -> dict[str, int]:
+        return {tag: self._generations.get(tag, (0, 0.0))[0] for tag in tags}
+
+    async def put(self, key: str, value: Any, tags: set[str],
+                  generation: Optional[dict[str, int]] = None, lag_window: float = 0) -> None:
+        now = time.monotonic()
+        # теги, по которым снято поколение (например, all для чтения по id), тоже проверяются
+        states = {tag: self._generations.get(tag, (0, float("-inf")))
+                  for tag in {*tags, *(generation or {})}}
+        if self.is_stale(generation, {tag: number for tag, (number, _) in states.items()},
+                         [moment for _, moment in states.values()], lag_window, now):
+            return
+        self._remove(key)
+        self._entries[key] = (now + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.statistics.evictions += 1
+
+    async def invalidate(self, tags: set[str]) -> None:
+        now = time.monotonic()
+        for tag in tags:
+            number, _ = self._generations.get(tag, (0, now))
+            self._generations[tag] = (number + 1, now)
+            for key in self._tags.pop(tag, set()):
+                if self._remove(key):
+                    self.statistics.invalidations += 1
+
+    async def stats(self) -> dict:
+        return {**await super().stats(), "entries": len(self._entries),
+                "max_entries": self.max_entries}
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Общий для всех процессов кэш в Redis
+
+    Теги хранятся множествами ключей, поколения тегов - хешами bookshelf:gen:<tag>
+    (время инвалидации - по часам процессов, time.time()). Значения кодируются
+    в JSON (encode_value); вытеснение выполняет сам Redis (maxmemory-policy),
+    его счетчики добавляются в статистику
+    """
+
+    # поколения живут дольше записей, чтобы пережить любое чтение в процессе
+    GENERATION_TTL = 24 * 60 * 60
+
+    def __init__(self, url: str, ttl: float, client: Any = None):
+        super().__init__(ttl)
+        try:
+            from redis import asyncio as redis
+            from redis.exceptions import WatchError
+        except ImportError as e:
+            raise RuntimeError("Для CACHE_BACKEND=redis необходим пакет redis") from e
+        self.client = client if client is not None else redis.from_url(url)
+        self.errors = redis.RedisError
+        self.watch_error = WatchError
+
+    async def get(self, key: str) -> tuple[bool, Any]:
+        try:
+            raw = await self.client.get(key)
+        except self.errors as e:
+            # недоступность кэша не должна ломать чтение: запрос уйдет в БД
+            logger.error(f"Ошибка чтения из Redis: {e}")
+            raw = None
+        if raw is not None:
+            try:
+                value = decode_value(raw)
+            except ValueError as e:
+                logger.error(f"Не удалось декодировать запись кэша {key}: {e}")
+                raw = None
+        if raw is None:
+            self.statistics.misses += 1
+            return False, None
+        self.statistics.hits += 1
+        return True, value
+
+    async def generation(self, tags: set[str]) -> Optional[dict[str, int]]:
+        tags = list(tags)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.hget(f"bookshelf:gen:{tag}", "generation")
+                numbers = await pipe.execute()
+        except self.errors as e:
+            logger.error(f"Ошибка чтения поколений из Redis: {e}")
+            return None
+        return {tag: int(number or 0) for tag, number in zip(tags, numbers)}
+
+    async def put(self, key: str, value: Any, tags: set[str],
+                  generation: Optional[dict[str, int]] = None, lag_window: float = 0) -> None:
+        ttl = max(int(self.ttl), 1)
+        checked = list({*tags, *(generation or {})})
+        generation_keys = [f"bookshelf:gen:{tag}" for tag in checked]
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                # запись выполняется, только если поколения не изменились после проверки
+                await pipe.watch(*generation_keys)
+                states = [await pipe.hmget(generation_key, "generation", "invalidated_at")
+                          for generation_key in generation_keys]
+                current = {tag: int(number or 0) for tag, (number, _) in zip(checked, states)}
+                moments = [float(moment) for _, moment in states if moment is not None]
+                if self.is_stale(generation, current, moments, lag_window, time.time()):
+                    await pipe.unwatch()
+                    return
+                pipe.multi()
+                pipe.set(key, encode_value(value), ex=ttl)
+                for tag in tags:
+                    pipe.sadd(f"bookshelf:tag:{tag}", key)
+                    pipe.expire(f"bookshelf:tag:{tag}", ttl)
+                await pipe.execute()
+        except self.watch_error:
+            # инвалидация между проверкой и записью
+            self.statistics.rejected += 1
+        except self.errors as e:
+            logger.error(f"Ошибка записи в Redis: {e}")
+
+    async def invalidate(self, tags: set[str]) -> None:
+        # сначала поколения: параллельные put с более ранним поколением будут отклонены
+        async with self.client.pipeline(transaction=True) as pipe:
+            for tag in tags:
+                pipe.hincrby(f"bookshelf:gen:{tag}", "generation", 1)
+                pipe.hset(f"bookshelf:gen:{tag}", "invalidated_at", time.time())
+                pipe.expire(f"bookshelf:gen:{tag}", self.GENERATION_TTL)
+            await pipe.execute()
+        tag_keys = [f"bookshelf:tag:{tag}" for tag in tags]
+        async with self.client.pipeline(transaction=False) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            members = await pipe.execute()
+        keys = {key for tag_members in members for key in tag_members}
+        if keys:
+            self.statistics.invalidations += await self.client.delete(*keys)
+        await self.client.delete(*tag_keys)
+
+    async def stats(self) -> dict:
+        status = await super().stats()
+        try:
+            info = await self.client.info("stats")
+        except self.errors as e:
+            logger.warning(f"Не удалось получить статистику Redis: {e}")
+            return status
+        return {**status,
+                "server_evicted_keys": info.get("evicted_keys", 0),
+                "server_expired_keys": info.get("expired_keys", 0)}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+cache: Optional[CacheBackend] = None
+
+
+def init_cache() -> Optional[CacheBackend]:
+    """
+    Создание кэша по настройке CACHE_BACKEND (memory, redis или none)
+    """
+    global cache
+    if cache is None:
+        match settings.CACHE_BACKEND:
+            case "memory":
+                if int(os.environ.get("WEB_CONCURRENCY", 1)) > 1:
+                    logger.warning("CACHE_BACKEND=memory не инвалидируется между воркерами: "
+                                   "при нескольких процессах используйте CACHE_BACKEND=redis")
+                cache = MemoryCacheBackend(settings.CACHE_TTL, settings.CACHE_MAX_ENTRIES)
+            case "redis":
+                cache = RedisCacheBackend(settings.CACHE_URL, settings.CACHE_TTL)
+            case _:
+                logger.info("Кэш запросов отключен")
+    return cache
+
+
+async def close_cache() -> None:
+    global cache
+    if cache is not None:
+        await cache.close()
+        cache = None
+
+
+def get_cache() -> Optional[CacheBackend]:
+    return cache
+
+
+def collect_changes(session, flush_context) -> None:
+    """
+    Обработчик after_flush: запоминает владельцев измененных объектов до коммита
+    """
+    pending = session.info.setdefault(PENDING_INVALIDATION, set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        pending.update(owner_ids(instance))
+
+
+async def invalidate_pending(session) -> None:
+    """
+    Инвалидация записей пользователей, чьи данные изменил закоммиченный flush
+    """
+    pending = session.info.pop(PENDING_INVALIDATION, None)
+    if pending is None or cache is None:
+        return
+    tags = {ALL_TAG, *(user_tag(user_id) for user_id in pending)}
+    try:
+        await cache.invalidate(tags)
+    except Exception as e:
+        logger.error(f"Ошибка инвалидации кэша: {e}")
+
+
+def discard_pending(session) -> None:
+    session.info.pop(PENDING_INVALIDATION, None)
+
+
+async def get_cache_status() -> dict:
+    if cache is None:
+        return {"backend": None}
+    return await cache.stats()
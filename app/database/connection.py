@@ -1,12 +1,18 @@
+import asyncio
+import itertools
+import time
 from collections.abc import AsyncGenerator, Callable
+from typing import Optional
 
 from fastapi import Depends
-from sqlalchemy import exc
+from sqlalchemy import event, exc, text
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from loguru import logger
 
@@ -14,23 +20,271 @@ from database import repository
 from database.base import Base
 from settings import settings
 
-factory_engine = create_async_engine(settings.DB_URL, echo=False)
-async_session_maker = async_sessionmaker(factory_engine,
-                                         expire_on_commit=False)
+
+class PoolStatistics:
+    """Счетчики выдачи соединений из одного пула"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.hold_time_total = 0.0
+        self.hold_time_max = 0.0
+
+    def record_wait(self, elapsed: float) -> None:
+        self.waits += 1
+        self.wait_time_total += elapsed
+        self.wait_time_max = max(self.wait_time_max, elapsed)
+
+    def record_hold(self, elapsed: float) -> None:
+        self.hold_time_total += elapsed
+        self.hold_time_max = max(self.hold_time_max, elapsed)
+
+    def to_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "wait_time_total": round(self.wait_time_total, 6),
+            "wait_time_max": round(self.wait_time_max, 6),
+            "hold_time_total": round(self.hold_time_total, 6),
+            "hold_time_max": round(self.hold_time_max, 6),
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, считающий ожидания свободного соединения
+
+    Ожиданием считается выдача соединения при занятых pool_size + max_overflow.
+    Перед checkout событий нет, поэтому время ожидания измеряется вокруг
+    публичного connect(); остальные счетчики - обработчики событий (instrument_pool).
+    Счетчики свои у каждого пула (основная БД, реплики, шарды)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statistics = PoolStatistics()
+
+    def recreate(self):
+        # dispose() движка заменяет пул новым: счетчики и обработчики событий переходят к нему
+        pool = super().recreate()
+        pool.statistics = self.statistics
+        return pool
+
+    def connect(self):
+        waited = self.checkedout() >= settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.statistics.timeouts += 1
+            raise
+        if waited:
+            self.statistics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def instrument_pool(pool: InstrumentedQueuePool) -> None:
+    """
+    Счетчики пула на публичных событиях: connect - новое соединение с СУБД,
+    checkout/checkin - выдача соединения и его возврат (время удержания)
+    """
+    statistics = pool.statistics
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        statistics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        statistics.checkouts += 1
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            statistics.record_hold(time.perf_counter() - started)
+
+
+engine: Optional[AsyncEngine] = None
+async_session_maker = async_sessionmaker(expire_on_commit=False)
+replica_router: Optional["ReplicaRouter"] = None
+
+REPLICATION_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def create_engine(url: str) -> AsyncEngine:
+    """
+    Создание движка с параметрами пула из настроек
+    """
+    cache_size = settings.DB_STATEMENT_CACHE_SIZE
+    engine_ = create_async_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            # кэш подготовленных выражений asyncpg и адаптера SQLAlchemy
+            "statement_cache_size": cache_size,
+            "prepared_statement_cache_size": cache_size,
+        },
+    )
+    instrument_pool(engine_.sync_engine.pool)
+    return engine_
+
+
+class ReplicaRouter:
+    """
+    Балансировка чтения по репликам (round-robin) с проверкой доступности и отставания
+
+    Реплика исключается, если недоступна или отстает больше DB_REPLICA_MAX_LAG секунд;
+    результат проверки кэшируется на DB_REPLICA_CHECK_INTERVAL секунд
+    """
+
+    def __init__(self, urls: list[str]):
+        self.urls = urls
+        self.engines = [create_engine(url) for url in urls]
+        self.session_makers = [
+            async_sessionmaker(replica_engine, expire_on_commit=False)
+            for replica_engine in self.engines
+        ]
+        self._order = itertools.cycle(range(len(urls)))
+        self._health: dict[int, tuple[float, bool]] = {}
+
+    async def replication_lag(self, index: int) -> float:
+        async with self.engines[index].connect() as connection:
+            return float((await connection.execute(REPLICATION_LAG_QUERY)).scalar_one())
+
+    async def is_healthy(self, index: int) -> bool:
+        checked_at, healthy = self._health.get(index, (float("-inf"), False))
+        if time.monotonic() - checked_at < settings.DB_REPLICA_CHECK_INTERVAL:
+            return healthy
+        try:
+            lag = await asyncio.wait_for(self.replication_lag(index),
+                                         settings.DB_REPLICA_CHECK_TIMEOUT)
+            healthy = lag <= settings.DB_REPLICA_MAX_LAG
+            if not healthy:
+                logger.warning(f"Реплика #{index} отстает на {lag:.1f} с, чтение с нее приостановлено")
+        except (OSError, asyncio.TimeoutError, exc.SQLAlchemyError) as e:
+            logger.warning(f"Реплика #{index} недоступна: {e}")
+            healthy = False
+        self._health[index] = (time.monotonic(), healthy)
+        return healthy
+
+    async def choose(self) -> Optional[async_sessionmaker]:
+        for _ in range(len(self.session_makers)):
+            index = next(self._order)
+            if await self.is_healthy(index):
+                return self.session_makers[index]
+        return None
+
+    async def dispose(self) -> None:
+        for replica_engine in self.engines:
+            await replica_engine.dispose()
+
+
+async def get_read_session_maker() -> async_sessionmaker:
+    """
+    Фабрика сессий для чтения: реплика по очереди или основная БД, если реплик нет
+    """
+    if replica_router is not None:
+        session_maker = await replica_router.choose()
+        if session_maker is not None:
+            return session_maker
+        logger.warning("Нет доступных реплик, чтение выполняется с основной БД")
+    return async_session_maker
+
+
+async def warmup_pool(engine_: AsyncEngine, connections: int) -> None:
+    """
+    Предварительное открытие соединений пула, чтобы первые запросы не ждали подключения
+    """
+    opened = await asyncio.gather(*(engine_.connect() for _ in range(connections)))
+    for connection in opened:
+        await connection.close()
+    logger.info(f"Пул соединений прогрет: {connections} соединений")
+
+
+async def init_engine() -> AsyncEngine:
+    """
+    Создание единственного на процесс движка (вызывается в lifespan приложения)
+    """
+    global engine, replica_router
+    if engine is None:
+        engine = create_engine(settings.DB_URL)
+        async_session_maker.configure(bind=engine)
+        if settings.DB_REPLICA_URLS:
+            replica_router = ReplicaRouter(settings.DB_REPLICA_URLS)
+        if settings.DB_POOL_WARMUP:
+            await warmup_pool(engine, settings.DB_POOL_SIZE)
+    return engine
+
+
+async def dispose_engine() -> None:
+    global engine, replica_router
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+    if replica_router is not None:
+        await replica_router.dispose()
+        replica_router = None
+
+
+def pool_status(engine_: AsyncEngine) -> dict:
+    """
+    Состояние одного пула: занятые/свободные соединения, переполнение и его счетчики
+    """
+    pool = engine_.pool
+    return {
+        # str(URL) скрывает пароль
+        "url": str(engine_.url),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        **pool.statistics.to_dict(),
+    }
+
+
+def get_pool_status(shards: list[AsyncEngine] = ()) -> dict:
+    """
+    Состояние пулов основной БД, реплик и шардов (shards) - каждого отдельно
+    """
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "primary": pool_status(engine) if engine is not None else None,
+        "replicas": [pool_status(replica_engine) for replica_engine in replica_router.engines]
+                    if replica_router is not None else [],
+        "shards": [pool_status(shard_engine) for shard_engine in shards],
+    }
 
 
 async def migrate_tables() -> None:
     logger.info("Starting to migrate")
-    engine = create_async_engine(settings.DB_URL, echo=False)
-    async with engine.begin() as conn:
+    engine_ = await init_engine()
+    async with engine_.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     logger.info("Done migrating")
 
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
-    engine = create_async_engine(settings.DB_URL, echo=True)
-    factory = async_sessionmaker(engine)
-    async with factory() as session:
+    async with async_session_maker() as session:
         try:
             yield session
             await session.commit()
@@ -0,0 +1,87 @@
+import asyncio
+from contextlib import nullcontext
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Mapping
+from typing import Any, Generic, Optional, TypeVar
+
+Key = TypeVar("Key", bound=Hashable)
+Value = TypeVar("Value")
+
+BatchFunction = Callable[[list[Key]], Awaitable[Mapping[Key, Value]]]
+
+
+class BatchLoader(Generic[Key, Value]):
+    """
+    Пакетная загрузка по ключам (по образцу DataLoader)
+
+    Ключи, запрошенные за один проход цикла событий, загружаются одним вызовом
+    batch_fn без повторов; результаты кэшируются до clear(). Ключ, которого нет
+    в результате batch_fn, разрешается в None.
+
+    Загрузчики одной сессии получают общий lock: пакеты выполняются по очереди,
+    так как AsyncSession не допускает параллельных операций
+    """
+
+    def __init__(self, batch_fn: Optional[BatchFunction] = None,
+                 lock: Optional[asyncio.Lock] = None):
+        self.batch_fn = batch_fn
+        self.lock = lock
+        self._futures: dict[Key, asyncio.Future] = {}
+        self._queue: list[tuple[Key, asyncio.Future]] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def load(self, key: Key) -> asyncio.Future:
+        future = self._futures.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[key] = future
+        if not self._queue:
+            # выборка откладывается до конца текущего прохода цикла событий,
+            # чтобы собрать ключи всех задач, запросивших их в этом проходе
+            loop.call_soon(self._schedule, loop)
+        self._queue.append((key, future))
+        return future
+
+    async def load_many(self, keys: Iterable[Key]) -> list[Optional[Value]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Key, value: Value) -> None:
+        """
+        Запись значения в кэш (например, только что созданного объекта)
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._futures[key] = future
+
+    def clear(self) -> None:
+        self._futures.clear()
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        batch, self._queue = self._queue, []
+        task = loop.create_task(self._dispatch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: list[tuple[Key, asyncio.Future]]) -> None:
+        try:
+            async with self.lock or nullcontext():
+                results = await self.batch_fn([key for key, _ in batch])
+        except Exception as e:
+            for key, future in batch:
+                # неудачная загрузка не кэшируется: следующий load повторит запрос
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch:
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+def values_key(values: Mapping[str, Any]) -> tuple:
+    """
+    Ключ загрузчика по набору значений полей (порядок полей не важен)
+    """
+    return tuple(sorted(values.items()))
@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any
+
+
+class CountMode(str, Enum):
+    """Подсчет общего числа строк выборки для заголовка X-Total-Count"""
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    NONE = "none"
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """
+    Кодирование курсора в непрозрачную строку
+
+    Args:
+        values: значения ключа сортировки (колонка сортировки и id)
+    """
+    payload = [_dump_value(value) for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, python_types: list[type]) -> list[Any]:
+    """
+    Декодирование курсора, полученного от клиента
+
+    Args:
+        cursor: строка курсора из запроса
+        python_types: python-типы колонок ключа сортировки
+
+    Raises:
+        ValueError: курсор поврежден или не соответствует ключу сортировки
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+    if not isinstance(payload, list) or len(payload) != len(python_types):
+        raise ValueError(f"Курсор не соответствует сортировке: {cursor}")
+    try:
+        return [
+            _load_value(value, python_type)
+            for value, python_type in zip(payload, python_types)
+        ]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Курсор не соответствует сортировке: {cursor}") from e
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.name
+    return value
+
+
+def _load_value(value: Any, python_type: type) -> Any:
+    if value is None:
+        return None
+    if issubclass(python_type, datetime):
+        return datetime.fromisoformat(value)
+    if issubclass(python_type, Enum):
+        return python_type[value]
+    return python_type(value)
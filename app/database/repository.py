@@ -1,28 +1,160 @@
+import asyncio
+from collections.abc import AsyncIterator, Mapping
 from typing import Generic, TypeVar, Any, Optional
-from datetime import datetime
+from datetime import date, datetime
 
 import asyncpg
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.exc import IntegrityError, NoResultFound
+from sqlalchemy.exc import IntegrityError, NoResultFound, DBAPIError
 from sqlalchemy import (
     select,
+    insert,
     update,
+    delete,
+    tuple_,
+    literal,
+    and_,
+    cast,
+    func,
+    exists,
+    inspect,
+    any_,
+    bindparam,
+    text,
+    UniqueConstraint,
     BinaryExpression,
+    Date,
 )
-from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.orm import selectinload, joinedload, aliased, with_loader_criteria
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import array, ARRAY, REGCONFIG, insert as pg_insert
 
 from database.base import Base
+from exceptions import UniqueConflict
+from database.pagination import encode_cursor, decode_cursor, CountMode
+from database.loader import BatchLoader, values_key
+from database.cache import (
+    CacheBackend,
+    ALL_TAG,
+    PENDING_INVALIDATION,
+    make_key,
+    snapshot,
+    owner_ids,
+    user_tag,
+)
 
 Model = TypeVar("Model", bound=Base)
 
+# ключ session.info: lock пакетных выборок загрузчиков сессии (см. BatchLoader)
+LOADER_LOCK = "loader_lock"
+
 
 class DatabaseRepository(Generic[Model]):
     """Repository for performing database queries."""
 
-    def __init__(self, model: type[Model], session: AsyncSession) -> None:
+    def __init__(self, model: type[Model], session: AsyncSession,
+                 cache: Optional[CacheBackend] = None,
+                 loaders: Optional[dict[str, BatchLoader]] = None,
+                 cache_lag: float = 0) -> None:
+        """
+        Args:
+            cache_lag: окно отставания сессии (чтение с реплики): результат не кэшируется,
+                если его теги инвалидированы за последние cache_lag секунд
+        """
         self.model = model
         self.session = session
+        self.cache = cache
+        self.cache_lag = cache_lag
+        self.loaders = loaders if loaders is not None else {}
+        self.by_id = self.loader("id", self.load_by_ids)
+        self.by_values = self.loader("values", self.load_by_values)
+
+    def loader(self, name: str, batch_fn) -> BatchLoader:
+        """
+        Загрузчик из общего словаря loaders (живет весь запрос, см. BookshelfUnitofWork)
+
+        Загрузчик переживает сессию при повторном входе в uow, поэтому его
+        выборка и общий для загрузчиков сессии lock каждый раз привязываются
+        к текущему репозиторию
+        """
+        loader = self.loaders.setdefault(name, BatchLoader())
+        loader.batch_fn = batch_fn
+        loader.lock = self.session.info.setdefault(LOADER_LOCK, asyncio.Lock())
+        return loader
+
+    async def load_by_ids(self, ids: list[int]) -> dict[int, Model]:
+        """
+        Выборка объектов по списку id одним запросом WHERE id = ANY(:ids)
+        """
+        ids_param = bindparam("ids", ids, type_=ARRAY(self.model.id.type))
+        query = select(self.model).where(self.model.id == any_(ids_param))
+        return {object_.id: object_ for object_ in await self.session.scalars(query)}
+
+    async def load_by_values(self, keys: list[tuple]) -> dict[tuple, Model]:
+        """
+        Выборка объектов по наборам значений полей (ключи values_key)
+
+        Один запрос на каждый набор полей: WHERE (поле1, поле2) IN (...)
+        """
+        groups: dict[tuple[str, ...], list[tuple]] = {}
+        for key in keys:
+            names = tuple(name for name, _ in key)
+            groups.setdefault(names, []).append(tuple(value for _, value in key))
+        objects = {}
+        for names, rows in groups.items():
+            columns = [getattr(self.model, name) for name in names]
+            query = select(self.model).where(tuple_(*columns).in_(rows))
+            for object_ in await self.session.scalars(query):
+                key = tuple((name, getattr(object_, name)) for name in names)
+                objects.setdefault(key, object_)
+        return objects
+
+    def lookup(self, values: dict) -> asyncio.Future:
+        """
+        Поиск объекта через загрузчики: по id, если он задан, иначе по всем полям values
+        """
+        if isinstance(values.get("id"), int):
+            return self.by_id.load(values["id"])
+        return self.by_values.load(values_key(values))
+
+    @property
+    def primary_key(self):
+        """
+        Колонка первичного ключа (id, у сводных таблиц - ключ владельца)
+        """
+        return inspect(self.model).primary_key[0]
+
+    def mark_changed(self, *user_ids: int) -> None:
+        """
+        Регистрация изменений, сделанных в обход ORM (UPDATE/DELETE/INSERT выражениями)
+
+        Записи кэша этих пользователей будут инвалидированы после коммита
+        """
+        self.session.info.setdefault(PENDING_INVALIDATION, set()).update(user_ids)
+
+    async def cache_lookup(self, key: str, tags: set[str]) -> tuple[bool, Any, Optional[dict]]:
+        """
+        Чтение из кэша; при промахе - поколения тегов, снятые до запроса к БД
+        """
+        found, value = await self.cache.get(key)
+        if found:
+            return True, value, None
+        return False, None, await self.cache.generation(tags)
+
+    async def cache_store(self, key: str, value: Any, tags: set[str],
+                          generation: Optional[dict]) -> None:
+        if generation is not None:
+            await self.cache.put(key, value, tags, generation, self.cache_lag)
+
+    def list_tags(self, filters: dict) -> set[str]:
+        """
+        Теги выборки: пользователь, если выборка ограничена его user_id, иначе all
+        """
+        user_id = filters.get("user_id") if hasattr(self.model, "user_id") else None
+        if user_id is None:
+            return {ALL_TAG}
+        return {user_tag(user_id)}
 
     async def create(
         self,
@@ -42,11 +174,290 @@ class DatabaseRepository(Generic[Model]):
             logger.warning(e)
             raise e
 
-    async def apply_filters(self, filters: dict, sort_params: dict):
-        logger.debug("Применение фильторв...")
+    async def create_many(
+        self,
+        values: list[dict],
+        chunk_size: int = 1000,
+    ) -> list[tuple[Optional[Model], Optional[str]]]:
+        """
+        Массовое создание объектов: один INSERT ... VALUES (...), (...) RETURNING на пачку
+
+        Каждая пачка выполняется в точке сохранения; если пачка не вставилась,
+        ее строки повторяются по одной, чтобы найти и описать ошибочные
+
+        Args:
+            values: данные объектов
+            chunk_size: количество строк в одном INSERT
+
+        Output:
+            Для каждой строки входа (в том же порядке): (объект, None) или (None, текст ошибки)
+        """
+        results = []
+        statement = insert(self.model).returning(self.model, sort_by_parameter_order=True)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            try:
+                async with self.session.begin_nested():
+                    instances = (await self.session.scalars(statement, chunk)).all()
+                results.extend((instance, None) for instance in instances)
+            except DBAPIError as e:
+                logger.warning(f"Пачка строк {start}-{start + len(chunk) - 1} не вставлена, вставка по одной: {e.orig}")
+                for row in chunk:
+                    try:
+                        async with self.session.begin_nested():
+                            instance = (await self.session.scalars(statement, [row])).one()
+                        results.append((instance, None))
+                    except DBAPIError as row_error:
+                        results.append((None, self.error_message(row_error)))
+        self.mark_changed(*{
+            owner
+            for instance, _ in results if instance is not None
+            for owner in owner_ids(instance)
+        })
+        return results
+
+    @staticmethod
+    def error_message(error: DBAPIError) -> str:
+        """
+        Текст ошибки СУБД без имени класса драйвера и деталей
+        """
+        original = error.orig.__cause__ or error.orig
+        return str(original).split("\n")[0]
+
+    async def existing_ids(self, ids: list[int]) -> set[int]:
+        """
+        Какие из переданных id существуют (один запрос на все id)
+        """
+        query = select(self.model.id).where(self.model.id.in_(set(ids)))
+        return set((await self.session.scalars(query)).all())
+
+    async def apply_filters(self, filters: dict, sort_params: dict,
+                            include: list[str] = (), fields: list[str] = ()):
+        """
+        Выборка по фильтрам
+
+        Если переданы fields, выбираются только эти колонки (плюс id и ключ
+        сортировки), а результат возвращается строками RowMapping без
+        построения ORM-объектов; связи include в этом режиме не загружаются
+        """
+        if self.cache is not None:
+            key = make_key(self.model, "apply_filters", filters, sort_params, include, fields)
+            found, rows, generation = await self.cache_lookup(key, self.list_tags(filters))
+            if found:
+                return rows
+        query = self.build_filter_query(filters, sort_params, fields)
+        if fields:
+            filtered_users = (await self.session.execute(query)).mappings().all()
+        else:
+            query = query.options(*self.load_options(include))
+            filtered_users = (await self.session.scalars(query)).all()
+        if self.cache is not None:
+            filtered_users = [snapshot(row) for row in filtered_users]
+            await self.cache_store(key, filtered_users, self.list_tags(filters), generation)
+        return filtered_users
+
+    async def paginate(self, filters: dict, sort_params: dict, include: list[str] = (),
+                       fields: list[str] = (), count: CountMode = CountMode.NONE) -> tuple[list, Optional[int]]:
+        """
+        Страница выборки (apply_filters) и общее число подходящих строк
+
+        Args:
+            count: exact - точное число в том же запросе (apply_filters_with_total),
+                estimated - оценка планировщика (estimate_count), none - без подсчета
+        """
+        match count:
+            case CountMode.EXACT:
+                return await self.apply_filters_with_total(filters, sort_params, include, fields)
+            case CountMode.ESTIMATED:
+                rows = await self.apply_filters(filters, sort_params, include, fields)
+                return rows, await self.estimate_count(filters)
+        return await self.apply_filters(filters, sort_params, include, fields), None
+
+    async def paginate_with_version(self, filters: dict, sort_params: dict, include: list[str] = (),
+                                    fields: list[str] = (), count: CountMode = CountMode.NONE
+                                    ) -> tuple[list, Optional[int], tuple[int, Optional[datetime]]]:
+        """
+        Страница выборки (paginate) вместе с ее версией (get_version) из одного источника
+
+        Версия для ETag читается в той же сессии сразу за страницей и кэшируется
+        вместе с ней одной записью, поэтому валидатор ответа всегда соответствует
+        его телу (а не, например, закэшированной странице и свежей версии)
+        """
+        if self.cache is not None:
+            key = make_key(self.model, "paginate_with_version", filters, sort_params, include, fields, count)
+            found, cached, generation = await self.cache_lookup(key, self.list_tags(filters))
+            if found:
+                return cached
+        cache, self.cache = self.cache, None
+        try:
+            rows, total_count = await self.paginate(filters, sort_params, include, fields, count)
+            version = await self.get_version(filters)
+        finally:
+            self.cache = cache
+        if self.cache is not None:
+            rows = [snapshot(row) for row in rows]
+            await self.cache_store(key, (rows, total_count, version), self.list_tags(filters), generation)
+        return rows, total_count, version
+
+    async def apply_filters_with_total(self, filters: dict, sort_params: dict,
+                                       include: list[str] = (), fields: list[str] = ()) -> tuple[list, int]:
+        """
+        Выборка по фильтрам вместе с точным числом подходящих строк в одном запросе
+
+        Число считается окном COUNT(*) OVER() до LIMIT/OFFSET; при пагинации курсором
+        окно видит только строки после курсора, поэтому число считается подзапросом
+        по тем же фильтрам
+        """
+        if self.cache is not None:
+            key = make_key(self.model, "apply_filters_with_total", filters, sort_params, include, fields)
+            found, cached, generation = await self.cache_lookup(key, self.list_tags(filters))
+            if found:
+                return cached
+        if sort_params.get("cursor"):
+            total = self.filter_query(
+                select(func.count()).select_from(self.model), filters).scalar_subquery()
+        else:
+            total = func.count().over()
+        query = self.build_filter_query(filters, sort_params, fields).add_columns(total.label("total_count"))
+        if fields:
+            result = (await self.session.execute(query)).mappings().all()
+            rows = [{key_: value for key_, value in row.items() if key_ != "total_count"} for row in result]
+            totals = [row["total_count"] for row in result]
+        else:
+            result = (await self.session.execute(query.options(*self.load_options(include)))).all()
+            rows = [row[0] for row in result]
+            totals = [row[1] for row in result]
+        if totals:
+            total_count = totals[0]
+        else:
+            # страница за пределами выборки: окну не на чем посчитать
+            total_count, _ = await self.get_version(filters)
+        if self.cache is not None:
+            rows = [snapshot(row) for row in rows]
+            await self.cache_store(key, (rows, total_count), self.list_tags(filters), generation)
+        return rows, total_count
+
+    async def estimate_count(self, filters: dict) -> int:
+        """
+        Оценка числа строк выборки по плану запроса (EXPLAIN) без ее выполнения
+
+        Подходит для выборок без фильтров и очень больших выборок, где COUNT(*)
+        читает всю таблицу или индекс
+        """
+        query = self.filter_query(select(self.model.id), filters)
+        compiled = query.compile(dialect=postgresql.dialect(),
+                                 compile_kwargs={"literal_binds": True})
+        plan = (await self.session.execute(
+            text(f"EXPLAIN (FORMAT JSON) {compiled}"))).scalar_one()
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def projection(self, fields: list[str], sort_params: dict) -> list:
+        """
+        Колонки выборки для режима fields: запрошенные поля, id и ключ сортировки
+        """
+        columns = [getattr(self.model, getattr(field, "value", field)) for field in fields]
+        columns += self.sort_columns(sort_params)
+        return list({column.key: column for column in columns}.values())
+
+    async def search(self, text_query: str, config: str, filters: dict,
+                     sort_params: dict, include: list[str] = ()) -> list[Model]:
+        """
+        Полнотекстовый поиск по колонке search_vector модели
+
+        Args:
+            text_query: поисковая строка в синтаксисе websearch_to_tsquery
+            config: конфигурация полнотекстового поиска PostgreSQL
+            filters: дополнительные фильтры (например, user_id)
+            sort_params: limit и offset страницы
+            include: связи, которые нужно загрузить
+
+        Output:
+            Объекты модели в порядке убывания ts_rank
+        """
+        return [object_ for object_, _ in await self.search_ranked(
+            text_query, config, filters, sort_params, include)]
+
+    async def search_ranked(self, text_query: str, config: str, filters: dict,
+                            sort_params: dict, include: list[str] = ()) -> list[tuple[Model, float]]:
+        """
+        Полнотекстовый поиск (см. search) вместе со значениями ts_rank
+        """
+        ts_query = func.websearch_to_tsquery(cast(config, REGCONFIG), text_query)
+        rank = func.ts_rank(self.model.search_vector, ts_query)
+        query = self.filter_query(select(self.model, rank), filters)
+        query = (query.where(self.model.search_vector.bool_op("@@")(ts_query))
+                 .order_by(rank.desc(), self.model.id.asc())
+                 .limit(sort_params.get("limit"))
+                 .offset(sort_params.get("limit") * sort_params.get("offset"))
+                 .options(*self.load_options(include)))
+        return [tuple(row) for row in await self.session.execute(query)]
+
+    def load_options(self, include: list[str], owner: Optional[int] = None) -> list:
+        """
+        Опции загрузки связей, запрошенных клиентом
+
+        По умолчанию связи моделей не загружаются (lazy="noload"):
+        коллекции подгружаются selectinload, ссылки на один объект - joinedload
+
+        Args:
+            owner: владелец загружаемых объектов, если известен: условие по user_id
+                добавляется и в запросы selectinload (соединение с секционированной
+                таблицей читает одну секцию вместо всех); в основном запросе оно
+                совпадает с owner_filter
+        """
+        relationships = inspect(self.model).relationships
+        options = []
+        for name in include:
+            name = getattr(name, "value", name)
+            relationship = relationships[name]
+            attribute = getattr(self.model, name)
+            if relationship.uselist:
+                options.append(selectinload(attribute))
+            else:
+                options.append(joinedload(attribute))
+        if options and self.owner_filter(owner):
+            options.append(with_loader_criteria(self.model, self.model.user_id == owner, include_aliases=True))
+        return options
+
+    def owner_filter(self, owner: Optional[int]) -> list:
+        """
+        Условие на владельца для поиска по id
+
+        user_id - ключ секционирования: без него запрос по id проверяет все секции таблицы
+        """
+        if owner is None or not hasattr(self.model, "user_id"):
+            return []
+        return [self.model.user_id == owner]
+
+    def build_filter_query(self, filters: dict, sort_params: dict,
+                           fields: list[str] = ()):
+        """
+        Построение запроса выборки по фильтрам, сортировке и пагинации
+
+        Используется apply_filters и командой index-advisor,
+        чтобы анализировались ровно те запросы, которые выполняет сервис
+        """
         limit = sort_params.get("limit")
         offset = sort_params.get("offset")
-        query = select(self.model)
+        cursor = sort_params.get("cursor")
+        if fields:
+            query = select(*self.projection(fields, sort_params))
+        else:
+            query = select(self.model)
+        query = self.filter_query(query, filters)
+        query = self.sort_items(query, sort_params)
+        if cursor:
+            query = self.seek_after(query, cursor, sort_params)
+            query = query.limit(limit)
+        else:
+            query = query.limit(limit).offset(limit*offset)
+        return query
+
+    def filter_query(self, query, filters: dict):
+        """
+        Применение фильтров к запросу по модели self.model
+        """
+        logger.debug("Применение фильторв...")
         for field, value in filters.items():
             logger.debug(f"Элемент фильтрации: {field}:{value}")
             if value is None:
@@ -65,6 +476,10 @@ class DatabaseRepository(Generic[Model]):
                 case "updated_to":
                     query = query.filter(self.model.updated_at <= value)
                     continue
+                case "tag_ids":
+                    query = query.filter(self.model.tags.any(
+                        inspect(self.model).relationships["tags"].mapper.class_.id.in_(value)))
+                    continue
             column = getattr(self.model, field, None)
             logger.debug(column)
             if column is not None:
@@ -72,27 +487,71 @@ class DatabaseRepository(Generic[Model]):
                     query = query.filter(column.ilike(f"%{value}%"))
                 else:
                     query = query.filter(column == value)
-        query = self.sort_items(query, sort_params)
-        query = query.limit(limit).offset(limit*offset)
-        filtered_users = (await self.session.scalars(query)).all()
-        return filtered_users
-    
+        return query
+
+    def sort_columns(self, sort_params: dict) -> list:
+        """
+        Ключ сортировки: колонка sort_by и id для однозначного порядка строк
+        """
+        sort_by = sort_params.get("sort_by")
+        # значение по умолчанию в PaginationAndSorting задано строкой, а не членом перечисления
+        sort_by = getattr(sort_by, "value", sort_by)
+        column = getattr(self.model, sort_by, None)
+        if column is None or sort_by == "id":
+            logger.warning(f"Поле {sort_by} не найдено в модели, используется сортировка по умолчанию (id)")
+            return [self.model.id]
+        return [column, self.model.id]
+
     def sort_items(self, query, sort_params: dict):
-        sort_by = sort_params.get("sort_by").value
         desc = sort_params.get("desc")
-        logger.debug(sort_by)
-        if hasattr(self.model, sort_by):
-            column = getattr(self.model, sort_by)
-            if desc:
-                query = query.order_by(column.desc())
-                logger.debug(query)
-            else:
-                query = query.order_by(column.asc())
+        columns = self.sort_columns(sort_params)
+        logger.debug(columns)
+        if desc:
+            query = query.order_by(*[column.desc() for column in columns])
         else:
-            logger.warning(f"Поле {sort_by} не найдено в модели, используется сортировка по умолчанию (id)")
-            query = query.order_by(self.model.id.asc())
+            query = query.order_by(*[column.asc() for column in columns])
         return query
-            
+
+    def seek_after(self, query, cursor: str, sort_params: dict):
+        """
+        Keyset-пагинация: продолжение выборки после строки, закодированной в курсоре
+
+        Args:
+            query: запрос с примененной сортировкой sort_items
+            cursor: курсор, выданный в X-Next-Cursor предыдущей страницы
+            sort_params: параметры сортировки запроса
+
+        Output:
+            Запрос с условием WHERE (sort_by, id) > (...) (или < при desc)
+        """
+        columns = self.sort_columns(sort_params)
+        values = decode_cursor(
+            cursor, [column.type.python_type for column in columns])
+        key = tuple_(*columns)
+        bound = tuple_(*[
+            literal(value, column.type)
+            for value, column in zip(values, columns)
+        ])
+        if sort_params.get("desc"):
+            return query.where(key < bound)
+        return query.where(key > bound)
+
+    def get_next_cursor(self, instances: list, sort_params: dict) -> Optional[str]:
+        """
+        Курсор следующей страницы или None, если страница последняя
+        """
+        if not instances or len(instances) < sort_params.get("limit"):
+            return None
+        return encode_cursor(self.sort_values(instances[-1], sort_params))
+
+    def sort_values(self, instance: Any, sort_params: dict) -> list:
+        """
+        Значения ключа сортировки (sort_columns) объекта или строки RowMapping
+        """
+        if isinstance(instance, Mapping):
+            return [instance[column.key] for column in self.sort_columns(sort_params)]
+        return [getattr(instance, column.key) for column in self.sort_columns(sort_params)]
+
     async def filter(
         self,
         *expressions: BinaryExpression,
@@ -108,49 +567,180 @@ class DatabaseRepository(Generic[Model]):
         values: dict,
         *filtering_expression: BinaryExpression,
     ) -> Model:
-        instance = self.model(**values)
-        object_ = (await self.session.scalars(
-            select(self.model).where(*filtering_expression))).one_or_none()
-        if object_ is None:
-            self.session.add(instance)
-            await self.session.commit()
-            object_ = (await self.session.scalars(
-                select(self.model).filter_by(**values))).one()
-        return object_
+        """
+        Получение объекта по фильтру или его создание одним INSERT ... SELECT ... WHERE NOT EXISTS
+
+        Фильтр не обязан совпадать с уникальным ключом, поэтому параллельные вызовы
+        защищены от дублей только уникальными ограничениями таблицы (ON CONFLICT DO NOTHING)
+        """
+        columns = [getattr(self.model, name) for name in values]
+        row = select(*(literal(value, column.type) for value, column in zip(values.values(), columns)))
+        query = (pg_insert(self.model)
+                 .from_select(list(values), row.where(~exists().where(*filtering_expression)))
+                 .on_conflict_do_nothing()
+                 .returning(self.model))
+        return await self.insert_or_select(query, select(self.model).where(*filtering_expression))
 
     async def get_by_id_or_none(
         self,
         id_: int,
+        include: list[str] = (),
+        owner: Optional[int] = None,
     ) -> Optional[Model]:
-        query = select(self.model).where(self.model.id == id_)
+        """
+        Args:
+            owner: ожидаемый владелец (user_id), если известен вызывающему:
+                объект другого владельца не возвращается
+        """
+        if self.cache is not None:
+            key = make_key(self.model, "get_by_id_or_none", id_, include, owner)
+            # владелец (тег записи) неизвестен до чтения: поколение снимается по all,
+            # который инвалидируется любым коммитом
+            found, object_, generation = await self.cache_lookup(key, {ALL_TAG})
+            if found:
+                return object_
+        query = (select(self.model).where(self.primary_key == id_, *self.owner_filter(owner))
+                 .options(*self.load_options(include, owner)))
         object_ = (await self.session.scalars(query)).one_or_none()
+        if self.cache is not None and object_ is not None:
+            tags = {user_tag(owner) for owner in owner_ids(object_)}
+            object_ = snapshot(object_)
+            await self.cache_store(key, object_, tags, generation)
         return object_
 
+    async def get_version(self, filters: dict) -> tuple[int, Optional[datetime]]:
+        """
+        Версия выборки для условных запросов: число строк и max(updated_at)
+
+        Агрегат по тем же фильтрам, что и apply_filters, без загрузки строк
+        """
+        query = select(func.count(), func.max(self.model.updated_at)).select_from(self.model)
+        query = self.filter_query(query, filters)
+        count, last_modified = (await self.session.execute(query)).one()
+        return count, last_modified
+
+    async def time_buckets(self, period: str, date_name: str, group_name: str, sum_name: str,
+                           equals: dict, date_from: Optional[date] = None,
+                           date_to: Optional[date] = None) -> list[tuple[date, Any, int]]:
+        """
+        Суммы колонки sum_name по периодам (date_trunc: day, week, month) и значениям group_name
+
+        Args:
+            equals: условия равенства по колонкам (например, {"user_id": 1})
+            date_from, date_to: границы по колонке date_name включительно
+        Output:
+            Строки (начало периода, значение группы, сумма) по возрастанию периода
+        """
+        if self.cache is not None:
+            key = make_key(self.model, "time_buckets", period, date_name, group_name,
+                           sum_name, equals, date_from, date_to)
+            found, rows, generation = await self.cache_lookup(key, self.list_tags(equals))
+            if found:
+                return rows
+        date_column = getattr(self.model, date_name)
+        group_column = getattr(self.model, group_name)
+        bucket = cast(func.date_trunc(period, date_column), Date).label("period")
+        query = (select(bucket, group_column, func.sum(getattr(self.model, sum_name)))
+                 .where(*(getattr(self.model, name) == value for name, value in equals.items()))
+                 .group_by(bucket, group_column)
+                 .order_by(bucket, group_column))
+        if date_from is not None:
+            query = query.where(date_column >= date_from)
+        if date_to is not None:
+            query = query.where(date_column <= date_to)
+        rows = [tuple(row) for row in await self.session.execute(query)]
+        if self.cache is not None:
+            await self.cache_store(key, rows, self.list_tags(equals), generation)
+        return rows
+
+    async def get_updated_at(self, id_: int, owner: Optional[int] = None) -> Optional[datetime]:
+        query = select(self.model.updated_at).where(self.model.id == id_, *self.owner_filter(owner))
+        return await self.session.scalar(query)
+
+    async def exists_by_id(self, id_: int, owner: Optional[int] = None) -> bool:
+        query = select(exists().where(self.model.id == id_, *self.owner_filter(owner)))
+        return await self.session.scalar(query)
+
     async def get_by_display_name_or_create(self, display_name: str, values: dict) -> Model:
-        instance = self.model(**values)
-        objects = await self.filter(self.model.display_name == display_name)
-        if not objects:
-            self.session.add(instance)
-            objects = await self.filter(self.model.display_name == display_name)
-        else:
+        """
+        Создание объекта с уникальным display_name
+
+        Raises:
+            ValueError: объект с таким display_name уже существует
+        """
+        query = (pg_insert(self.model)
+                 .values(**{**values, "display_name": display_name})
+                 .on_conflict_do_nothing(index_elements=[self.model.display_name])
+                 .returning(self.model))
+        object_ = (await self.session.scalars(query)).one_or_none()
+        if object_ is None:
             logger.exception("Объект уже существует...Пропуск")
             raise ValueError()
-        return objects[0]
+        self.mark_changed(*owner_ids(object_))
+        return object_
+
+    def unique_key(self, values: dict) -> Optional[list[str]]:
+        """
+        Первичный или уникальный ключ таблицы, все поля которого заданы в values
+
+        Ограничения и индексы таблицы хранятся в множествах: уникальные ключи
+        перебираются в порядке колонок таблицы, чтобы выбор не зависел от процесса
+        """
+        table = self.model.__table__
+        position = {column.name: index for index, column in enumerate(table.columns)}
+        unique = [list(constraint.columns) for constraint in table.constraints
+                  if isinstance(constraint, UniqueConstraint)]
+        unique += [list(index.columns) for index in table.indexes if index.unique]
+        keys = [list(table.primary_key.columns)]
+        keys += sorted(unique, key=lambda key: [position[column.name] for column in key])
+        for key in keys:
+            names = [column.name for column in key]
+            if names and all(values.get(name) is not None for name in names):
+                return names
+        return None
+
+    async def insert_or_select(self, query, fallback) -> Model:
+        """
+        Выполнение INSERT ... ON CONFLICT DO NOTHING RETURNING
+
+        При конфликте (объект уже есть или создан параллельной транзакцией)
+        возвращается результат fallback; конфликтующий INSERT ждет завершения
+        параллельной транзакции, поэтому fallback видит ее строку. Если fallback
+        ничего не нашел, конфликт был по другому уникальному ключу (409)
+        """
+        object_ = (await self.session.scalars(query)).one_or_none()
+        if object_ is None:
+            object_ = (await self.session.scalars(fallback)).one_or_none()
+            if object_ is None:
+                raise UniqueConflict()
+            return object_
+        self.mark_changed(*owner_ids(object_))
+        return object_
 
     async def get_or_create(self, values: dict) -> Model:
-        abstract_id = values.get("id")
-        if isinstance(abstract_id, int):
-            objects = await self.filter(self.model.id == abstract_id)
-        else:
-            objects = (await self.session.scalars(
-                select(self.model).filter_by(**values))).all()
-        if len(objects) == 0:
-            instance = self.model(**values)
-            self.session.add(instance)
-            await self.session.commit()
-            objects = (await self.session.scalars(
-                select(self.model).filter_by(**values))).all()
-        return objects[0]
+        """
+        Получение объекта по уникальному ключу из values или его создание
+
+        Один INSERT ... ON CONFLICT (ключ) DO NOTHING RETURNING и выборка только при конфликте;
+        без уникального ключа в values - поиск по всем полям и вставка. Нарушение другого
+        уникального ключа (например, display_name при поиске по email) - IntegrityError,
+        как у create. Коммит - за вызывающим
+        """
+        key = self.unique_key(values)
+        if key is None:
+            object_ = await self.get_or_none(values)
+            if object_ is None:
+                object_ = self.model(**values)
+                self.session.add(object_)
+                await self.session.flush()
+            return object_
+        # цель конфликта - искомый ключ: только по нему fallback гарантированно найдет строку
+        query = (pg_insert(self.model)
+                 .values(**values)
+                 .on_conflict_do_nothing(index_elements=key)
+                 .returning(self.model))
+        fallback = select(self.model).filter_by(**{name: values[name] for name in key})
+        return await self.insert_or_select(query, fallback)
 
     async def get_or_none(self, values: dict) -> Optional[Model]:
         objects = (await self.session.scalars(
@@ -159,28 +749,173 @@ class DatabaseRepository(Generic[Model]):
             return None
         return objects[0]
 
-    async def get_or_create_list(self, values: list) -> list[Model]:
-        return [await self.get_or_create(value) for value in values]
+    async def get_or_create_list(self, values: list[dict]) -> list[Model]:
+        """
+        Получение или создание объектов списком
 
-    async def get_by_id_or_none_list(self, values: list) -> list[Model]:
-        return [
-            await self.get_by_id_or_none(value.get("id")) for value in values
-        ]
+        Существующие объекты ищутся пакетно (см. lookup), недостающие создаются
+        одним flush; одинаковые значения создают один объект. Коммит - за вызывающим
+        """
+        objects = list(await asyncio.gather(*(self.lookup(value) for value in values)))
+        created: dict[tuple, Model] = {}
+        for index, value in enumerate(values):
+            if objects[index] is None:
+                key = values_key(value)
+                if key not in created:
+                    created[key] = self.model(**value)
+                    self.session.add(created[key])
+                objects[index] = created[key]
+        if created:
+            await self.session.flush()
+            for key, instance in created.items():
+                self.by_id.prime(instance.id, instance)
+                self.by_values.prime(key, instance)
+        return objects
+
+    async def get_by_id_or_none_list(self, values: list[dict]) -> list[Optional[Model]]:
+        return await self.by_id.load_many(value.get("id") for value in values)
+
+    async def stream(self, filters: dict, chunk_size: int = 1000) -> AsyncIterator[list[Model]]:
+        """
+        Потоковая выборка по фильтрам через серверный курсор
+
+        Строки читаются пачками по chunk_size (yield_per), в памяти находится
+        только текущая пачка, независимо от размера выборки
+        """
+        query = self.filter_query(select(self.model), filters).order_by(self.model.id)
+        result = await self.session.stream_scalars(
+            query.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions():
+            yield partition
+
+    def secondary_columns(self, relationship_name: str):
+        """
+        Таблица-связка отношения многие-ко-многим и ее колонки со стороны self.model и цели
+
+        Output:
+            (таблица-связка, целевая модель, пары (колонка self.model, колонка связки),
+            колонка связки со стороны цели); в парах есть id и, у секционированной
+            связки, ключ секционирования
+        """
+        relationship = inspect(self.model).relationships[relationship_name]
+        remote_column, secondary_remote = relationship.secondary_synchronize_pairs[0]
+        return (relationship.secondary, relationship.mapper.class_,
+                relationship.synchronize_pairs, secondary_remote)
+
+    async def link(self, relationship_name: str, ids: list[int], related_ids: list[int]) -> int:
+        """
+        Связывание каждого объекта ids с каждым объектом related_ids одним INSERT ... SELECT
+
+        Связываются только объекты одного владельца (user_id), существующие связи
+        пропускаются (ON CONFLICT DO NOTHING)
+
+        Output:
+            Количество созданных связей
+        """
+        secondary, target, local_pairs, secondary_remote = self.secondary_columns(relationship_name)
+        pairs = (select(*(column for column, _ in local_pairs), target.id)
+                 .join(target, target.user_id == self.model.user_id)
+                 .where(self.model.id.in_(ids), target.id.in_(related_ids)))
+        inserted = (pg_insert(secondary)
+                    .from_select([*(secondary_local for _, secondary_local in local_pairs), secondary_remote], pairs)
+                    .on_conflict_do_nothing()
+                    .returning(*(secondary_local for _, secondary_local in local_pairs))
+                    .cte("inserted"))
+        owners = (await self.session.scalars(
+            select(self.model.user_id).join(inserted, and_(*(
+                inserted.c[secondary_local.name] == column for column, secondary_local in local_pairs))))).all()
+        self.mark_changed(*owners)
+        return len(owners)
+
+    async def unlink(self, relationship_name: str, ids: list[int], related_ids: list[int]) -> int:
+        """
+        Удаление связей каждого объекта ids с каждым объектом related_ids одним DELETE ... USING
+
+        Output:
+            Количество удаленных связей
+        """
+        secondary, _, local_pairs, secondary_remote = self.secondary_columns(relationship_name)
+        secondary_ids = next(secondary_local for column, secondary_local in local_pairs if column.key == "id")
+        query = (delete(secondary)
+                 .where(*(secondary_local == column for column, secondary_local in local_pairs),
+                        secondary_ids.in_(ids),
+                        secondary_remote.in_(related_ids))
+                 .returning(self.model.user_id))
+        owners = (await self.session.scalars(query)).all()
+        self.mark_changed(*owners)
+        return len(owners)
 
     async def get_all(self) -> list[Model]:
         return (await self.session.scalars(select(self.model))).all()
 
+    async def update_returning(self, values: dict, *expressions: BinaryExpression,
+                               include: list[str] = (), owner: Optional[int] = None) -> Model:
+        """
+        Изменение единственной строки одним UPDATE ... SET ..., updated_at = now() WHERE ... RETURNING
+
+        Объект строится из возвращенной строки, связи загружаются только из include
+        (отдельным запросом). При смене владельца (user_id) прежний владелец
+        возвращается из самосоединения UPDATE ... FROM для инвалидации кэша
+
+        Args:
+            owner: текущий владелец строки, если известен: изменяется только строка
+                этого владельца (одна секция), самосоединение не нужно, если владелец не меняется
+
+        Raises:
+            NoResultFound: ни одна строка не подходит под expressions
+        """
+        query = (update(self.model)
+                 .where(*expressions, *self.owner_filter(owner))
+                 .values(**values, updated_at=func.now())
+                 .execution_options(populate_existing=True))
+        if "user_id" in values and values["user_id"] != owner:
+            previous = aliased(self.model)
+            query = query.where(previous.id == self.model.id)
+            if owner is not None:
+                query = query.where(previous.user_id == owner)
+            query = query.returning(self.model, previous.user_id)
+            object_, previous_owner = (await self.session.execute(query)).one()
+            self.mark_changed(*owner_ids(object_), previous_owner)
+        else:
+            object_ = (await self.session.scalars(query.returning(self.model))).one()
+            self.mark_changed(*owner_ids(object_))
+        if include:
+            # объект уже в identity map со связями noload: их нужно перезаписать
+            owner = getattr(object_, "user_id", None)
+            query = (select(self.model).where(self.model.id == object_.id, *self.owner_filter(owner))
+                     .options(*self.load_options(include, owner))
+                     .execution_options(populate_existing=True))
+            object_ = (await self.session.scalars(query)).one()
+        return object_
+
+    async def update_by_filters(self, values: dict, filters: dict) -> int:
+        """
+        Изменение всех строк выборки (фильтры filter_query) одним UPDATE ... WHERE
+
+        Владельцы измененных строк (и прежние владельцы при смене user_id)
+        возвращаются из того же запроса через CTE для инвалидации кэша
+
+        Output:
+            Количество измененных строк
+        """
+        owner = self.model.user_id if hasattr(self.model, "user_id") else self.model.id
+        query = self.filter_query(
+            update(self.model).values(**values, updated_at=func.now()), filters)
+        owners = [owner.label("owner")]
+        if "user_id" in values:
+            previous = aliased(self.model)
+            query = query.where(previous.id == self.model.id)
+            owners.append(previous.user_id.label("previous_owner"))
+        updated = query.returning(*owners).cte("updated")
+        rows = (await self.session.execute(
+            select(*updated.c, func.count()).group_by(*updated.c))).all()
+        self.mark_changed(*{owner_id for *owner_ids_, _ in rows
+                            for owner_id in owner_ids_ if owner_id is not None})
+        return sum(count for *_, count in rows)
+
     async def update_multiple_attrs(self, names: list[str], values: list[Any],
                                     *expressions: BinaryExpression) -> Model:
-        scalar_object = (await self.session.scalars(
-            select(self.model).where(*expressions))).one()
-        updated_at = datetime.now()
-        setattr(scalar_object, 'updated_at', updated_at)
-        await self.update_multiple_attrs_to_object(names=names,
-                                                   values=values,
-                                                   scalar_object=scalar_object)
-        
-        return scalar_object
+        return await self.update_returning(dict(zip(names, values)), *expressions)
 
     async def update_multiple_attrs_to_object(self, names: list[str],
                                               values: list[Any],
@@ -209,22 +944,11 @@ class DatabaseRepository(Generic[Model]):
         Output:
             ScalarResult это строка из таблицы self.model, представляет собой имененный объект
         """
-        instance = (await self.session.scalars(
-            select(self.model).where(*expressions))).one()
-        setattr(instance, name, array(value))
-        await self.session.flush()
-        return instance
+        return await self.update_returning({name: array(value)}, *expressions)
 
     async def update(self, name: str, value: Any, *expressions:
                      BinaryExpression) -> Model:
-        result = (await
-                  self.session.scalars(select(self.model).where(*expressions)
-                                       )).one()
-        setattr(
-            result, name, value
-        )  # нельзя так просто взять и изменить аттрибут (instance это не словарь, это scalar object)
-        await self.session.flush()
-        return result
+        return await self.update_returning({name: value}, *expressions)
 
     async def delete_instance_list(self, instances) -> None:
         for instance in instances:
@@ -236,12 +960,26 @@ class DatabaseRepository(Generic[Model]):
         await self.session.flush()
         return
 
-    async def delete(self, *expressions: BinaryExpression) -> None:
-        try:
-            result = (await self.session.scalars(
-                select(self.model).where(*expressions))).one()
-            await self.delete_instance(result)
-        except NoResultFound as e:
+    async def delete(self, *expressions: BinaryExpression, owner: Optional[int] = None) -> None:
+        """
+        Удаление одним DELETE ... RETURNING id
+
+        Зависимые строки (материалы и теги пользователя, связи с тегами) удаляет
+        СУБД по ON DELETE CASCADE, без загрузки объектов в сессию
+
+        Args:
+            owner: владелец удаляемых строк, если известен (см. owner_filter)
+
+        Raises:
+            NoResultFound: ни одна строка не подходит под expressions
+        """
+        owner_column = self.model.user_id if hasattr(self.model, "user_id") else self.model.id
+        query = (delete(self.model).where(*expressions, *self.owner_filter(owner))
+                 .returning(self.model.id, owner_column)
+                 .execution_options(synchronize_session=False))
+        deleted = (await self.session.execute(query)).all()
+        if not deleted:
             logger.error("Объекта на удаление не существует!")
             raise NoResultFound
+        self.mark_changed(*(owner_id for _, owner_id in deleted if owner_id is not None))
         return
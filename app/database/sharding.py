@@ -0,0 +1,404 @@
+import asyncio
+import heapq
+import zlib
+from collections.abc import AsyncIterator, Mapping
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Optional
+
+from loguru import logger
+from sqlalchemy import exists, inspect, select, text
+from sqlalchemy.exc import IntegrityError, NoResultFound
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from database.connection import create_engine
+from database.pagination import CountMode
+from database.repository import DatabaseRepository
+from exceptions import CrossShardMove
+from settings import settings
+
+# таблицы, id которых выдаются чередующимися последовательностями (id % N = номер шарда)
+SHARDED_SEQUENCES = ["users", "items", "tags"]
+
+
+class ShardMap:
+    """
+    Сопоставление пользователя шарду
+
+    Пользователь живет на шарде user_id % N, если он не перенесен явно
+    (DB_SHARD_MAP: {user_id: номер шарда}); все его материалы, теги и сводки
+    хранятся на том же шарде. Новый пользователь создается на шарде по хешу
+    display_name, поэтому уникальность имени проверяет ограничение одного шарда,
+    а чередующаяся последовательность выдает ему id, указывающий на этот шард
+    """
+
+    def __init__(self, shards: int, overrides: Optional[Mapping[int, int]] = None):
+        self.shards = shards
+        self.overrides = dict(overrides or {})
+        for user_id, shard in self.overrides.items():
+            if not 0 <= shard < shards:
+                raise ValueError(f"Пользователь {user_id} назначен несуществующему шарду {shard}")
+
+    def shard_for(self, user_id: int) -> int:
+        return self.overrides.get(user_id, user_id % self.shards)
+
+    def shard_for_name(self, display_name: str) -> int:
+        # crc32, а не hash(): значение не зависит от процесса (PYTHONHASHSEED)
+        return zlib.crc32(display_name.encode()) % self.shards
+
+
+shard_engines: list[AsyncEngine] = []
+shard_session_makers: list[async_sessionmaker] = []
+shard_map: Optional[ShardMap] = None
+
+
+async def init_shards(urls: Optional[list[str]] = None,
+                      overrides: Optional[Mapping[int, int]] = None) -> ShardMap:
+    """
+    Создание движков шардов (по умолчанию из DB_SHARD_URLS и DB_SHARD_MAP)
+    """
+    global shard_map
+    if shard_map is None:
+        urls = settings.DB_SHARD_URLS if urls is None else urls
+        for url in urls:
+            shard_engine = create_engine(url)
+            shard_engines.append(shard_engine)
+            shard_session_makers.append(async_sessionmaker(shard_engine, expire_on_commit=False))
+        shard_map = ShardMap(len(urls), settings.DB_SHARD_MAP if overrides is None else overrides)
+        logger.info(f"Шардирование по user_id: {len(urls)} шардов")
+    return shard_map
+
+
+async def dispose_shards() -> None:
+    global shard_map
+    for shard_engine in shard_engines:
+        await shard_engine.dispose()
+    shard_engines.clear()
+    shard_session_makers.clear()
+    shard_map = None
+
+
+def get_shard_map() -> Optional[ShardMap]:
+    return shard_map
+
+
+async def prepare_sequences() -> int:
+    """
+    Чередование последовательностей id: на шарде k из N выдаются id = k (mod N)
+
+    Следующий id выбирается больше существующих, поэтому команду можно
+    повторять. Пользователи, чей id указывает на другой шард (и которые не
+    перенесены через DB_SHARD_MAP), выводятся в лог
+
+    Output:
+        Количество таких пользователей
+    """
+    shards = len(shard_session_makers)
+    misplaced = 0
+    for index, session_maker in enumerate(shard_session_makers):
+        async with session_maker() as session:
+            for table in SHARDED_SEQUENCES:
+                last = await session.scalar(text(f"SELECT coalesce(max(id), 0) FROM {table}"))
+                start = last + 1 + (index - (last + 1)) % shards
+                await session.execute(text(
+                    f"ALTER SEQUENCE {table}_id_seq INCREMENT BY {shards}"))
+                await session.execute(text(
+                    f"SELECT setval('{table}_id_seq', {start}, false)"))
+            user_ids = (await session.scalars(text("SELECT id FROM users"))).all()
+            await session.commit()
+        wrong = [user_id for user_id in user_ids if shard_map.shard_for(user_id) != index]
+        if wrong:
+            logger.warning(f"Шард {index}: пользователей, принадлежащих другим шардам, - {len(wrong)} "
+                           f"(например, {wrong[:5]}); перенесите их или добавьте в DB_SHARD_MAP")
+        misplaced += len(wrong)
+    logger.success(f"Последовательности id {', '.join(SHARDED_SEQUENCES)} чередуются по {shards} шардам")
+    return misplaced
+
+
+def sort_key(values: list) -> tuple:
+    """
+    Ключ слияния строк шардов в порядке ORDER BY PostgreSQL
+
+    Перечисления сравниваются по порядку объявления (как тип enum в СУБД),
+    строки - по кодовым точкам (порядок сопоставления "C"/C.UTF-8 базы)
+    """
+    key = []
+    for value in values:
+        if isinstance(value, Enum):
+            value = list(type(value)).index(value)
+        # NULL в PostgreSQL больше любого значения
+        key.append((value is None, value if value is not None else 0))
+    return tuple(key)
+
+
+class ShardedRepository:
+    """
+    Репозиторий поверх шардов с методами DatabaseRepository, которые вызывают сервисы
+
+    Запросы с владельцем в фильтрах (user_id, у пользователей - id) выполняются
+    на его шарде; выборки без владельца выполняются на всех шардах параллельно,
+    страницы сливаются в общем порядке сортировки. Перенос объектов между
+    пользователями разных шардов не поддерживается (CrossShardMove)
+    """
+
+    def __init__(self, model: type, repositories: list[DatabaseRepository], shard_map_: ShardMap):
+        self.model = model
+        self.shards = repositories
+        self.shard_map = shard_map_
+        self.owner = "user_id" if "user_id" in inspect(model).column_attrs else "id"
+        # у пользователей и сводок первичный ключ - сам владелец
+        self.routes_by_id = inspect(model).primary_key[0].key == self.owner
+
+    def for_owner(self, owner_id: int) -> DatabaseRepository:
+        return self.shards[self.shard_map.shard_for(owner_id)]
+
+    def owner_shard(self, filters: Mapping) -> Optional[DatabaseRepository]:
+        owner_id = filters.get(self.owner)
+        return None if owner_id is None else self.for_owner(owner_id)
+
+    def shard_for_values(self, values: Mapping) -> int:
+        if values.get(self.owner) is not None:
+            return self.shard_map.shard_for(values[self.owner])
+        return self.shard_map.shard_for_name(values["display_name"])
+
+    async def gather(self, method: str, *args, shards: Optional[list] = None, **kwargs) -> list:
+        return await asyncio.gather(*(getattr(repository, method)(*args, **kwargs)
+                                      for repository in shards or self.shards))
+
+    async def gather_found(self, method: str, *args, **kwargs) -> list:
+        """
+        Вызов на всех шардах, NoResultFound шарда означает, что объекта на нем нет
+
+        Raises:
+            NoResultFound: объекта нет ни на одном шарде
+        """
+        results = await asyncio.gather(*(getattr(repository, method)(*args, **kwargs)
+                                         for repository in self.shards),
+                                       return_exceptions=True)
+        found = []
+        for result in results:
+            if isinstance(result, NoResultFound):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            found.append(result)
+        if not found:
+            raise NoResultFound
+        return found
+
+    async def first(self, method: str, *args, **kwargs) -> Any:
+        results = await self.gather(method, *args, **kwargs)
+        return next((result for result in results if result is not None), None)
+
+    def merge(self, pages: list[list], sort_params: dict) -> list:
+        """
+        Слияние отсортированных страниц шардов в общем порядке sort_columns
+        """
+        repository = self.shards[0]
+        return list(heapq.merge(
+            *pages,
+            key=lambda row: sort_key(repository.sort_values(row, sort_params)),
+            reverse=bool(sort_params.get("desc"))))
+
+    def window(self, sort_params: dict) -> tuple[dict, int, int]:
+        """
+        Параметры выборки на шарде и срез слитых строк для страницы sort_params
+
+        Со смещением каждый шард отдает все строки до конца страницы;
+        с курсором каждый шард продолжает после той же строки
+        """
+        limit = sort_params.get("limit")
+        if sort_params.get("cursor"):
+            return sort_params, 0, limit
+        start = limit * (sort_params.get("offset") or 0)
+        return {**sort_params, "limit": start + limit, "offset": 0}, start, start + limit
+
+    async def paginate(self, filters: dict, sort_params: dict, include: list[str] = (),
+                       fields: list[str] = (), count: CountMode = CountMode.NONE) -> tuple[list, Optional[int]]:
+        repository = self.owner_shard(filters)
+        if repository is not None:
+            return await repository.paginate(filters, sort_params, include, fields, count)
+        shard_params, start, stop = self.window(sort_params)
+        results = await self.gather("paginate", filters, shard_params, include, fields, count)
+        rows = self.merge([rows for rows, _ in results], sort_params)[start:stop]
+        totals = [total for _, total in results]
+        return rows, None if None in totals else sum(totals)
+
+    async def paginate_with_version(self, filters: dict, sort_params: dict, include: list[str] = (),
+                                    fields: list[str] = (), count: CountMode = CountMode.NONE
+                                    ) -> tuple[list, Optional[int], tuple[int, Optional[datetime]]]:
+        rows, total_count = await self.paginate(filters, sort_params, include, fields, count)
+        return rows, total_count, await self.get_version(filters)
+
+    async def apply_filters(self, filters: dict, sort_params: dict,
+                            include: list[str] = (), fields: list[str] = ()) -> list:
+        rows, _ = await self.paginate(filters, sort_params, include, fields)
+        return rows
+
+    def get_next_cursor(self, instances: list, sort_params: dict) -> Optional[str]:
+        return self.shards[0].get_next_cursor(instances, sort_params)
+
+    async def search(self, text_query: str, config: str, filters: dict,
+                     sort_params: dict, include: list[str] = ()) -> list:
+        repository = self.owner_shard(filters)
+        if repository is not None:
+            return await repository.search(text_query, config, filters, sort_params, include)
+        shard_params, start, stop = self.window(sort_params)
+        pages = await self.gather("search_ranked", text_query, config, filters, shard_params, include)
+        ranked = heapq.merge(*pages, key=lambda pair: (-pair[1], pair[0].id))
+        return [object_ for object_, _ in ranked][start:stop]
+
+    async def stream(self, filters: dict, chunk_size: int = 1000) -> AsyncIterator[list]:
+        # шарды выгружаются по очереди, порядок id соблюдается внутри шарда
+        repository = self.owner_shard(filters)
+        for shard in [repository] if repository is not None else self.shards:
+            async for partition in shard.stream(filters, chunk_size):
+                yield partition
+
+    async def get_version(self, filters: dict) -> tuple[int, Optional[datetime]]:
+        repository = self.owner_shard(filters)
+        if repository is not None:
+            return await repository.get_version(filters)
+        versions = await self.gather("get_version", filters)
+        modified = [last_modified for _, last_modified in versions if last_modified is not None]
+        return sum(count for count, _ in versions), max(modified, default=None)
+
+    async def time_buckets(self, period: str, date_name: str, group_name: str, sum_name: str,
+                           equals: dict, date_from: Optional[date] = None,
+                           date_to: Optional[date] = None) -> list[tuple[date, Any, int]]:
+        args = (period, date_name, group_name, sum_name, equals, date_from, date_to)
+        repository = self.owner_shard(equals)
+        if repository is not None:
+            return await repository.time_buckets(*args)
+        totals: dict[tuple, int] = {}
+        for rows in await self.gather("time_buckets", *args):
+            for bucket, group, total in rows:
+                totals[(bucket, group)] = totals.get((bucket, group), 0) + total
+        return [(bucket, group, total) for (bucket, group), total in sorted(totals.items())]
+
+    async def get_by_id_or_none(self, id_: int, include: list[str] = (), owner: Optional[int] = None) -> Any:
+        if self.routes_by_id:
+            return await self.for_owner(id_).get_by_id_or_none(id_, include)
+        if owner is not None:
+            return await self.for_owner(owner).get_by_id_or_none(id_, include, owner)
+        return await self.first("get_by_id_or_none", id_, include)
+
+    async def get_updated_at(self, id_: int, owner: Optional[int] = None) -> Optional[datetime]:
+        if self.routes_by_id:
+            return await self.for_owner(id_).get_updated_at(id_)
+        if owner is not None:
+            return await self.for_owner(owner).get_updated_at(id_, owner)
+        return await self.first("get_updated_at", id_)
+
+    async def exists_by_id(self, id_: int, owner: Optional[int] = None) -> bool:
+        if self.routes_by_id:
+            return await self.for_owner(id_).exists_by_id(id_)
+        if owner is not None:
+            return await self.for_owner(owner).exists_by_id(id_, owner)
+        return any(await self.gather("exists_by_id", id_))
+
+    async def existing_ids(self, ids: list[int]) -> set[int]:
+        if not self.routes_by_id:
+            return set().union(*await self.gather("existing_ids", ids))
+        groups: dict[int, list[int]] = {}
+        for id_ in ids:
+            groups.setdefault(self.shard_map.shard_for(id_), []).append(id_)
+        found = await asyncio.gather(*(self.shards[shard].existing_ids(shard_ids)
+                                       for shard, shard_ids in groups.items()))
+        return set().union(*found)
+
+    async def get_all(self) -> list:
+        return [object_ for objects in await self.gather("get_all") for object_ in objects]
+
+    async def create(self, values: dict) -> Any:
+        return await self.shards[self.shard_for_values(values)].create(values)
+
+    async def create_many(self, values: list[dict], chunk_size: int = 1000) -> list[tuple[Any, Optional[str]]]:
+        """
+        Массовое создание: строки группируются по шардам, результат - в порядке входа
+        """
+        groups: dict[int, list[int]] = {}
+        for index, row in enumerate(values):
+            groups.setdefault(self.shard_for_values(row), []).append(index)
+        shard_results = await asyncio.gather(*(
+            self.shards[shard].create_many([values[index] for index in indexes], chunk_size)
+            for shard, indexes in groups.items()))
+        results: list = [None] * len(values)
+        for indexes, shard_result in zip(groups.values(), shard_results):
+            for index, result in zip(indexes, shard_result):
+                results[index] = result
+        return results
+
+    async def get_by_display_name_or_create(self, display_name: str, values: dict) -> Any:
+        """
+        Создание пользователя на шарде по хешу display_name
+
+        Уникальность email между шардами проверяется запросом к остальным шардам
+        до вставки (не атомарно: одновременная регистрация одного email на разных
+        шардах не исключена)
+
+        Raises:
+            ValueError: пользователь с таким display_name уже существует
+            IntegrityError: email занят на другом шарде
+        """
+        shard = self.shard_map.shard_for_name(display_name)
+        email = values.get("email")
+        if email is not None:
+            others = [repository for index, repository in enumerate(self.shards) if index != shard]
+            taken = await asyncio.gather(*(
+                repository.session.scalar(select(exists().where(self.model.email == email)))
+                for repository in others))
+            if any(taken):
+                raise IntegrityError("email", {"email": email}, ValueError("email занят на другом шарде"))
+        return await self.shards[shard].get_by_display_name_or_create(display_name, values)
+
+    async def update_returning(self, values: dict, *expressions, include: list[str] = (),
+                               owner: Optional[int] = None) -> Any:
+        """
+        Изменение одной строки на шарде, где она есть
+
+        При смене владельца строка должна уже находиться на шарде нового владельца;
+        известный текущий владелец (owner) выбирает шард без опроса остальных
+
+        Raises:
+            NoResultFound: строки нет ни на одном шарде
+            CrossShardMove: новый владелец живет на другом шарде
+        """
+        if owner is not None and self.owner != "id" and values.get(self.owner) in (None, owner):
+            return await self.for_owner(owner).update_returning(values, *expressions, include=include, owner=owner)
+        if values.get(self.owner) is None or self.owner == "id":
+            found = await self.gather_found("update_returning", values, *expressions, include=include)
+            return found[0]
+        target = self.for_owner(values[self.owner])
+        try:
+            return await target.update_returning(values, *expressions, include=include)
+        except NoResultFound:
+            others = [repository for repository in self.shards if repository is not target]
+            matches = await asyncio.gather(*(
+                repository.session.scalar(select(exists().where(*expressions)))
+                for repository in others))
+            if any(matches):
+                raise CrossShardMove()
+            raise
+
+    async def update_by_filters(self, values: dict, filters: dict) -> int:
+        repository = self.owner_shard(filters)
+        shards = [repository] if repository is not None else self.shards
+        if values.get(self.owner) is not None:
+            target = self.for_owner(values[self.owner])
+            others = [shard for shard in shards if shard is not target]
+            if others and any(count for count, _ in await self.gather("get_version", filters, shards=others)):
+                raise CrossShardMove()
+        return sum(await self.gather("update_by_filters", values, filters, shards=shards))
+
+    async def link(self, relationship_name: str, ids: list[int], related_ids: list[int]) -> int:
+        # связываются объекты одного владельца, а значит одного шарда
+        return sum(await self.gather("link", relationship_name, ids, related_ids))
+
+    async def unlink(self, relationship_name: str, ids: list[int], related_ids: list[int]) -> int:
+        return sum(await self.gather("unlink", relationship_name, ids, related_ids))
+
+    async def delete(self, *expressions, owner: Optional[int] = None) -> None:
+        if owner is not None and self.owner != "id":
+            return await self.for_owner(owner).delete(*expressions, owner=owner)
+        await self.gather_found("delete", *expressions)
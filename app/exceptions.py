@@ -34,4 +34,38 @@ class AlreadyExists(ServiceExceptions):
 
     def __init__(self, status_code = status.HTTP_400_BAD_REQUEST, detail: str = "Объект не найден!"):
         super().__init__(status_code, detail)
-        raise HTTPException(status_code=self.status_code, detail=self.detail)
\ No newline at end of file
+        raise HTTPException(status_code=self.status_code, detail=self.detail)
+
+class InvalidCursor(ServiceExceptions):
+
+    def __init__(self, status_code = status.HTTP_400_BAD_REQUEST, detail: str = "Некорректный курсор пагинации!"):
+        super().__init__(status_code, detail)
+        raise HTTPException(status_code=self.status_code, detail=self.detail)
+
+
+class PreconditionFailed(ServiceExceptions):
+
+    def __init__(self, status_code = status.HTTP_412_PRECONDITION_FAILED, detail: str = "Объект был изменен другим запросом!"):
+        super().__init__(status_code, detail)
+        raise HTTPException(status_code=self.status_code, detail=self.detail)
+
+
+class TooManyRows(ServiceExceptions):
+
+    def __init__(self, status_code = status.HTTP_422_UNPROCESSABLE_ENTITY, detail: str = "Под условия подходит слишком много объектов!"):
+        super().__init__(status_code, detail)
+        raise HTTPException(status_code=self.status_code, detail=self.detail)
+
+
+class CrossShardMove(ServiceExceptions):
+
+    def __init__(self, status_code = status.HTTP_409_CONFLICT, detail: str = "Перенос материалов к пользователю другого шарда не поддерживается!"):
+        super().__init__(status_code, detail)
+        raise HTTPException(status_code=self.status_code, detail=self.detail)
+
+
+class UniqueConflict(ServiceExceptions):
+
+    def __init__(self, status_code = status.HTTP_409_CONFLICT, detail: str = "Объект конфликтует с существующим по уникальному ключу!"):
+        super().__init__(status_code, detail)
+        raise HTTPException(status_code=self.status_code, detail=self.detail)
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 from pathlib import Path
 from datetime import datetime
@@ -6,10 +7,15 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from loguru import logger
 import uvicorn
 
 from api.routers import routers as all_routers
+from commands import partitions
+from database.connection import init_engine, dispose_engine, get_pool_status
+from database.cache import init_cache, close_cache, get_cache_status
+from database.sharding import init_shards, dispose_shards, shard_engines
 from settings import settings
 
 sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
@@ -17,8 +23,18 @@ sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await init_engine()
+    init_cache()
+    if settings.DB_SHARD_URLS:
+        await init_shards()
+    await partitions.ensure_all()
+    # секции на следующие месяцы создаются и без перезапуска сервиса
+    maintenance = asyncio.create_task(partitions.maintain())
     yield
-    pass
+    maintenance.cancel()
+    await close_cache()
+    await dispose_shards()
+    await dispose_engine()
 
 
 app = FastAPI(title="Сервис управления письменными материалами пользователя",
@@ -40,6 +56,7 @@ app.add_middleware(CORSMiddleware,
                    allow_credentials=True,
                    allow_methods=["*"],
                    allow_headers=["*"])
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 for router in all_routers:
     app.include_router(router)
@@ -74,6 +91,14 @@ async def health_check():
         'status': "Ok",
     }
 
+@app.get('/health/pool', tags=['System'])
+async def pool_status():
+    return get_pool_status(shard_engines)
+
+@app.get('/health/cache', tags=['System'])
+async def cache_status():
+    return await get_cache_status()
+
 
 if __name__ == '__main__':
     uvicorn.run('main:app',
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
+
+from commands import benchmark, index_advisor, importer, partitions, stats
+from database.connection import init_engine, dispose_engine
+from database.sharding import init_shards, dispose_shards, prepare_sequences
+
+
+async def run_command(command):
+    await init_engine()
+    try:
+        return await command
+    finally:
+        await dispose_engine()
+
+
+async def prepare_shards() -> int:
+    await init_shards()
+    try:
+        return await prepare_sequences()
+    finally:
+        await dispose_shards()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Команды управления сервисом bookshelf")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    advisor = commands.add_parser(
+        "index-advisor",
+        help="EXPLAIN записанных комбинаций фильтров и сортировок, отчет о Seq Scan")
+    advisor.add_argument("--shapes", default=str(index_advisor.DEFAULT_SHAPES),
+                         help="JSON-файл с комбинациями фильтров и сортировок")
+    advisor.add_argument("--force-index", action="store_true",
+                         help="запретить Seq Scan: проверить, что для комбинации вообще есть пригодный индекс")
+
+    import_parser = commands.add_parser(
+        "import",
+        help="Потоковый импорт пользователей, материалов или тегов из CSV/NDJSON через COPY")
+    import_parser.add_argument("kind", choices=sorted(importer.IMPORT_SCHEMAS),
+                               help="что импортируется")
+    import_parser.add_argument("path", help="файл CSV (с заголовком) или NDJSON")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], default=None,
+                               help="формат файла (по умолчанию по расширению)")
+    import_parser.add_argument("--batch-size", type=int, default=5000,
+                               help="строк в одной пачке (транзакции)")
+    import_parser.add_argument("--job", default=None,
+                               help="имя задачи для контрольной точки (по умолчанию <kind>:<имя файла>)")
+    import_parser.add_argument("--restart", action="store_true",
+                               help="начать задачу заново, игнорируя контрольную точку")
+
+    commands.add_parser(
+        "rebuild-stats",
+        help="Пересчет сводки user_item_stats одним GROUP BY (восстановление после сбоев)")
+
+    partitions_parser = commands.add_parser(
+        "partitions",
+        help="Создание будущих секций item_events и отсоединение устаревших")
+    partitions_parser.add_argument("--ahead", type=int, default=None,
+                                   help="месяцев вперед (по умолчанию EVENTS_PARTITIONS_AHEAD)")
+    partitions_parser.add_argument("--retention", type=int, default=None,
+                                   help="срок хранения секций в месяцах (по умолчанию EVENTS_RETENTION_MONTHS)")
+    partitions_parser.add_argument("--drop", action="store_true",
+                                   help="удалять отсоединенные секции")
+
+    benchmark_parser = commands.add_parser(
+        "benchmark",
+        help="Замер выборки материалов пользователя и VACUUM items (до и после секционирования)")
+    benchmark_parser.add_argument("--users", type=int, default=200,
+                                  help="число случайных пользователей с материалами")
+    benchmark_parser.add_argument("--repeats", type=int, default=5,
+                                  help="повторов выборки на пользователя")
+    benchmark_parser.add_argument("--seed", type=int, default=0,
+                                  help="seed выбора пользователей (одинаковый для сравниваемых запусков)")
+
+    commands.add_parser(
+        "shards-prepare",
+        help="Чередование последовательностей id на шардах DB_SHARD_URLS (id %% N = номер шарда)")
+
+    args = parser.parse_args()
+    match args.command:
+        case "index-advisor":
+            failed = asyncio.run(run_command(
+                index_advisor.run(args.shapes, force_index=args.force_index)))
+            return 1 if failed else 0
+        case "import":
+            rejected = asyncio.run(run_command(importer.run(
+                args.kind, args.path, args.format, args.batch_size, args.job, args.restart)))
+            return 1 if rejected else 0
+        case "rebuild-stats":
+            asyncio.run(run_command(stats.rebuild()))
+        case "benchmark":
+            asyncio.run(run_command(benchmark.run(args.users, args.repeats, args.seed)))
+        case "partitions":
+            asyncio.run(run_command(partitions.run(args.ahead, args.retention, args.drop)))
+        case "shards-prepare":
+            misplaced = asyncio.run(run_command(prepare_shards()))
+            return 1 if misplaced else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,6 +24,26 @@ config.set_main_option("sqlalchemy.url",
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+def is_partition(name: str) -> bool:
+    # секции секционированных таблиц (items_pNN, item_events_YYYY_MM) создаются
+    # миграциями и командой manage.py partitions и не описываются моделями
+    return name not in target_metadata.tables and any(
+        name.startswith(f"{parent.name}_")
+        for parent in target_metadata.tables.values()
+        if parent.dialect_options["postgresql"]["partition_by"])
+
+
+def include_object(object_, name, type_, reflected, compare_to):
+    if not reflected or compare_to is not None:
+        return True
+    if type_ == "table":
+        return not is_partition(name)
+    if type_ == "foreign_key_constraint":
+        # копии внешнего ключа на каждую секцию таблицы, на которую он ссылается
+        return not is_partition(object_.referred_table.name)
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -46,6 +66,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -69,7 +90,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(connection=connection,
-                          target_metadata=target_metadata)
+                          target_metadata=target_metadata,
+                          include_object=include_object)
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,118 @@
+"""item events
+
+Revision ID: 1b33f6352f66
+Revises: e843ba86cbd1
+Create Date: 2026-10-18 16:32:31.940867
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b33f6352f66'
+down_revision: Union[str, None] = 'e843ba86cbd1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# секции на текущий и три следующих месяца, дальше их создает manage.py partitions
+PARTITIONS_AHEAD = 3
+
+# записываемые переходы: поле items -> строки событий из таблиц переходов триггера
+FIELDS = ("status", "priority")
+SOURCES = {
+    "INSERT": " UNION ALL ".join(
+        f"SELECT id, user_id, '{field}', NULL, {field}::text FROM new_rows"
+        for field in FIELDS),
+    "UPDATE": " UNION ALL ".join(
+        f"SELECT n.id, n.user_id, '{field}', o.{field}::text, n.{field}::text "
+        f"FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE n.{field} IS DISTINCT FROM o.{field}"
+        for field in FIELDS),
+}
+
+# события и дневная сводка пишутся одним выражением: сводка не расходится с журналом
+RECORD_EVENTS = (
+    "WITH events AS (INSERT INTO item_events (item_id, user_id, field, old_value, new_value) %s "
+    "RETURNING user_id, field, new_value, created_at) "
+    "INSERT INTO item_event_rollups AS rollups (user_id, day, field, value, transitions) "
+    "SELECT user_id, created_at::date, field, new_value, count(*) FROM events "
+    "WHERE user_id IS NOT NULL GROUP BY 1, 2, 3, 4 "
+    "ON CONFLICT (user_id, day, field, value) DO UPDATE "
+    "SET transitions = rollups.transitions + EXCLUDED.transitions, updated_at = now()"
+)
+
+RECORD_FUNCTION = f"""
+CREATE FUNCTION item_events_record() RETURNS trigger LANGUAGE plpgsql AS $function$
+BEGIN
+    EXECUTE format($sql${RECORD_EVENTS}$sql$, CASE TG_OP
+        WHEN 'INSERT' THEN $sql${SOURCES["INSERT"]}$sql$
+        ELSE $sql${SOURCES["UPDATE"]}$sql$
+    END);
+    RETURN NULL;
+END
+$function$
+"""
+
+TRIGGERS = [
+    "CREATE TRIGGER item_events_insert AFTER INSERT ON items "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION item_events_record()",
+    "CREATE TRIGGER item_events_update AFTER UPDATE ON items "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION item_events_record()",
+]
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('item_event_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('field', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=20), nullable=False),
+    sa.Column('transitions', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'field', 'value')
+    )
+    op.create_table('item_events',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('field', sa.String(length=20), nullable=False),
+    sa.Column('old_value', sa.String(length=20), nullable=True),
+    sa.Column('new_value', sa.String(length=20), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index('ix_item_events_item_id_created_at', 'item_events', ['item_id', 'created_at'], unique=False)
+    op.create_index('ix_item_events_user_id_created_at', 'item_events', ['user_id', 'created_at'], unique=False)
+    # ### end Alembic commands ###
+    current = date.today().replace(day=1)
+    for offset in range(PARTITIONS_AHEAD + 1):
+        month = add_months(current, offset)
+        op.execute(f"CREATE TABLE item_events_{month:%Y_%m} PARTITION OF item_events "
+                   f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')")
+    op.execute(RECORD_FUNCTION)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+
+
+def downgrade() -> None:
+    for name in ("insert", "update"):
+        op.execute(f"DROP TRIGGER item_events_{name} ON items")
+    op.execute("DROP FUNCTION item_events_record()")
+    # секции удаляются вместе с родительской таблицей
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_item_events_user_id_created_at', table_name='item_events')
+    op.drop_index('ix_item_events_item_id_created_at', table_name='item_events')
+    op.drop_table('item_events')
+    op.drop_table('item_event_rollups')
+    # ### end Alembic commands ###
@@ -0,0 +1,59 @@
+"""unlink tags on owner change
+
+Revision ID: 3d9f6b2c8e41
+Revises: 5a0c7e21d9b4
+Create Date: 2026-10-18 19:05:42.306117
+
+Связь материала с тегом хранит владельца материала (ключ секционирования).
+ON UPDATE CASCADE переносил связи к новому владельцу вместе с материалом,
+а теги оставались у прежнего: связи становились межпользовательскими.
+Теперь при смене владельца связи материала удаляет триггер до изменения
+строки, внешний ключ каскадно только удаляет
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9f6b2c8e41'
+down_revision: Union[str, None] = '5a0c7e21d9b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ITEMS = "items"
+LINKS = "items_tags_association_table"
+FOREIGN_KEY = f"{LINKS}_item_id_fkey"
+
+UNLINK_FUNCTION = f"""
+CREATE FUNCTION items_owner_unlink() RETURNS trigger LANGUAGE plpgsql AS $function$
+BEGIN
+    DELETE FROM {LINKS} WHERE item_id = OLD.id AND user_id = OLD.user_id;
+    RETURN NEW;
+END
+$function$
+"""
+
+UNLINK_TRIGGER = (
+    f"CREATE TRIGGER items_owner_unlink BEFORE UPDATE OF user_id ON {ITEMS} FOR EACH ROW "
+    "WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id) EXECUTE FUNCTION items_owner_unlink()"
+)
+
+
+def recreate_foreign_key(onupdate: Union[str, None]) -> None:
+    op.drop_constraint(FOREIGN_KEY, LINKS, type_="foreignkey")
+    op.create_foreign_key(FOREIGN_KEY, LINKS, ITEMS, ["item_id", "user_id"], ["id", "user_id"],
+                          ondelete="CASCADE", onupdate=onupdate)
+
+
+def upgrade() -> None:
+    op.execute(UNLINK_FUNCTION)
+    op.execute(UNLINK_TRIGGER)
+    recreate_foreign_key(None)
+
+
+def downgrade() -> None:
+    recreate_foreign_key("CASCADE")
+    op.execute(f"DROP TRIGGER items_owner_unlink ON {ITEMS}")
+    op.execute("DROP FUNCTION items_owner_unlink()")
@@ -0,0 +1,39 @@
+"""on delete cascade
+
+Revision ID: 5def57353c63
+Revises: bce71076fee4
+Create Date: 2026-10-18 16:25:13.866388
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5def57353c63'
+down_revision: Union[str, None] = 'bce71076fee4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# имена ограничений по соглашению PostgreSQL (как при создании таблиц)
+FOREIGN_KEYS = [
+    ('items_user_id_fkey', 'items', 'users', 'user_id'),
+    ('tags_user_id_fkey', 'tags', 'users', 'user_id'),
+    ('items_tags_association_table_item_id_fkey', 'items_tags_association_table', 'items', 'item_id'),
+    ('items_tags_association_table_tag_id_fkey', 'items_tags_association_table', 'tags', 'tag_id'),
+]
+
+
+def upgrade() -> None:
+    for name, table, referent, column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referent, [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    for name, table, referent, column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referent, [column], ['id'])
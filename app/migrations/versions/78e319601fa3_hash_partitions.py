@@ -0,0 +1,141 @@
+"""hash partitions
+
+Revision ID: 78e319601fa3
+Revises: 1b33f6352f66
+Create Date: 2026-10-18 16:37:27.214634
+
+Секционирование items и items_tags_association_table хешем по user_id.
+Таблицы пересоздаются с копированием строк (INSERT ... SELECT) в одной
+транзакции: на время миграции запись в них заблокирована
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '78e319601fa3'
+down_revision: Union[str, None] = '1b33f6352f66'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PARTITIONS = 16
+ITEMS = "items"
+LINKS = "items_tags_association_table"
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(notes, '')), 'B')"
+)
+ITEMS_COLUMNS = "id, user_id, title, kind, status, priority, notes, created_at, updated_at"
+
+ITEMS_INDEXES = {
+    "ix_items_user_id_title_id": "(user_id, title, id)",
+    "ix_items_user_id_created_at_id": "(user_id, created_at, id)",
+    "ix_items_user_id_updated_at_id": "(user_id, updated_at, id)",
+    "ix_items_user_id_status_id": "(user_id, status, id)",
+    "ix_items_user_id_priority_id": "(user_id, priority, id)",
+    "ix_items_user_id_status_priority_kind": "(user_id, status, priority, kind) INCLUDE (updated_at)",
+    "ix_items_title_id": "(title, id)",
+    "ix_items_created_at_id": "(created_at, id)",
+    "ix_items_updated_at_id": "(updated_at, id)",
+    "ix_items_search_vector": "USING gin (search_vector)",
+}
+
+# триггеры сводки user_item_stats и журнала item_events удаляются вместе со старой таблицей
+TRIGGERS = [
+    "CREATE TRIGGER user_item_stats_insert AFTER INSERT ON items "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_items()",
+    "CREATE TRIGGER user_item_stats_update AFTER UPDATE ON items "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_items()",
+    "CREATE TRIGGER user_item_stats_delete AFTER DELETE ON items "
+    "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_items()",
+    "CREATE TRIGGER item_events_insert AFTER INSERT ON items "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION item_events_record()",
+    "CREATE TRIGGER item_events_update AFTER UPDATE ON items "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION item_events_record()",
+]
+
+
+def create_partitions(table: str) -> None:
+    for remainder in range(PARTITIONS):
+        op.execute(f"CREATE TABLE {table}_p{remainder:02d} PARTITION OF {table} "
+                   f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})")
+
+
+def rebuild(partitioned: bool) -> None:
+    """
+    Пересоздание items и связки с тегами (секционированными или обычными) с копированием строк
+    """
+    partition_by = " PARTITION BY HASH (user_id)" if partitioned else ""
+    for table in (LINKS, ITEMS):
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    # последовательность id удалилась бы вместе со старой таблицей
+    op.execute("ALTER SEQUENCE items_id_seq OWNED BY NONE")
+
+    op.execute(f"""
+        CREATE TABLE {ITEMS} (
+            id integer NOT NULL DEFAULT nextval('items_id_seq'::regclass),
+            user_id integer{" NOT NULL" if partitioned else ""},
+            title varchar(100) NOT NULL,
+            kind kind NOT NULL,
+            status status NOT NULL,
+            priority priority NOT NULL,
+            notes text,
+            search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED,
+            created_at timestamp NOT NULL DEFAULT now(),
+            updated_at timestamp NOT NULL DEFAULT now()
+        ){partition_by}""")
+    if partitioned:
+        create_partitions(ITEMS)
+    op.execute(f"INSERT INTO {ITEMS} ({ITEMS_COLUMNS}) SELECT {ITEMS_COLUMNS} FROM {ITEMS}_old")
+
+    if partitioned:
+        # ключ секционирования денормализуется в связку: владелец материала
+        op.execute(f"CREATE TABLE {LINKS} (item_id integer NOT NULL, tag_id integer NOT NULL, "
+                   f"user_id integer NOT NULL){partition_by}")
+        create_partitions(LINKS)
+        op.execute(f"INSERT INTO {LINKS} (item_id, tag_id, user_id) "
+                   f"SELECT links.item_id, links.tag_id, items.user_id FROM {LINKS}_old AS links "
+                   f"JOIN {ITEMS}_old AS items ON items.id = links.item_id")
+    else:
+        op.execute(f"CREATE TABLE {LINKS} (item_id integer NOT NULL, tag_id integer NOT NULL)")
+        op.execute(f"INSERT INTO {LINKS} (item_id, tag_id) SELECT item_id, tag_id FROM {LINKS}_old")
+
+    op.execute(f"DROP TABLE {LINKS}_old")
+    op.execute(f"DROP TABLE {ITEMS}_old")
+    op.execute("ALTER SEQUENCE items_id_seq OWNED BY items.id")
+
+    key = ["id", "user_id"] if partitioned else ["id"]
+    op.create_primary_key("items_pkey", ITEMS, key)
+    op.create_foreign_key("items_user_id_fkey", ITEMS, "users", ["user_id"], ["id"], ondelete="CASCADE")
+    for name, definition in ITEMS_INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON {ITEMS} {definition}")
+
+    link_key = ["item_id", "user_id"] if partitioned else ["item_id"]
+    op.create_primary_key(f"{LINKS}_pkey", LINKS, ["item_id", "tag_id", "user_id"] if partitioned else ["item_id", "tag_id"])
+    op.create_foreign_key(f"{LINKS}_item_id_fkey", LINKS, ITEMS, link_key, key,
+                          ondelete="CASCADE", onupdate="CASCADE" if partitioned else None)
+    op.create_foreign_key(f"{LINKS}_tag_id_fkey", LINKS, "tags", ["tag_id"], ["id"], ondelete="CASCADE")
+    op.create_index(f"ix_{LINKS}_tag_id_item_id", LINKS, ["tag_id", "item_id"])
+
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    # статистика планировщика по новым таблицам (иначе до autovacuum он считает их пустыми)
+    op.execute(f"ANALYZE {ITEMS}")
+    op.execute(f"ANALYZE {LINKS}")
+
+
+def upgrade() -> None:
+    missing = op.get_bind().scalar(sa.text("SELECT count(*) FROM items WHERE user_id IS NULL"))
+    if missing:
+        raise RuntimeError(
+            f"Материалов без владельца: {missing}. user_id - ключ секционирования и не может быть пустым; "
+            "удалите или назначьте владельца этим материалам и повторите миграцию")
+    rebuild(partitioned=True)
+
+
+def downgrade() -> None:
+    rebuild(partitioned=False)
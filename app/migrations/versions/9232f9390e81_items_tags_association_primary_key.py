@@ -0,0 +1,50 @@
+"""items tags association primary key
+
+Revision ID: 9232f9390e81
+Revises: c79c7a868a17
+Create Date: 2026-10-18 16:18:49.390488
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9232f9390e81'
+down_revision: Union[str, None] = 'c79c7a868a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # строки без одной из ссылок бессмысленны, повторяющиеся пары остаются в одном экземпляре
+    op.execute("DELETE FROM items_tags_association_table WHERE item_id IS NULL OR tag_id IS NULL")
+    op.execute("""
+        DELETE FROM items_tags_association_table AS duplicate
+        USING items_tags_association_table AS kept
+        WHERE duplicate.item_id = kept.item_id
+          AND duplicate.tag_id = kept.tag_id
+          AND duplicate.ctid > kept.ctid
+    """)
+    op.alter_column('items_tags_association_table', 'item_id',
+               existing_type=sa.INTEGER(),
+               nullable=False)
+    op.alter_column('items_tags_association_table', 'tag_id',
+               existing_type=sa.INTEGER(),
+               nullable=False)
+    op.create_primary_key('items_tags_association_table_pkey', 'items_tags_association_table',
+                          ['item_id', 'tag_id'])
+    op.create_index('ix_items_tags_association_table_tag_id_item_id', 'items_tags_association_table', ['tag_id', 'item_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_items_tags_association_table_tag_id_item_id', table_name='items_tags_association_table')
+    op.drop_constraint('items_tags_association_table_pkey', 'items_tags_association_table', type_='primary')
+    op.alter_column('items_tags_association_table', 'tag_id',
+               existing_type=sa.INTEGER(),
+               nullable=True)
+    op.alter_column('items_tags_association_table', 'item_id',
+               existing_type=sa.INTEGER(),
+               nullable=True)
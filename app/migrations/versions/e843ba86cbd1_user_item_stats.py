@@ -0,0 +1,137 @@
+"""user item stats
+
+Revision ID: e843ba86cbd1
+Revises: 5def57353c63
+Create Date: 2026-10-18 16:29:36.564249
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e843ba86cbd1'
+down_revision: Union[str, None] = '5def57353c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# счетчики user_item_stats и условия по колонкам items (перечисления хранятся по именам)
+COUNTERS = {
+    "status_planned": "status = 'PLANNED'",
+    "status_reading": "status = 'READING'",
+    "status_done": "status = 'DONE'",
+    "priority_low": "priority = 'LOW'",
+    "priority_normal": "priority = 'NORMAL'",
+    "priority_high": "priority = 'HIGH'",
+    "kind_book": "kind = 'BOOK'",
+    "kind_article": "kind = 'ARTICLE'",
+}
+
+CHANGED = "(n.user_id, n.kind, n.status, n.priority) IS DISTINCT FROM (o.user_id, o.kind, o.status, o.priority)"
+
+# строки изменений с delta = +1/-1 из таблиц переходов триггера
+SOURCES = {
+    "INSERT": "SELECT user_id, kind, status, priority, 1 AS delta FROM new_rows",
+    "DELETE": "SELECT user_id, kind, status, priority, -1 AS delta FROM old_rows",
+    # учитываются только строки, у которых поменялись владелец или измерения
+    "UPDATE": (
+        "SELECT n.user_id, n.kind, n.status, n.priority, 1 AS delta "
+        f"FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE {CHANGED} "
+        "UNION ALL "
+        "SELECT o.user_id, o.kind, o.status, o.priority, -1 AS delta "
+        f"FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE {CHANGED}"
+    ),
+}
+
+APPLY_CHANGES = (
+    "UPDATE user_item_stats AS stats SET total = stats.total + changes.total, "
+    + ", ".join(f"{name} = stats.{name} + changes.{name}" for name in COUNTERS)
+    + ", updated_at = now() FROM (SELECT user_id, sum(delta) AS total, "
+    + ", ".join(f"coalesce(sum(delta) FILTER (WHERE {condition}), 0) AS {name}"
+                for name, condition in COUNTERS.items())
+    + " FROM (%s) AS rows GROUP BY user_id) AS changes WHERE stats.user_id = changes.user_id"
+)
+
+ITEMS_FUNCTION = f"""
+CREATE FUNCTION user_item_stats_items() RETURNS trigger LANGUAGE plpgsql AS $function$
+BEGIN
+    -- строка пользователя уже есть (триггер на users) или удалена каскадом вместе с ним
+    EXECUTE format($sql${APPLY_CHANGES}$sql$, CASE TG_OP
+        WHEN 'INSERT' THEN $sql${SOURCES["INSERT"]}$sql$
+        WHEN 'DELETE' THEN $sql${SOURCES["DELETE"]}$sql$
+        ELSE $sql${SOURCES["UPDATE"]}$sql$
+    END);
+    RETURN NULL;
+END
+$function$
+"""
+
+USERS_FUNCTION = """
+CREATE FUNCTION user_item_stats_users() RETURNS trigger LANGUAGE plpgsql AS $function$
+BEGIN
+    INSERT INTO user_item_stats (user_id) SELECT id FROM new_rows ON CONFLICT (user_id) DO NOTHING;
+    RETURN NULL;
+END
+$function$
+"""
+
+# триггеры на оператор: пачка (COPY, INSERT ... SELECT, массовый UPDATE, каскадное удаление)
+# обновляет каждую строку сводки один раз
+TRIGGERS = [
+    "CREATE TRIGGER user_item_stats_insert AFTER INSERT ON items "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_items()",
+    "CREATE TRIGGER user_item_stats_update AFTER UPDATE ON items "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_items()",
+    "CREATE TRIGGER user_item_stats_delete AFTER DELETE ON items "
+    "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_items()",
+    "CREATE TRIGGER user_item_stats_create AFTER INSERT ON users "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_item_stats_users()",
+]
+
+BACKFILL = (
+    f"INSERT INTO user_item_stats (user_id, total, {', '.join(COUNTERS)}) "
+    "SELECT users.id, count(items.id), "
+    + ", ".join(f"count(items.id) FILTER (WHERE items.{condition})" for condition in COUNTERS.values())
+    + " FROM users LEFT JOIN items ON items.user_id = users.id GROUP BY users.id"
+)
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('user_item_stats',
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('total', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('status_planned', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('status_reading', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('status_done', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('priority_low', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('priority_normal', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('priority_high', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('kind_book', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('kind_article', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # ### end Alembic commands ###
+    op.execute(ITEMS_FUNCTION)
+    op.execute(USERS_FUNCTION)
+    # триггеры создаются до заполнения: их блокировка не дает изменить items до коммита миграции
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER user_item_stats_create ON users")
+    for name in ("insert", "update", "delete"):
+        op.execute(f"DROP TRIGGER user_item_stats_{name} ON items")
+    op.execute("DROP FUNCTION user_item_stats_users()")
+    op.execute("DROP FUNCTION user_item_stats_items()")
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('user_item_stats')
+    # ### end Alembic commands ###
@@ -1,17 +1,19 @@
 import sys
 from pathlib import Path
+from typing import Optional
 
-from fastapi.responses import JSONResponse
-from fastapi import APIRouter, status, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, status, Depends, Query, Request, Header
 from loguru import logger
 
-from api.dependencies import UOWBookshelf
+from api.dependencies import UOWBookshelf, UOWBookshelfReadOnly, create_uow
+from api.conditional import list_etag, detail_etag, parse_if_match, validator_headers, is_not_modified, not_modified
 from modules.items_manager.service import ItemsService
-from modules.items_manager.schemas.responses import ItemResponse
-from modules.items_manager.schemas.requests import CreatePutItem, PatchItem
-from modules.items_manager.schemas.filters import ItemsFilter, PaginationAndSorting, item_filter_dependency
+from modules.items_manager.schemas.responses import ItemResponse, BulkItemsResponse, ItemTagLinksResponse, BulkPatchItemsResponse
+from modules.items_manager.schemas.requests import CreatePutItem, PatchItem, BulkCreateItems, ItemTagLinks, BulkPatchItems
+from modules.items_manager.schemas.filters import ItemsFilter, PaginationAndSorting, SearchPagination, ExportFormat, item_filter_dependency, ItemIncludeParams, item_include_dependency, ItemFields, item_fields_dependency
 
-from utils import validation
+from utils import serialize, serialize_rows
 
 sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
 
@@ -23,17 +25,121 @@ router = APIRouter(prefix="/api/v1",
 
 @router.get("/items", 
             tags=["Items"],
-            summary="Get items")
-async def get_items(uow: UOWBookshelf, filters: ItemsFilter = Depends(item_filter_dependency), sorting_params: PaginationAndSorting = Depends()) -> list[ItemResponse]:
-    instance = await ItemsService().get_items_by_filters(uow, filters, sorting_params)
-    return validation(ItemResponse, instance)
+            summary="Get items",
+            description="""
+Ответ содержит `ETag` и `Last-Modified` (по числу строк и max(updated_at) выборки);
+при совпадении `If-None-Match`/`If-Modified-Since` возвращается 304 без выборки строк.
+Для запросов с `include` условные заголовки не формируются.
+При `count=exact` (точно, в том же запросе) или `count=estimated` (оценка планировщика)
+общее число подходящих материалов возвращается в заголовке `X-Total-Count`.
+             """)
+async def get_items(request: Request, uow: UOWBookshelfReadOnly, filters: ItemsFilter = Depends(item_filter_dependency), sorting_params: PaginationAndSorting = Depends(), include: list[ItemIncludeParams] = Depends(item_include_dependency), fields: list[ItemFields] = Depends(item_fields_dependency)) -> list[ItemResponse]:
+    headers = {}
+    params = [filters.model_dump(), sorting_params.model_dump(), fields]
+    if not include:
+        count, last_modified = await ItemsService().get_items_version(uow, filters)
+        etag = list_etag(count, last_modified, params)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+    # валидаторы ответа строятся по версии, прочитанной вместе со страницей (в том числе из кэша)
+    instance, next_cursor, total_count, version = await ItemsService().get_items_by_filters(uow, filters, sorting_params, include, fields, with_version=not include)
+    if version is not None:
+        count, last_modified = version
+        headers.update(validator_headers(list_etag(count, last_modified, params), last_modified))
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if total_count is not None:
+        headers["X-Total-Count"] = str(total_count)
+    if fields:
+        return serialize_rows(instance, headers=headers)
+    return serialize(ItemResponse, instance, headers=headers)
+
+@router.get("/items/search", 
+            tags=["Items"],
+            summary="Full-text search items",
+            description="""
+Полнотекстовый поиск по названию и заметкам материалов пользователя.
+Результаты упорядочены по релевантности (`ts_rank`).
+             """)
+async def search_items(uow: UOWBookshelfReadOnly,
+                       q: str = Query(min_length=1, description="Поисковый запрос", examples=["война и мир"]),
+                       user_id: int = Query(description="ID пользователя", examples=[1]),
+                       pagination: SearchPagination = Depends(),
+                       include: list[ItemIncludeParams] = Depends(item_include_dependency)) -> list[ItemResponse]:
+    instance = await ItemsService().search_items(uow, q, user_id, pagination, include)
+    return serialize(ItemResponse, instance)
+
+@router.post("/items/bulk", 
+             tags=["Items"],
+             summary="Bulk create items",
+             description="""
+Массовое создание материалов (до `BULK_MAX_ROWS` строк за запрос).
+Ответ содержит результат по каждой строке. При `atomic=true` и ошибке хотя бы
+в одной строке не создается ни один материал, ответ возвращается с кодом 422.
+             """)
+async def create_items_bulk(bulk_data: BulkCreateItems, uow: UOWBookshelf) -> BulkItemsResponse:
+    result = await ItemsService().add_items_bulk(uow, bulk_data)
+    status_code = status.HTTP_200_OK
+    if bulk_data.atomic and result.failed:
+        status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    return serialize(BulkItemsResponse, result, status_code=status_code)
+
+@router.post("/items/tags/attach", 
+             tags=["Items"],
+             summary="Attach tags to items",
+             description="""
+Привязка каждого тега из `tag_ids` к каждому материалу из `item_ids` одним запросом.
+Связываются только материалы и теги одного пользователя, существующие связи пропускаются.
+             """)
+async def attach_tags(links: ItemTagLinks, uow: UOWBookshelf) -> ItemTagLinksResponse:
+    result = await ItemsService().attach_tags(uow, links)
+    return serialize(ItemTagLinksResponse, result)
+
+@router.post("/items/tags/detach", 
+             tags=["Items"],
+             summary="Detach tags from items",
+             description="""
+Удаление связей каждого тега из `tag_ids` с каждым материалом из `item_ids` одним запросом.
+             """)
+async def detach_tags(links: ItemTagLinks, uow: UOWBookshelf) -> ItemTagLinksResponse:
+    result = await ItemsService().detach_tags(uow, links)
+    return serialize(ItemTagLinksResponse, result)
+
+@router.get("/items/export", 
+            tags=["Items"],
+            summary="Export items",
+            description="""
+Потоковая выгрузка материалов по фильтрам в NDJSON или CSV (упорядочено по id).
+Строки читаются серверным курсором и отдаются по мере чтения, ответ сжимается
+gzip при `Accept-Encoding: gzip`.
+             """)
+async def export_items(filters: ItemsFilter = Depends(item_filter_dependency), format: ExportFormat = Query(ExportFormat.NDJSON, description="Формат выгрузки")) -> StreamingResponse:
+    media_type = "text/csv" if format == ExportFormat.CSV else "application/x-ndjson"
+    # тело читается после выхода из эндпоинта, когда транзакция запроса (UOWBookshelfReadOnly)
+    # уже завершена и соединение возвращено в пул: у выгрузки своя read-only единица работы,
+    # сессию которой открывает и закрывает генератор
+    return StreamingResponse(
+        ItemsService().export_items(create_uow(read_only=True), filters, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="items.{format.value}"'})
 
 @router.get("/items/{id}", 
             tags=["Items"],
-            summary="Get items by id")
-async def get_user_by_id(id: int, uow: UOWBookshelf) -> ItemResponse:
-    instance = await ItemsService().get_user_by_id(id, uow)
-    return instance
+            summary="Get items by id",
+            description="""
+С `user_id` (владелец материала) поиск читает одну секцию таблицы материалов
+вместо всех; материал другого владельца не найден (404).
+             """)
+async def get_user_by_id(request: Request, id: int, uow: UOWBookshelfReadOnly, include: list[ItemIncludeParams] = Depends(item_include_dependency), user_id: Optional[int] = Query(None, description="ID владельца материала", examples=[1])) -> ItemResponse:
+    if include:
+        instance = await ItemsService().get_user_by_id(id, uow, include, user_id)
+        return serialize(ItemResponse, instance)
+    updated_at = await ItemsService().get_updated_at(id, uow, user_id)
+    etag = detail_etag(id, updated_at)
+    if is_not_modified(request, etag, updated_at):
+        return not_modified(etag, updated_at)
+    instance = await ItemsService().get_user_by_id(id, uow, include, user_id)
+    return serialize(ItemResponse, instance, headers=validator_headers(detail_etag(id, instance.updated_at), instance.updated_at))
 
 @router.post("/items", 
              tags=["Items"],
@@ -42,22 +148,38 @@ async def get_user_by_id(id: int, uow: UOWBookshelf) -> ItemResponse:
              """)
 async def create_item(item: CreatePutItem, uow: UOWBookshelf) -> ItemResponse:
     instance = await ItemsService().add_item(uow, item)
-    return instance
+    return serialize(ItemResponse, instance)
 
 @router.delete("/items/{id}", 
                tags=["Items"],
                summary="Delete item by id",
                 description="""
+С `user_id` (владелец материала) удаление читает одну секцию таблицы материалов.
              """)
-async def delete_user(id: int, uow: UOWBookshelf) -> JSONResponse:
-    await ItemsService().delete_item(uow, id)
+async def delete_user(id: int, uow: UOWBookshelf, user_id: Optional[int] = Query(None, description="ID владельца материала", examples=[1])) -> JSONResponse:
+    await ItemsService().delete_item(uow, id, user_id)
     return JSONResponse("Материал успешно удален!", status_code=status.HTTP_200_OK)
 
+@router.patch("/items", 
+               tags=["Items"],
+               summary="Bulk patch items by filters",
+                description="""
+Изменение всех материалов, подходящих под `filters`, одним запросом в одной транзакции.
+`dry_run=true` только возвращает количество подходящих материалов; при `max_rows`
+и большем числе подходящих материалов ничего не изменяется (422).
+             """)
+async def patch_items(bulk_data: BulkPatchItems, uow: UOWBookshelf) -> BulkPatchItemsResponse:
+    result = await ItemsService().update_items_by_filters(uow, bulk_data)
+    return serialize(BulkPatchItemsResponse, result)
+
 @router.patch("/items/{id}", 
                tags=["Items"],
                summary="Patch item by id",
                 description="""
+С заголовком `If-Match` (ETag из GET /items/{id}) изменение применяется, только если
+материал не менялся с момента получения ETag, иначе возвращается 412.
+`user_id` в теле сначала ищется как текущий владелец (одна секция таблицы материалов).
              """)
-async def patch_user(id: int,  uow: UOWBookshelf, update_data: PatchItem) -> ItemResponse:
-    result = await ItemsService().update_item(uow, id, update_data)
-    return result
+async def patch_user(id: int,  uow: UOWBookshelf, update_data: PatchItem, if_match: Optional[str] = Header(None), include: list[ItemIncludeParams] = Depends(item_include_dependency)) -> ItemResponse:
+    result = await ItemsService().update_item(uow, id, update_data, parse_if_match(if_match, id), include)
+    return serialize(ItemResponse, result, headers=validator_headers(detail_etag(id, result.updated_at), result.updated_at))
@@ -6,6 +6,8 @@ from fastapi import Query
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 
 from modules.items_manager.schemas.units import Kind, Status, Priority
+from database.pagination import CountMode
+from utils import parse_comma_separated
 
 
 class ItemSortingParams(str, Enum):
@@ -15,7 +17,29 @@ class ItemSortingParams(str, Enum):
     TITLE = "title"
     PRIORITY = "priority"
     
+class ItemFields(str, Enum):
+    ID = "id"
+    USER_ID = "user_id"
+    TITLE = "title"
+    KIND = "kind"
+    STATUS = "status"
+    PRIORITY = "priority"
+    NOTES = "notes"
+    CREATED_AT = "created_at"
+    UPDATED_AT = "updated_at"
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class ItemIncludeParams(str, Enum):
+    USER = "user"
+    TAGS = "tags"
+
 class ItemsFilter(BaseModel):
+    user_id: Optional[int] = Field(
+        description="ID пользователя", default=None
+    )
     kind: Optional[Kind] = Field(
         description="Вид материала", default=None
     )
@@ -47,8 +71,12 @@ class ItemsFilter(BaseModel):
         description="Дата и время обновления", 
         examples=[datetime.now()]
     )
+    tag_ids: Optional[list[int]] = Field(
+        description="ID тегов (материалы хотя бы с одним из них)", default=None, examples=[[1, 2]]
+    )
 
 def item_filter_dependency(
+    user_id: Optional[int] = Query(None, description="ID пользователя", examples=[1]),
     kind: Optional[str] = Query(None, description="Вид материала", examples=[Kind.ARTICLE.value]),
     status: Optional[str] = Query(None, description="Отображаемое имя", examples= [Status.PLANNED.value]),
     priority: Optional[str] = Query(None, description="Отображаемое имя", examples=[Priority.NORMAL.value]),
@@ -60,6 +88,7 @@ def item_filter_dependency(
     updated_to: Optional[datetime] = Query(None, description="Обновлен до"),
 ) -> ItemsFilter:
     return ItemsFilter(
+        user_id=user_id,
         kind=kind,
         status=status,
         priority=priority,
@@ -76,11 +105,37 @@ class PaginationAndSorting(BaseModel):
     offset: Optional[int] = Query(
         description="Смещение контекстного окна", ge=0, default=0
     )
+    cursor: Optional[str] = Query(
+        description="Курсор следующей страницы из заголовка X-Next-Cursor (если передан, offset игнорируется)",
+        default=None
+    )
     sort_by: Optional[ItemSortingParams] = Query(
         description="", default=ItemSortingParams.TITLE.value
     )
     desc: Optional[bool] = Query(
         default=False
     )
+    count: CountMode = Query(
+        description="Общее число строк в X-Total-Count: exact - точно, estimated - оценка планировщика", default=CountMode.NONE
+    )
 
-    
+
+class SearchPagination(BaseModel):
+    limit: Optional[int] = Query(
+        description="По сколько показывать записей", ge=1, le=100, default=20
+    )
+    offset: Optional[int] = Query(
+        description="Смещение контекстного окна", ge=0, default=0
+    )
+
+
+def item_include_dependency(
+    include: Optional[str] = Query(None, description="Связанные объекты через запятую", examples=["user,tags"]),
+) -> list[ItemIncludeParams]:
+    return parse_comma_separated(include, ItemIncludeParams)
+
+
+def item_fields_dependency(
+    fields: Optional[str] = Query(None, description="Возвращаемые поля через запятую (id и поле сортировки возвращаются всегда)", examples=["id,title"]),
+) -> list[ItemFields]:
+    return parse_comma_separated(fields, ItemFields)
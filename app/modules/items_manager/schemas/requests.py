@@ -1,25 +1,27 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, field_validator
 
 from modules.items_manager.schemas.units import Kind, Status, Priority
+from modules.items_manager.schemas.filters import ItemsFilter
+from settings import settings
 
 class CreatePutItem(BaseModel):
     user_id: Optional[int] = Field(
         description="ID пользователя", examples=[1, 2]
     )
     kind: Kind = Field(
-        description="Вид материала", default=Kind.ARTICLE.value
+        description="Вид материала", default=Kind.ARTICLE
     )
     status: Status = Field(
-        description="Статус материала", default=Status.PLANNED.value
+        description="Статус материала", default=Status.PLANNED
     )
     title: str = Field(
         description="Название материала"
     )
     priority: Priority = Field(
-        description="Приоритет материала", default=Priority.NORMAL.value
+        description="Приоритет материала", default=Priority.NORMAL
     )
     notes: Optional[str] = Field(
         description="Приоритет материала", default=""
@@ -27,7 +29,7 @@ class CreatePutItem(BaseModel):
     
 class PatchItem(BaseModel):
     user_id: Optional[int] = Field(
-        description="ID пользователя", examples=[1, 2]
+        description="ID пользователя", examples=[1, 2], default=None
     )
     kind: Optional[Kind] = Field(
         description="Вид материала", default=None
@@ -40,4 +42,45 @@ class PatchItem(BaseModel):
     )
     notes: Optional[str] = Field(
         description="Приоритет материала", default=None
-    )
\ No newline at end of file
+    )
+
+    @field_validator("user_id", "kind", "status", "priority")
+    @classmethod
+    def not_null(cls, value):
+        # поле можно не передавать, но явный null нарушил бы NOT NULL колонки
+        if value is None:
+            raise ValueError("Поле не может быть null")
+        return value
+
+
+class BulkCreateItems(BaseModel):
+    items: list[CreatePutItem] = Field(
+        description="Создаваемые материалы", min_length=1, max_length=settings.BULK_MAX_ROWS
+    )
+    atomic: bool = Field(
+        description="Все или ничего: при ошибке в любой строке не создается ни один материал", default=False
+    )
+
+
+class ItemTagLinks(BaseModel):
+    item_ids: list[int] = Field(
+        description="ID материалов", examples=[[1, 2]], min_length=1, max_length=settings.BULK_MAX_ROWS
+    )
+    tag_ids: list[int] = Field(
+        description="ID тегов", examples=[[1, 2]], min_length=1, max_length=settings.BULK_MAX_ROWS
+    )
+
+
+class BulkPatchItems(BaseModel):
+    filters: ItemsFilter = Field(
+        description="Условия выборки изменяемых материалов (хотя бы одно)"
+    )
+    changes: PatchItem = Field(
+        description="Изменяемые поля"
+    )
+    dry_run: bool = Field(
+        description="Только подсчитать материалы, которые будут изменены", default=False
+    )
+    max_rows: Optional[int] = Field(
+        description="Не изменять ничего, если под условия подходит больше материалов", default=None, ge=1
+    )
@@ -28,11 +28,11 @@ class ItemResponse(BaseModel):
         description="Приоритет материала", default=Priority.NORMAL.value
     )
     
-    user: User = Field(
-        description="Инфомрация о пользователе"
+    user: Optional[User] = Field(
+        default=None, description="Инфомрация о пользователе (include=user)"
     )
     tags: list[Tag] = Field(
-        description="Прикрепленные к материалу теги"
+        default=[], description="Прикрепленные к материалу теги (include=tags)"
     )
     
     notes: str = Field(
@@ -45,4 +45,46 @@ class ItemResponse(BaseModel):
         description="Дата и время обновления", examples=[datetime.now()]
     )
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class BulkItemResult(BaseModel):
+    index: int = Field(
+        description="Номер строки в запросе", examples=[0, 1]
+    )
+    success: bool = Field(
+        description="Материал создан"
+    )
+    item: Optional[ItemResponse] = Field(
+        default=None, description="Созданный материал"
+    )
+    error: Optional[str] = Field(
+        default=None, description="Причина ошибки"
+    )
+
+
+class BulkItemsResponse(BaseModel):
+    created: int = Field(
+        description="Количество созданных материалов"
+    )
+    failed: int = Field(
+        description="Количество строк с ошибкой"
+    )
+    results: list[BulkItemResult] = Field(
+        description="Результат по каждой строке запроса"
+    )
+
+
+class ItemTagLinksResponse(BaseModel):
+    affected: int = Field(
+        description="Количество созданных или удаленных связей материал-тег"
+    )
+
+
+class BulkPatchItemsResponse(BaseModel):
+    affected: int = Field(
+        description="Количество измененных материалов (при dry_run - подходящих под условия)"
+    )
+    dry_run: bool = Field(
+        description="Изменения не применялись"
+    )
@@ -1,14 +1,24 @@
+from datetime import datetime
+from collections.abc import AsyncIterator
+from typing import Optional
+
 from fastapi import HTTPException, status
 from loguru import logger
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import IntegrityError
 
 from unitofwork import AbstractUnitOfWork
-from modules.items_manager.schemas.requests import CreatePutItem, PatchItem
-from modules.items_manager.schemas.filters import ItemsFilter, PaginationAndSorting
-from modules.items_manager.schemas.responses import ItemResponse
+from modules.items_manager.schemas.requests import CreatePutItem, PatchItem, BulkCreateItems, ItemTagLinks, BulkPatchItems
+from modules.items_manager.schemas.filters import ItemsFilter, PaginationAndSorting, SearchPagination, ItemIncludeParams, ItemFields, ExportFormat
+from modules.models import SEARCH_CONFIG, Items
+from modules.items_manager.schemas.responses import ItemResponse, BulkItemResult, BulkItemsResponse, ItemTagLinksResponse, BulkPatchItemsResponse
+from settings import settings
+from utils import get_adapter, encode_csv_rows
 from api.dependencies import UOWBookshelf
-from exceptions import ResultNotFound, AlreadyExists
+from exceptions import ResultNotFound, AlreadyExists, InvalidCursor, PreconditionFailed, TooManyRows
+
+
+EXPORT_COLUMNS = ["id", "user_id", "title", "kind", "status", "priority", "notes", "created_at", "updated_at"]
 
 
 class ItemsService:
@@ -20,30 +30,117 @@ class ItemsService:
         async with uow:
             try:
                 users = await uow.items.get_all()
-                logger.success(
-                    "\n\tUsers: \n"
-                    f"\t {users}"
-                    )
+                logger.success(f"\n\tПолучено материалов: {len(users)}")
             except Exception as e:
                 logger.error(f"Ошибка в получении списка материалов: {e}")
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка материалов")
             return users
     
-    async def get_items_by_filters(self, uow: AbstractUnitOfWork, filters: ItemsFilter, sorting_params: PaginationAndSorting) -> list[ItemResponse]:
+    async def get_items_by_filters(self, uow: AbstractUnitOfWork, filters: ItemsFilter, sorting_params: PaginationAndSorting, include: list[ItemIncludeParams] = (), fields: list[ItemFields] = (), with_version: bool = False) -> tuple[list[ItemResponse], Optional[str], Optional[int], Optional[tuple[int, Optional[datetime]]]]:
+        """
+        Страница выборки, курсор следующей страницы и общее число строк
+
+        При with_version также версия выборки (число строк и max(updated_at)) для ETag,
+        прочитанная вместе со страницей (см. paginate_with_version), иначе None
+        """
         async with uow:
             try:
                 filters = filters.model_dump()
-                sort_by = sorting_params.model_dump()
-                filtered_users = await uow.items.apply_filters(filters, sort_by)
+                sort_by = sorting_params.model_dump(exclude={"count"})
+                version = None
+                if with_version:
+                    filtered_users, total_count, version = await uow.items.paginate_with_version(
+                        filters, sort_by, include, fields, sorting_params.count)
+                else:
+                    filtered_users, total_count = await uow.items.paginate(filters, sort_by, include, fields, sorting_params.count)
+                next_cursor = uow.items.get_next_cursor(filtered_users, sort_by)
+            except ValueError as e:
+                logger.error(f"Некорректный курсор пагинации: {e}")
+                raise InvalidCursor()
             except Exception as e:
                 logger.error(f"Ошибка в получении списка пользователей: {e}")
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка пользователей")
-            return filtered_users
+            return filtered_users, next_cursor, total_count, version
                 
-    async def get_user_by_id(self, id: int,  uow: AbstractUnitOfWork):
+    async def search_items(self, uow: AbstractUnitOfWork, text_query: str, user_id: int, pagination: SearchPagination, include: list[ItemIncludeParams] = ()) -> list[ItemResponse]:
+        async with uow:
+            try:
+                items = await uow.items.search(
+                    text_query,
+                    SEARCH_CONFIG,
+                    {"user_id": user_id},
+                    pagination.model_dump(),
+                    include
+                    )
+            except Exception as e:
+                logger.error(f"Ошибка при поиске материалов: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при поиске материалов")
+            return items
+                
+    async def get_items_version(self, uow: AbstractUnitOfWork, filters: ItemsFilter) -> tuple[int, Optional[datetime]]:
+        async with uow:
+            try:
+                return await uow.items.get_version(filters.model_dump())
+            except Exception as e:
+                logger.error(f"Ошибка при получении версии списка материалов: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка материалов")
+
+    async def get_updated_at(self, id: int, uow: AbstractUnitOfWork, user_id: Optional[int] = None) -> datetime:
         async with uow:
             try:
-                user = await uow.items.get_by_id_or_none(id)
+                updated_at = await uow.items.get_updated_at(id, user_id)
+                if updated_at is None:
+                    raise NoResultFound
+                return updated_at
+            except NoResultFound as e:
+                logger.error(f"Материала с id '{id}' не существует!")
+                raise ResultNotFound()
+            except Exception as e:
+                logger.error(f"Ошибка при получении версии объекта: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при получении объекта")
+
+    async def export_items(self, uow: AbstractUnitOfWork, filters: ItemsFilter, export_format: ExportFormat) -> AsyncIterator[bytes]:
+        """
+        Выгрузка материалов по фильтрам в NDJSON или CSV
+
+        Генератор владеет uow: соединение занято, пока клиент читает ответ,
+        строки кодируются пачками по мере чтения серверного курсора. uow не должен
+        быть единицей работы запроса (request_scope): генератор выполняется уже после
+        завершения ее транзакции
+        """
+        adapter = get_adapter(ItemResponse, False)
+        exclude = {"user", "tags"}
+        async with uow:
+            exported = 0
+            try:
+                if export_format == ExportFormat.CSV:
+                    yield encode_csv_rows([EXPORT_COLUMNS])
+                async for partition in uow.items.stream(filters.model_dump(), settings.EXPORT_CHUNK_SIZE):
+                    if export_format == ExportFormat.CSV:
+                        rows = [adapter.dump_python(adapter.validate_python(item, from_attributes=True),
+                                                    mode="json", exclude=exclude)
+                                for item in partition]
+                        yield encode_csv_rows([[row[column] for column in EXPORT_COLUMNS] for row in rows])
+                    else:
+                        yield b"".join(
+                            adapter.dump_json(adapter.validate_python(item, from_attributes=True),
+                                              exclude=exclude) + b"\n"
+                            for item in partition)
+                    exported += len(partition)
+            except Exception as e:
+                # заголовки уже отправлены: ошибку можно только залогировать и оборвать поток
+                logger.error(f"Ошибка при выгрузке материалов после {exported} строк: {e}")
+                raise
+            logger.success(f"Выгружено материалов: {exported}")
+
+    async def get_user_by_id(self, id: int,  uow: AbstractUnitOfWork, include: list[ItemIncludeParams] = (), user_id: Optional[int] = None):
+        """
+        Args:
+            user_id: владелец материала, если известен клиенту: поиск читает одну секцию items
+        """
+        async with uow:
+            try:
+                user = await uow.items.get_by_id_or_none(id, include, user_id)
                 if not user:
                     raise NoResultFound
                 return user
@@ -67,8 +164,7 @@ class ItemsService:
         async with uow:
             try:
                 user_id = data.get("user_id")
-                user = await uow.users.get_by_id_or_none(user_id)
-                if not user:
+                if not await uow.users.exists_by_id(user_id):
                     raise NoResultFound
                 item = await uow.items.create(
                     data
@@ -87,10 +183,122 @@ class ItemsService:
                 raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "Ошибка при валидации данных")
             return item
         
-    async def delete_item(self, uow: AbstractUnitOfWork, item_id: int):
+    async def add_items_bulk(self, uow: AbstractUnitOfWork, bulk_data: BulkCreateItems) -> BulkItemsResponse:
+        """
+        Массовое создание материалов
+
+        Существование пользователей проверяется одним запросом на все различные user_id,
+        материалы вставляются пачками (multi-row INSERT ... RETURNING)
+        """
+        rows = [item.model_dump() for item in bulk_data.items]
+        logger.info(f"\n\tМассовое создание материалов: {len(rows)} строк, atomic={bulk_data.atomic}")
+        errors: dict[int, str] = {}
         async with uow:
             try:
-                await uow.items.delete(uow.items.model.id == item_id)
+                existing_users = await uow.users.existing_ids([row["user_id"] for row in rows])
+                valid = []
+                for index, row in enumerate(rows):
+                    if row["user_id"] in existing_users:
+                        valid.append(index)
+                    else:
+                        errors[index] = f"Пользователь с id '{row['user_id']}' не существует"
+                created = await uow.items.create_many([rows[index] for index in valid],
+                                                      settings.BULK_CHUNK_SIZE)
+                items: dict[int, Items] = {}
+                for index, (item, error) in zip(valid, created):
+                    if item is None:
+                        errors[index] = error
+                    else:
+                        items[index] = item
+                if bulk_data.atomic and errors:
+                    await uow.rollback()
+                    items = {}
+                else:
+                    await uow.commit()
+            except Exception as e:
+                await uow.rollback()
+                logger.error(f"Ошибка при массовом создании материалов: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при массовом создании материалов")
+        logger.success(f"Создано материалов: {len(items)}, с ошибкой: {len(errors)}")
+        results = [
+            BulkItemResult(index=index, success=index in items,
+                           item=items.get(index), error=errors.get(index))
+            for index in range(len(rows))
+        ]
+        return BulkItemsResponse(created=len(items), failed=len(errors), results=results)
+
+    async def attach_tags(self, uow: AbstractUnitOfWork, links: ItemTagLinks) -> ItemTagLinksResponse:
+        """
+        Привязка тегов к материалам (каждый тег к каждому материалу того же пользователя)
+        """
+        async with uow:
+            try:
+                affected = await uow.items.link("tags", links.item_ids, links.tag_ids)
+                await uow.commit()
+            except Exception as e:
+                await uow.rollback()
+                logger.error(f"Ошибка при привязке тегов: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при привязке тегов")
+        logger.success(f"Создано связей материал-тег: {affected}")
+        return ItemTagLinksResponse(affected=affected)
+
+    async def detach_tags(self, uow: AbstractUnitOfWork, links: ItemTagLinks) -> ItemTagLinksResponse:
+        async with uow:
+            try:
+                affected = await uow.items.unlink("tags", links.item_ids, links.tag_ids)
+                await uow.commit()
+            except Exception as e:
+                await uow.rollback()
+                logger.error(f"Ошибка при отвязке тегов: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при отвязке тегов")
+        logger.success(f"Удалено связей материал-тег: {affected}")
+        return ItemTagLinksResponse(affected=affected)
+
+    async def update_items_by_filters(self, uow: AbstractUnitOfWork, bulk_data: BulkPatchItems) -> BulkPatchItemsResponse:
+        """
+        Изменение всех материалов, подходящих под фильтры, одним UPDATE в одной транзакции
+        """
+        filters = bulk_data.filters.model_dump()
+        if all(value is None for value in filters.values()):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Не задано ни одного условия выборки материалов")
+        changes = bulk_data.changes.model_dump(exclude_unset=True)
+        if not changes:
+            # иначе UPDATE изменил бы только updated_at всех подходящих материалов
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Не задано ни одного изменяемого поля")
+        async with uow:
+            try:
+                user_id = changes.get("user_id", None)
+                if user_id and not await uow.users.exists_by_id(user_id):
+                    raise NoResultFound
+                if bulk_data.dry_run or bulk_data.max_rows is not None:
+                    matched, _ = await uow.items.get_version(filters)
+                    if bulk_data.max_rows is not None and matched > bulk_data.max_rows:
+                        raise TooManyRows(detail=f"Под условия подходит {matched} материалов, допустимо не больше {bulk_data.max_rows}")
+                    if bulk_data.dry_run:
+                        return BulkPatchItemsResponse(affected=matched, dry_run=True)
+                affected = await uow.items.update_by_filters(changes, filters)
+                if bulk_data.max_rows is not None and affected > bulk_data.max_rows:
+                    # между подсчетом и изменением параллельно добавились подходящие материалы
+                    raise TooManyRows(detail=f"Под условия подходит {affected} материалов, допустимо не больше {bulk_data.max_rows}")
+                await uow.commit()
+            except HTTPException:
+                await uow.rollback()
+                raise
+            except NoResultFound as e:
+                await uow.rollback()
+                logger.error(f"Пользователя с id '{user_id}' не существует!")
+                raise ResultNotFound()
+            except Exception as e:
+                await uow.rollback()
+                logger.error(f"Ошибка при массовом изменении материалов: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при изменении материалов")
+        logger.success(f"Изменено материалов: {affected}")
+        return BulkPatchItemsResponse(affected=affected, dry_run=False)
+
+    async def delete_item(self, uow: AbstractUnitOfWork, item_id: int, user_id: Optional[int] = None):
+        async with uow:
+            try:
+                await uow.items.delete(uow.items.model.id == item_id, owner=user_id)
                 await uow.commit()
             except NoResultFound as e:
                 await uow.rollback()
@@ -103,23 +311,41 @@ class ItemsService:
                     )
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при удалении материала")
             
-    async def update_item(self, uow: AbstractUnitOfWork, item_id: int, update_data: PatchItem) -> ItemResponse:
+    async def update_item(self, uow: AbstractUnitOfWork, item_id: int, update_data: PatchItem, expected_versions: Optional[list[datetime]] = None, include: list[ItemIncludeParams] = ()) -> ItemResponse:
+        """
+        Args:
+            expected_versions: допустимые updated_at из If-Match; изменение применяется,
+                только если материал с тех пор не менялся
+            include: связи, загружаемые в ответ (по умолчанию не загружаются)
+        """
         async with uow:
             try:
                 update_data = update_data.model_dump(exclude_unset=True)
                 user_id = update_data.get("user_id", None)
                 if user_id:
-                    user = await uow.users.get_by_id_or_none(user_id)
-                    if not user:
+                    if not await uow.users.exists_by_id(user_id):
                         raise NoResultFound
-                names = update_data.keys()
-                values = update_data.values()
-                expression = (uow.items.model.id == item_id)
-                result = await uow.items.update_multiple_attrs(names, values, expression)
+                expressions = [uow.items.model.id == item_id]
+                if expected_versions is not None:
+                    expressions.append(uow.items.model.updated_at.in_(expected_versions))
+                try:
+                    # обычно user_id в теле - текущий владелец: изменение читает одну секцию;
+                    # иначе (перенос к другому владельцу) материал ищется во всех секциях
+                    result = await uow.items.update_returning(update_data, *expressions, include=include, owner=user_id)
+                except NoResultFound:
+                    if user_id is None:
+                        raise
+                    result = await uow.items.update_returning(update_data, *expressions, include=include)
                 await uow.commit()
                 return result
+            except HTTPException:
+                await uow.rollback()
+                raise
             except NoResultFound as e:
                 await uow.rollback()
+                if expected_versions is not None and await uow.items.exists_by_id(item_id):
+                    logger.error(f"Материал '{item_id}' изменен после получения ETag!")
+                    raise PreconditionFailed()
                 logger.error(f"Объект не найден!")
                 raise ResultNotFound()
             except IntegrityError as e:
@@ -4,17 +4,34 @@ from datetime import datetime
 from sqlalchemy.orm import (
     mapped_column, relationship, Mapped
 )
-from sqlalchemy import String, ForeignKey, Integer, Table, Text, Column, Enum, UniqueConstraint
+from sqlalchemy import String, ForeignKey, ForeignKeyConstraint, Integer, BigInteger, Table, Text, Column, Enum, UniqueConstraint, Index, Computed, Date
+from sqlalchemy.sql import func, and_
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from database.base import Base
 
 from modules.items_manager.schemas.units import Kind, Priority, Status
 
+# конфигурация полнотекстового поиска: русский стеммер, латиница обрабатывается english_stem
+SEARCH_CONFIG = "russian"
+
+# материалы и связи с тегами секционированы хешем по user_id: выборка пользователя
+# читает одну секцию, если в запросе есть условие на user_id (см. миграцию hash partitions)
+ITEMS_PARTITIONS = 16
 
 items_tags_association_table  = Table(
     "items_tags_association_table",
     Base.metadata,
-    Column("item_id", ForeignKey("items.id")),
-    Column("tag_id", ForeignKey("tags.id"))
+    Column("item_id", Integer, primary_key=True),
+    Column("tag_id", ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
+    # ключ секционирования (владелец материала) входит в первичный ключ
+    Column("user_id", Integer, primary_key=True),
+    # без ON UPDATE CASCADE: теги остаются у прежнего владельца, поэтому при смене
+    # владельца материала связи удаляет триггер items_owner_unlink (миграция 3d9f6b2c8e41)
+    ForeignKeyConstraint(["item_id", "user_id"], ["items.id", "items.user_id"],
+                         ondelete="CASCADE"),
+    # обратный поиск: материалы с тегом
+    Index("ix_items_tags_association_table_tag_id_item_id", "tag_id", "item_id"),
+    postgresql_partition_by="HASH (user_id)",
 )
 
 class Users(Base):
@@ -22,43 +39,177 @@ class Users(Base):
     id = mapped_column(Integer, primary_key= True, autoincrement=True)
     email = mapped_column(String(255), nullable=False, unique=True)
     display_name = mapped_column(String(50), nullable=False)
-    items: Mapped[list["Items"]] = relationship("Items", back_populates="user", cascade='save-update, merge, delete', lazy="selectin")
-    tags: Mapped[list["Tags"]] = relationship("Tags", back_populates="user", cascade='save-update, merge, delete', lazy="selectin")
+    # удаление каскадом выполняет СУБД (ON DELETE CASCADE), ORM не загружает связанные объекты
+    items: Mapped[list["Items"]] = relationship("Items", back_populates="user", cascade='save-update, merge, delete', passive_deletes=True, lazy="noload")
+    tags: Mapped[list["Tags"]] = relationship("Tags", back_populates="user", cascade='save-update, merge, delete', passive_deletes=True, lazy="noload")
+    __table_args__ = (
+        # цель ON CONFLICT в get_by_display_name_or_create
+        UniqueConstraint("display_name", name="unique_display_name"),
+        # ключи сортировки UserSortingParams + id для keyset-пагинации
+        Index("ix_users_display_name_id", "display_name", "id"),
+        Index("ix_users_email_id", "email", "id"),
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_updated_at_id", "updated_at", "id"),
+    )
 
 class Items(Base):
     __tablename__ = "items"
     id = mapped_column(Integer, primary_key= True, autoincrement=True)
-    user_id = mapped_column(Integer, ForeignKey("users.id"))
+    # ключ секционирования: входит в первичный ключ таблицы, но не в идентичность объекта
+    user_id = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, nullable=False)
     title = mapped_column(String(100), nullable=False)
     kind = mapped_column(Enum(Kind), nullable=False, default=Kind.ARTICLE.value)
     status = mapped_column(Enum(Status), nullable=False, default=Status.PLANNED.value)
     priority = mapped_column(Enum(Priority), nullable=False, default=Priority.NORMAL.value)
     notes = mapped_column(Text, default=" ")
+    search_vector = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(notes, '')), 'B')",
+            persisted=True
+        ),
+        deferred=True
+    )
     
     user: Mapped[Users] = relationship(
         "Users",
         back_populates="items",
-        lazy="selectin"
+        lazy="noload"
     )
     
-    tags: Mapped[list["Tags"]] = relationship(secondary=items_tags_association_table, back_populates="items", lazy="selectin")
+    tags: Mapped[list["Tags"]] = relationship(
+        secondary=items_tags_association_table,
+        # связь по (id, user_id): условие на ключ секционирования отсекает секции связки
+        primaryjoin=lambda: and_(Items.id == items_tags_association_table.c.item_id,
+                                 Items.user_id == items_tags_association_table.c.user_id),
+        secondaryjoin=lambda: Tags.id == items_tags_association_table.c.tag_id,
+        back_populates="items",
+        passive_deletes=True,
+        lazy="noload"
+    )
+    __mapper_args__ = {"primary_key": [id]}
+    __table_args__ = (
+        # выборка материалов пользователя: user_id + ключ сортировки ItemSortingParams + id
+        Index("ix_items_user_id_title_id", "user_id", "title", "id"),
+        Index("ix_items_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_items_user_id_updated_at_id", "user_id", "updated_at", "id"),
+        Index("ix_items_user_id_status_id", "user_id", "status", "id"),
+        Index("ix_items_user_id_priority_id", "user_id", "priority", "id"),
+        # фильтры по перечислениям пользователя, покрывающий индекс для агрегатов по updated_at
+        Index("ix_items_user_id_status_priority_kind", "user_id", "status", "priority", "kind",
+              postgresql_include=["updated_at"]),
+        # выборка без user_id: сортировка по умолчанию и диапазоны дат
+        Index("ix_items_title_id", "title", "id"),
+        Index("ix_items_created_at_id", "created_at", "id"),
+        Index("ix_items_updated_at_id", "updated_at", "id"),
+        # полнотекстовый поиск по title + notes
+        Index("ix_items_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "HASH (user_id)"},
+    )
     
 class Tags(Base):
     __tablename__ = "tags"
     id = mapped_column(Integer, primary_key= True, autoincrement=True)
-    user_id = mapped_column(Integer, ForeignKey("users.id"))
+    user_id = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     name = mapped_column(String(50), nullable=True)
     
     user: Mapped[Users] = relationship(
-            "Users", back_populates="tags", lazy="selectin")
+            "Users", back_populates="tags", lazy="noload")
     
     items: Mapped[list["Items"]] = relationship(
         secondary=items_tags_association_table,
+        primaryjoin=lambda: Tags.id == items_tags_association_table.c.tag_id,
+        secondaryjoin=lambda: and_(Items.id == items_tags_association_table.c.item_id,
+                                   Items.user_id == items_tags_association_table.c.user_id),
         back_populates="tags",
-        lazy="selectin"
+        passive_deletes=True,
+        lazy="noload"
     )
     __table_args__ = (
         UniqueConstraint('name', 'user_id', name='unique_name_for_user'),
+        Index("ix_tags_user_id_name", "user_id", "name"),
     )
-    
-    
\ No newline at end of file
+
+
+class ImportCheckpoints(Base):
+    """Прогресс импорта (manage.py import): обновляется в одной транзакции с загруженной пачкой"""
+    __tablename__ = "import_checkpoints"
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job = mapped_column(String(255), nullable=False, unique=True)
+    kind = mapped_column(String(20), nullable=False)
+    source = mapped_column(Text, nullable=False)
+    rows_done = mapped_column(BigInteger, nullable=False, default=0)
+
+
+# измерения сводки user_item_stats: колонка счетчика - <измерение>_<значение перечисления>
+USER_ITEM_STATS_DIMENSIONS = {"status": Status, "priority": Priority, "kind": Kind}
+
+
+class UserItemStats(Base):
+    """
+    Счетчики материалов пользователя по статусу, приоритету и виду
+
+    Строка создается триггером на вставку в users, счетчики обновляются
+    триггерами на items (см. миграцию user_item_stats); пересчет с нуля -
+    manage.py rebuild-stats
+    """
+    __tablename__ = "user_item_stats"
+    id = None
+    user_id = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+    total = mapped_column(Integer, nullable=False, server_default="0")
+    status_planned = mapped_column(Integer, nullable=False, server_default="0")
+    status_reading = mapped_column(Integer, nullable=False, server_default="0")
+    status_done = mapped_column(Integer, nullable=False, server_default="0")
+    priority_low = mapped_column(Integer, nullable=False, server_default="0")
+    priority_normal = mapped_column(Integer, nullable=False, server_default="0")
+    priority_high = mapped_column(Integer, nullable=False, server_default="0")
+    kind_book = mapped_column(Integer, nullable=False, server_default="0")
+    kind_article = mapped_column(Integer, nullable=False, server_default="0")
+
+
+# поля материала, переходы которых записываются в item_events
+ITEM_EVENT_FIELDS = {"status": Status, "priority": Priority}
+
+
+class ItemEvents(Base):
+    """
+    Журнал переходов статуса и приоритета материалов (только добавление)
+
+    Записывается триггерами на items (см. миграцию item_events), секционирован
+    по месяцам created_at; секции создает и отсоединяет manage.py partitions
+    """
+    __tablename__ = "item_events"
+    id = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    # ключ секционирования входит в первичный ключ
+    created_at: Mapped[datetime] = mapped_column(primary_key=True, server_default=func.now())
+    updated_at = None
+    item_id = mapped_column(Integer, nullable=False)
+    user_id = mapped_column(Integer, nullable=True)
+    field = mapped_column(String(20), nullable=False)
+    # имена значений перечислений, как они хранятся в items; old_value пуст при создании материала
+    old_value = mapped_column(String(20), nullable=True)
+    new_value = mapped_column(String(20), nullable=False)
+    __table_args__ = (
+        Index("ix_item_events_user_id_created_at", "user_id", "created_at"),
+        Index("ix_item_events_item_id_created_at", "item_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class ItemEventRollups(Base):
+    """
+    Число переходов в значение поля за день по пользователям
+
+    Обновляется тем же триггером, что пишет item_events; недельные и месячные
+    ряды суммируются из дневных, поэтому отсоединение старых секций журнала
+    не влияет на отчеты
+    """
+    __tablename__ = "item_event_rollups"
+    id = None
+    created_at = None
+    user_id = mapped_column(Integer, primary_key=True)
+    day = mapped_column(Date, primary_key=True)
+    field = mapped_column(String(20), primary_key=True)
+    value = mapped_column(String(20), primary_key=True)
+    transitions = mapped_column(Integer, nullable=False, server_default="0")
@@ -5,13 +5,13 @@ from fastapi.responses import JSONResponse
 from fastapi import APIRouter, status, Depends
 from loguru import logger
 
-from api.dependencies import UOWBookshelf
+from api.dependencies import UOWBookshelf, UOWBookshelfReadOnly
 from modules.tags_manager.service import TagsService
 from modules.tags_manager.schemas.responses import UserResponse
 from modules.tags_manager.schemas.requests import CreatePutUser, PatchUser
-from modules.tags_manager.schemas.filters import UserFilter, PaginationAndSorting, user_filter_dependency
+from modules.tags_manager.schemas.filters import UserFilter, PaginationAndSorting, user_filter_dependency, UserIncludeParams, user_include_dependency, UserFields, user_fields_dependency
 
-from utils import validation
+from utils import serialize, serialize_rows
 
 sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
 
@@ -24,16 +24,21 @@ router = APIRouter(prefix="/api/v1",
 @router.get("/tags", 
             tags=["Tags"],
             summary="Get users")
-async def get_users(uow: UOWBookshelf, filters: UserFilter = Depends(user_filter_dependency), sorting_params: PaginationAndSorting = Depends()) -> list[UserResponse]:
-    instance = await TagsService().get_users_by_filters(uow, filters, sorting_params)
-    return validation(UserResponse, instance)
+async def get_users(uow: UOWBookshelfReadOnly, filters: UserFilter = Depends(user_filter_dependency), sorting_params: PaginationAndSorting = Depends(), include: list[UserIncludeParams] = Depends(user_include_dependency), fields: list[UserFields] = Depends(user_fields_dependency)) -> list[UserResponse]:
+    instance, next_cursor, total_count = await TagsService().get_users_by_filters(uow, filters, sorting_params, include, fields)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if total_count is not None:
+        headers["X-Total-Count"] = str(total_count)
+    if fields:
+        return serialize_rows(instance, headers=headers)
+    return serialize(UserResponse, instance, headers=headers)
 
 @router.get("/tags/{id}", 
             tags=["Tags"],
             summary="Get users by id")
-async def get_user_by_id(id: int, uow: UOWBookshelf) -> UserResponse:
-    instance = await TagsService().get_user_by_id(id, uow)
-    return instance
+async def get_user_by_id(id: int, uow: UOWBookshelfReadOnly, include: list[UserIncludeParams] = Depends(user_include_dependency)) -> UserResponse:
+    instance = await TagsService().get_user_by_id(id, uow, include)
+    return serialize(UserResponse, instance)
 
 @router.post("/tags", 
              tags=["Tags"],
@@ -42,7 +47,7 @@ async def get_user_by_id(id: int, uow: UOWBookshelf) -> UserResponse:
              """)
 async def create_user(user: CreatePutUser, uow: UOWBookshelf) -> UserResponse:
     instance = await TagsService().add_user(uow, user)
-    return instance
+    return serialize(UserResponse, instance)
 
 @router.delete("/tags/{id}", 
                tags=["Tags"],
@@ -60,4 +65,4 @@ async def delete_user(id: int, uow: UOWBookshelf) -> JSONResponse:
              """)
 async def patch_user(id: int,  uow: UOWBookshelf, update_data: PatchUser) -> UserResponse:
     result = await TagsService().update_user(uow, id, update_data)
-    return result
+    return serialize(UserResponse, result)
@@ -5,6 +5,9 @@ from enum import Enum
 from fastapi import Query
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 
+from database.pagination import CountMode
+from utils import parse_comma_separated
+
 
 class UserSortingParams(str, Enum):
     CREATED_AT = "created_at" 
@@ -12,6 +15,17 @@ class UserSortingParams(str, Enum):
     EMAIL = "email"
     DISPLAY_NAME = "display_name"
     
+class UserFields(str, Enum):
+    ID = "id"
+    EMAIL = "email"
+    DISPLAY_NAME = "display_name"
+    CREATED_AT = "created_at"
+    UPDATED_AT = "updated_at"
+
+class UserIncludeParams(str, Enum):
+    ITEMS = "items"
+    TAGS = "tags"
+
 class UserFilter(BaseModel):
     email: Optional[str] = Query(
         default=None,
@@ -68,11 +82,28 @@ class PaginationAndSorting(BaseModel):
     offset: Optional[int] = Query(
         description="Смещение контекстного окна", ge=0, default=0
     )
+    cursor: Optional[str] = Query(
+        description="Курсор следующей страницы из заголовка X-Next-Cursor (если передан, offset игнорируется)",
+        default=None
+    )
     sort_by: Optional[UserSortingParams] = Query(
         description="", default=UserSortingParams.DISPLAY_NAME.value
     )
     desc: Optional[bool] = Query(
         default=False
     )
+    count: CountMode = Query(
+        description="Общее число строк в X-Total-Count: exact - точно, estimated - оценка планировщика", default=CountMode.NONE
+    )
 
-    
+
+def user_include_dependency(
+    include: Optional[str] = Query(None, description="Связанные объекты через запятую", examples=["items,tags"]),
+) -> list[UserIncludeParams]:
+    return parse_comma_separated(include, UserIncludeParams)
+
+
+def user_fields_dependency(
+    fields: Optional[str] = Query(None, description="Возвращаемые поля через запятую (id и поле сортировки возвращаются всегда)", examples=["id,email"]),
+) -> list[UserFields]:
+    return parse_comma_separated(fields, UserFields)
@@ -19,10 +19,10 @@ class UserResponse(BaseModel):
         description="Отображаемое имя пользователя", examples=["Иван Натаныч"]
     )
     items: list[Item] = Field(
-        description="Материалы пользователя"
+        default=[], description="Материалы пользователя (include=items)"
     )
     tags: list[Tag] = Field(
-        description="Теги пользователя"
+        default=[], description="Теги пользователя (include=tags)"
     )
     created_at: datetime = Field(
         description="Дата и время создания", examples=[datetime.now()]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from fastapi import HTTPException, status
 from loguru import logger
 from sqlalchemy.orm.exc import NoResultFound
@@ -5,10 +7,10 @@ from sqlalchemy.exc import IntegrityError
 
 from unitofwork import AbstractUnitOfWork
 from modules.users_manager.schemas.requests import CreatePutUser, PatchUser
-from modules.users_manager.schemas.filters import UserFilter,  PaginationAndSorting
+from modules.users_manager.schemas.filters import UserFilter,  PaginationAndSorting, UserIncludeParams, UserFields
 from modules.users_manager.schemas.responses import UserResponse
 from api.dependencies import UOWBookshelf
-from exceptions import ResultNotFound, AlreadyExists
+from exceptions import ResultNotFound, AlreadyExists, InvalidCursor
 
 
 class TagsService:
@@ -29,21 +31,25 @@ class TagsService:
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка пользователей")
             return users
     
-    async def get_users_by_filters(self, uow: AbstractUnitOfWork, filters: UserFilter, sorting_params: PaginationAndSorting) -> list[UserResponse]:
+    async def get_users_by_filters(self, uow: AbstractUnitOfWork, filters: UserFilter, sorting_params: PaginationAndSorting, include: list[UserIncludeParams] = (), fields: list[UserFields] = ()) -> tuple[list[UserResponse], Optional[str], Optional[int]]:
         async with uow:
             try:
                 filters = filters.model_dump()
-                sort_by = sorting_params.model_dump()
-                filtered_users = await uow.users.apply_filters(filters, sort_by)
+                sort_by = sorting_params.model_dump(exclude={"count"})
+                filtered_users, total_count = await uow.users.paginate(filters, sort_by, include, fields, sorting_params.count)
+                next_cursor = uow.users.get_next_cursor(filtered_users, sort_by)
+            except ValueError as e:
+                logger.error(f"Некорректный курсор пагинации: {e}")
+                raise InvalidCursor()
             except Exception as e:
                 logger.error(f"Ошибка в получении списка пользователей: {e}")
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка пользователей")
-            return filtered_users
+            return filtered_users, next_cursor, total_count
                 
-    async def get_user_by_id(self, id: int,  uow: AbstractUnitOfWork):
+    async def get_user_by_id(self, id: int,  uow: AbstractUnitOfWork, include: list[UserIncludeParams] = ()):
         async with uow:
             try:
-                user = await uow.users.get_by_id_or_none(id)
+                user = await uow.users.get_by_id_or_none(id, include)
                 if not user:
                     raise NoResultFound
                 return user
@@ -104,14 +110,12 @@ class TagsService:
                     )
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при удалении пользователя")
             
-    async def update_user(self, uow: AbstractUnitOfWork, user_id: int, update_data: PatchUser) -> UserResponse:
+    async def update_user(self, uow: AbstractUnitOfWork, user_id: int, update_data: PatchUser, include: list[UserIncludeParams] = ()) -> UserResponse:
         async with uow:
             try:
                 update_data = update_data.model_dump(exclude_unset=True)
-                names = update_data.keys()
-                values = update_data.values()
                 expression = (uow.users.model.id == user_id)
-                result = await uow.users.update_multiple_attrs(names, values, expression)
+                result = await uow.users.update_returning(update_data, expression, include=include)
                 await uow.commit()
                 return result
             except NoResultFound as e:
@@ -1,30 +1,76 @@
-from database.connection import async_session_maker
+from database.connection import async_session_maker, get_read_session_maker
+from database.cache import get_cache, collect_changes, invalidate_pending, discard_pending
 from modules import models
 from loguru import logger
-from sqlalchemy import func
+from sqlalchemy import event, func
 from fastapi import HTTPException, status
 from sqlalchemy.exc import OperationalError
 
 from modules.models import *
 from database.repository import DatabaseRepository
+from database.sharding import ShardedRepository, get_shard_map, shard_session_makers
 from unitofwork import AbstractUnitOfWork
 from exceptions import ServiceUnavailable
 from settings import settings
 
 
+# репозитории единицы работы: атрибут -> модель
+REPOSITORIES = {
+    "users": models.Users,
+    "items": models.Items,
+    "tags": models.Tags,
+    "user_stats": models.UserItemStats,
+    "item_event_rollups": models.ItemEventRollups,
+}
+
+
+def set_read_only(session, transaction, connection):
+    connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+
+
 class BookshelfUnitofWork(AbstractUnitOfWork):
 
-    def __init__(self):
+    def __init__(self, read_only: bool = False):
+        """
+        Args:
+            read_only: только чтение — сессия открывается на реплике (если она настроена
+                и не отстает), транзакция выполняется как READ ONLY
+        """
         super().__init__()
+        self.read_only = read_only
+        self.replica_chosen = False
         self.session = None
+        # пакетные загрузчики репозиториев живут весь запрос (все входы в uow)
+        self.loaders = {name: {} for name in REPOSITORIES}
 
     async def __aenter__(self):
+        if self.session is not None:
+            # повторный вход (вложенный или в пределах запроса): та же сессия и транзакция
+            self.depth += 1
+            return
         try:
+            if self.read_only and not self.replica_chosen:
+                # реплика выбирается один раз на запрос: повторные входы в uow
+                # (например, проверка ETag и выборка) читают с одной и той же реплики
+                self.factory = await get_read_session_maker()
+                self.replica_chosen = True
             self.session = self.factory()
-            self.users = DatabaseRepository(models.Users, self.session)
-            self.items = DatabaseRepository(models.Items, self.session)
-            self.tags = DatabaseRepository(models.Tags, self.session)
-            
+            cache = None
+            cache_lag = 0
+            if self.read_only:
+                event.listen(self.session.sync_session, "after_begin", set_read_only)
+                cache = get_cache()
+                if self.factory is not async_session_maker:
+                    # реплика отстает не более чем на DB_REPLICA_MAX_LAG на момент проверки,
+                    # проверка повторяется раз в DB_REPLICA_CHECK_INTERVAL
+                    cache_lag = settings.DB_REPLICA_MAX_LAG + settings.DB_REPLICA_CHECK_INTERVAL
+            else:
+                event.listen(self.session.sync_session, "after_flush", collect_changes)
+            for name, model in REPOSITORIES.items():
+                setattr(self, name, DatabaseRepository(model, self.session, cache,
+                                                       self.loaders[name], cache_lag))
+            self.depth += 1
+
         except OperationalError as e:
             logger.error(
                 "Ошибка подключения к СУБД!"
@@ -35,10 +81,165 @@ class BookshelfUnitofWork(AbstractUnitOfWork):
             )
         
     async def __aexit__(self, *args):
-        await self.session.close()
+        self.depth -= 1
+        if self.depth == 0 and not self.request_scoped:
+            await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
     async def commit(self):
-        await self.session.commit()
+        if self.request_scoped:
+            # транзакция фиксируется один раз в конце запроса (end_request)
+            await self.session.flush()
+        else:
+            await self.session.commit()
+            await invalidate_pending(self.session)
+        self.clear_loaders()
 
     async def rollback(self):
-        await self.session.rollback()
\ No newline at end of file
+        # в пределах запроса откатывается вся его транзакция
+        await self.session.rollback()
+        discard_pending(self.session)
+        self.clear_loaders()
+
+    async def end_request(self, commit: bool = True):
+        """
+        Фиксация (или откат) транзакции запроса и возврат соединения в пул
+        """
+        self.request_scoped = False
+        if self.session is None:
+            return
+        try:
+            if commit:
+                await self.session.commit()
+                await invalidate_pending(self.session)
+            else:
+                await self.session.rollback()
+                discard_pending(self.session)
+        finally:
+            self.clear_loaders()
+            await self.close()
+
+    def clear_loaders(self):
+        # после записи закэшированные загрузчиками объекты могут быть устаревшими
+        for loaders in self.loaders.values():
+            for loader in loaders.values():
+                loader.clear()
+
+
+class ShardedUnitOfWork(AbstractUnitOfWork):
+    """
+    Единица работы поверх шардов по user_id (DB_SHARD_URLS, см. database.sharding)
+
+    На каждый шард открывается своя сессия, репозитории (ShardedRepository)
+    направляют запрос на шард владельца или выполняют его на всех шардах.
+    Коммит выполняется по шардам по очереди и не атомарен между ними: запись
+    сервисов затрагивает одного владельца, то есть один шард; частичный коммит
+    логируется (см. commit_shards). Реплики и кэш выборок в этом режиме не используются
+    """
+
+    def __init__(self, read_only: bool = False):
+        super().__init__()
+        self.read_only = read_only
+        self.shard_map = get_shard_map()
+        self.sessions = []
+        self.loaders = [{name: {} for name in REPOSITORIES} for _ in shard_session_makers]
+
+    async def __aenter__(self):
+        if self.sessions:
+            self.depth += 1
+            return
+        try:
+            self.sessions = [session_maker() for session_maker in shard_session_makers]
+            for session in self.sessions:
+                if self.read_only:
+                    event.listen(session.sync_session, "after_begin", set_read_only)
+                else:
+                    event.listen(session.sync_session, "after_flush", collect_changes)
+            for name, model in REPOSITORIES.items():
+                repositories = [DatabaseRepository(model, session, None, loaders[name])
+                                for session, loaders in zip(self.sessions, self.loaders)]
+                setattr(self, name, ShardedRepository(model, repositories, self.shard_map))
+            self.depth += 1
+        except OperationalError as e:
+            logger.error(
+                "Ошибка подключения к СУБД!"
+                f"Проверьте подключение к шардам: {len(shard_session_makers)}"
+                )
+            raise ServiceUnavailable(
+                "База данных"
+            )
+
+    async def __aexit__(self, *args):
+        self.depth -= 1
+        if self.depth == 0 and not self.request_scoped:
+            await self.close()
+
+    async def close(self):
+        for session in self.sessions:
+            await session.close()
+        self.sessions = []
+
+    async def commit(self):
+        if self.request_scoped:
+            for session in self.sessions:
+                await session.flush()
+        else:
+            await self.commit_shards()
+        self.clear_loaders()
+
+    async def commit_shards(self):
+        """
+        Фиксация транзакций шардов по очереди
+
+        Сначала изменения всех шардов отправляются в БД (flush): ошибки записи
+        возникают до первого коммита и откатывают все шарды. Ошибка коммита
+        шарда N (обрыв соединения, отложенные ограничения) оставляет шарды
+        0..N-1 зафиксированными - это логируется, остальные шарды откатываются
+        """
+        try:
+            for session in self.sessions:
+                await session.flush()
+        except Exception:
+            await self.rollback()
+            raise
+        committed = []
+        for index, session in enumerate(self.sessions):
+            try:
+                await session.commit()
+            except Exception as e:
+                logger.error(f"Ошибка коммита шарда {index}, уже зафиксированы шарды {committed}: {e}")
+                for rest_index, rest in enumerate(self.sessions[index:], index):
+                    try:
+                        await rest.rollback()
+                    except Exception as rollback_error:
+                        logger.error(f"Ошибка отката шарда {rest_index}: {rollback_error}")
+                    discard_pending(rest)
+                raise
+            committed.append(index)
+            await invalidate_pending(session)
+
+    async def rollback(self):
+        for session in self.sessions:
+            await session.rollback()
+            discard_pending(session)
+        self.clear_loaders()
+
+    async def end_request(self, commit: bool = True):
+        self.request_scoped = False
+        try:
+            if commit:
+                await self.commit()
+            else:
+                await self.rollback()
+        finally:
+            await self.close()
+
+    def clear_loaders(self):
+        for shard_loaders in self.loaders:
+            for loaders in shard_loaders.values():
+                for loader in loaders.values():
+                    loader.clear()
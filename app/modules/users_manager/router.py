@@ -2,16 +2,17 @@ import sys
 from pathlib import Path
 
 from fastapi.responses import JSONResponse
-from fastapi import APIRouter, status, Depends
+from fastapi import APIRouter, status, Depends, Request
 from loguru import logger
 
-from api.dependencies import UOWBookshelf
+from api.dependencies import UOWBookshelf, UOWBookshelfReadOnly
+from api.conditional import list_etag, detail_etag, validator_headers, is_not_modified, not_modified
 from modules.users_manager.service import UserService
-from modules.users_manager.schemas.responses import UserResponse
+from modules.users_manager.schemas.responses import UserResponse, UserStatsResponse, UserActivityResponse
 from modules.users_manager.schemas.requests import CreatePutUser, PatchUser
-from modules.users_manager.schemas.filters import UserFilter, PaginationAndSorting, user_filter_dependency
+from modules.users_manager.schemas.filters import UserFilter, PaginationAndSorting, user_filter_dependency, UserIncludeParams, user_include_dependency, UserFields, user_fields_dependency, ActivityParams
 
-from utils import validation
+from utils import serialize, serialize_rows
 
 sys.path.append(Path(__file__).parent.__str__())  # pylint: disable=C2801
 
@@ -24,16 +25,68 @@ router = APIRouter(prefix="/api/v1",
 @router.get("/users", 
             tags=["Users"],
             summary="Get users")
-async def get_users(uow: UOWBookshelf, filters: UserFilter = Depends(user_filter_dependency), sorting_params: PaginationAndSorting = Depends()) -> list[UserResponse]:
-    instance = await UserService().get_users_by_filters(uow, filters, sorting_params)
-    return validation(UserResponse, instance)
+async def get_users(request: Request, uow: UOWBookshelfReadOnly, filters: UserFilter = Depends(user_filter_dependency), sorting_params: PaginationAndSorting = Depends(), include: list[UserIncludeParams] = Depends(user_include_dependency), fields: list[UserFields] = Depends(user_fields_dependency)) -> list[UserResponse]:
+    headers = {}
+    params = [filters.model_dump(), sorting_params.model_dump(), fields]
+    if not include:
+        count, last_modified = await UserService().get_users_version(uow, filters)
+        etag = list_etag(count, last_modified, params)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+    # валидаторы ответа строятся по версии, прочитанной вместе со страницей (в том числе из кэша)
+    instance, next_cursor, total_count, version = await UserService().get_users_by_filters(uow, filters, sorting_params, include, fields, with_version=not include)
+    if version is not None:
+        count, last_modified = version
+        headers.update(validator_headers(list_etag(count, last_modified, params), last_modified))
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if total_count is not None:
+        headers["X-Total-Count"] = str(total_count)
+    if fields:
+        return serialize_rows(instance, headers=headers)
+    return serialize(UserResponse, instance, headers=headers)
+
+@router.get("/users/{id}/stats", 
+            tags=["Users"],
+            summary="Get user shelf statistics",
+            description="""
+Количество материалов пользователя по статусу, приоритету и виду.
+Счетчики поддерживаются триггерами на items, ответ - чтение одной строки по ключу.
+             """)
+async def get_user_stats(id: int, uow: UOWBookshelfReadOnly) -> UserStatsResponse:
+    result = await UserService().get_user_stats(id, uow)
+    return serialize(UserStatsResponse, result)
+
+@router.get("/users/{id}/activity", 
+            tags=["Users"],
+            summary="Get user reading activity",
+            description="""
+Число переходов статуса (`field=status`) или приоритета (`field=priority`) материалов
+пользователя в каждое значение по дням, неделям или месяцам (`bucket`).
+Переходы записываются триггерами в журнал item_events, ответ строится по дневной сводке.
+             """)
+async def get_user_activity(id: int, uow: UOWBookshelfReadOnly, params: ActivityParams = Depends()) -> UserActivityResponse:
+    result = await UserService().get_user_activity(id, params, uow)
+    return serialize(UserActivityResponse, result)
 
 @router.get("/users/{id}", 
             tags=["Users"],
-            summary="Get users by id")
-async def get_user_by_id(id: int, uow: UOWBookshelf) -> UserResponse:
-    instance = await UserService().get_user_by_id(id, uow)
-    return instance
+            summary="Get users by id",
+            description="""
+Ответ содержит `ETag` и `Last-Modified` по updated_at пользователя;
+при совпадении `If-None-Match`/`If-Modified-Since` возвращается 304.
+Для запросов с `include` условные заголовки не формируются.
+             """)
+async def get_user_by_id(request: Request, id: int, uow: UOWBookshelfReadOnly, include: list[UserIncludeParams] = Depends(user_include_dependency)) -> UserResponse:
+    if include:
+        instance = await UserService().get_user_by_id(id, uow, include)
+        return serialize(UserResponse, instance)
+    updated_at = await UserService().get_updated_at(id, uow)
+    etag = detail_etag(id, updated_at)
+    if is_not_modified(request, etag, updated_at):
+        return not_modified(etag, updated_at)
+    instance = await UserService().get_user_by_id(id, uow, include)
+    return serialize(UserResponse, instance, headers=validator_headers(detail_etag(id, instance.updated_at), instance.updated_at))
 
 @router.post("/users", 
              tags=["Users"],
@@ -42,7 +95,7 @@ async def get_user_by_id(id: int, uow: UOWBookshelf) -> UserResponse:
              """)
 async def create_user(user: CreatePutUser, uow: UOWBookshelf) -> UserResponse:
     instance = await UserService().add_user(uow, user)
-    return instance
+    return serialize(UserResponse, instance)
 
 @router.delete("/users/{id}", 
                tags=["Users"],
@@ -58,6 +111,6 @@ async def delete_user(id: int, uow: UOWBookshelf) -> JSONResponse:
                summary="Delete user by id",
                 description="""
              """)
-async def patch_user(id: int,  uow: UOWBookshelf, update_data: PatchUser) -> UserResponse:
-    result = await UserService().update_user(uow, id, update_data)
-    return result
+async def patch_user(id: int,  uow: UOWBookshelf, update_data: PatchUser, include: list[UserIncludeParams] = Depends(user_include_dependency)) -> UserResponse:
+    result = await UserService().update_user(uow, id, update_data, include)
+    return serialize(UserResponse, result)
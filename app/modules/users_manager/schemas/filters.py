@@ -1,10 +1,13 @@
 from typing import Optional, Union
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from enum import Enum
 
 from fastapi import Query
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 
+from database.pagination import CountMode
+from utils import parse_comma_separated
+
 
 class UserSortingParams(str, Enum):
     CREATED_AT = "created_at" 
@@ -12,6 +15,26 @@ class UserSortingParams(str, Enum):
     EMAIL = "email"
     DISPLAY_NAME = "display_name"
     
+class UserFields(str, Enum):
+    ID = "id"
+    EMAIL = "email"
+    DISPLAY_NAME = "display_name"
+    CREATED_AT = "created_at"
+    UPDATED_AT = "updated_at"
+
+class UserIncludeParams(str, Enum):
+    ITEMS = "items"
+    TAGS = "tags"
+
+class ActivityBucket(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class ActivityField(str, Enum):
+    STATUS = "status"
+    PRIORITY = "priority"
+
 class UserFilter(BaseModel):
     email: Optional[str] = Query(
         default=None,
@@ -68,11 +91,43 @@ class PaginationAndSorting(BaseModel):
     offset: Optional[int] = Query(
         description="Смещение контекстного окна", ge=0, default=0
     )
+    cursor: Optional[str] = Query(
+        description="Курсор следующей страницы из заголовка X-Next-Cursor (если передан, offset игнорируется)",
+        default=None
+    )
     sort_by: Optional[UserSortingParams] = Query(
         description="", default=UserSortingParams.DISPLAY_NAME.value
     )
     desc: Optional[bool] = Query(
         default=False
     )
+    count: CountMode = Query(
+        description="Общее число строк в X-Total-Count: exact - точно, estimated - оценка планировщика", default=CountMode.NONE
+    )
 
-    
+
+def user_include_dependency(
+    include: Optional[str] = Query(None, description="Связанные объекты через запятую", examples=["items,tags"]),
+) -> list[UserIncludeParams]:
+    return parse_comma_separated(include, UserIncludeParams)
+
+
+def user_fields_dependency(
+    fields: Optional[str] = Query(None, description="Возвращаемые поля через запятую (id и поле сортировки возвращаются всегда)", examples=["id,email"]),
+) -> list[UserFields]:
+    return parse_comma_separated(fields, UserFields)
+
+
+class ActivityParams(BaseModel):
+    bucket: ActivityBucket = Query(
+        description="Период группировки", default=ActivityBucket.DAY
+    )
+    field: ActivityField = Query(
+        description="Поле, переходы которого считаются", default=ActivityField.STATUS
+    )
+    date_from: Optional[date] = Query(
+        description="С даты (включительно)", default=None
+    )
+    date_to: Optional[date] = Query(
+        description="По дату (включительно)", default=None
+    )
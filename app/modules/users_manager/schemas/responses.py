@@ -1,10 +1,10 @@
 from typing import Optional, Union
-from datetime import datetime
+from datetime import date, datetime
 
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 
 from modules.users_manager.schemas.units import User
-from modules.items_manager.schemas.units import Item
+from modules.items_manager.schemas.units import Item, Kind, Status, Priority
 from modules.tags_manager.schemas.units import Tag
 
 
@@ -19,10 +19,10 @@ class UserResponse(BaseModel):
         description="Отображаемое имя пользователя", examples=["Иван Натаныч"]
     )
     items: list[Item] = Field(
-        description="Материалы пользователя"
+        default=[], description="Материалы пользователя (include=items)"
     )
     tags: list[Tag] = Field(
-        description="Теги пользователя"
+        default=[], description="Теги пользователя (include=tags)"
     )
     created_at: datetime = Field(
         description="Дата и время создания", examples=[datetime.now()]
@@ -31,4 +31,50 @@ class UserResponse(BaseModel):
         description="Дата и время обновления", examples=[datetime.now()]
     )
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserStatsResponse(BaseModel):
+    user_id: int = Field(
+        description="ID пользователя", examples=[1, 2]
+    )
+    total: int = Field(
+        description="Всего материалов"
+    )
+    status: dict[Status, int] = Field(
+        description="Количество материалов по статусу", examples=[{"planned": 3, "reading": 1, "done": 5}]
+    )
+    priority: dict[Priority, int] = Field(
+        description="Количество материалов по приоритету", examples=[{"low": 2, "normal": 6, "high": 1}]
+    )
+    kind: dict[Kind, int] = Field(
+        description="Количество материалов по виду", examples=[{"book": 4, "article": 5}]
+    )
+    updated_at: datetime = Field(
+        description="Дата и время последнего изменения счетчиков", examples=[datetime.now()]
+    )
+
+
+
+class ActivityPeriod(BaseModel):
+    period: date = Field(
+        description="Начало периода", examples=[date.today()]
+    )
+    transitions: dict[str, int] = Field(
+        description="Число переходов в каждое значение поля за период", examples=[{"reading": 2, "done": 1}]
+    )
+
+
+class UserActivityResponse(BaseModel):
+    user_id: int = Field(
+        description="ID пользователя", examples=[1, 2]
+    )
+    bucket: str = Field(
+        description="Период группировки", examples=["day", "week", "month"]
+    )
+    field: str = Field(
+        description="Поле материала", examples=["status", "priority"]
+    )
+    periods: list[ActivityPeriod] = Field(
+        default=[], description="Периоды с переходами по возрастанию"
+    )
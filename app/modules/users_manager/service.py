@@ -1,3 +1,6 @@
+from datetime import datetime
+from typing import Optional
+
 from fastapi import HTTPException, status
 from loguru import logger
 from sqlalchemy.orm.exc import NoResultFound
@@ -5,10 +8,11 @@ from sqlalchemy.exc import IntegrityError
 
 from unitofwork import AbstractUnitOfWork
 from modules.users_manager.schemas.requests import CreatePutUser, PatchUser
-from modules.users_manager.schemas.filters import UserFilter,  PaginationAndSorting
-from modules.users_manager.schemas.responses import UserResponse
+from modules.users_manager.schemas.filters import UserFilter,  PaginationAndSorting, UserIncludeParams, UserFields, ActivityParams
+from modules.users_manager.schemas.responses import UserResponse, UserStatsResponse, UserActivityResponse, ActivityPeriod
+from modules.models import USER_ITEM_STATS_DIMENSIONS, ITEM_EVENT_FIELDS
 from api.dependencies import UOWBookshelf
-from exceptions import ResultNotFound, AlreadyExists
+from exceptions import ResultNotFound, AlreadyExists, InvalidCursor
 
 
 class UserService:
@@ -29,21 +33,58 @@ class UserService:
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка пользователей")
             return users
     
-    async def get_users_by_filters(self, uow: AbstractUnitOfWork, filters: UserFilter, sorting_params: PaginationAndSorting) -> list[UserResponse]:
+    async def get_users_by_filters(self, uow: AbstractUnitOfWork, filters: UserFilter, sorting_params: PaginationAndSorting, include: list[UserIncludeParams] = (), fields: list[UserFields] = (), with_version: bool = False) -> tuple[list[UserResponse], Optional[str], Optional[int], Optional[tuple[int, Optional[datetime]]]]:
+        """
+        Страница выборки, курсор следующей страницы и общее число строк
+
+        При with_version также версия выборки (число строк и max(updated_at)) для ETag,
+        прочитанная вместе со страницей (см. paginate_with_version), иначе None
+        """
         async with uow:
             try:
                 filters = filters.model_dump()
-                sort_by = sorting_params.model_dump()
-                filtered_users = await uow.users.apply_filters(filters, sort_by)
+                sort_by = sorting_params.model_dump(exclude={"count"})
+                version = None
+                if with_version:
+                    filtered_users, total_count, version = await uow.users.paginate_with_version(
+                        filters, sort_by, include, fields, sorting_params.count)
+                else:
+                    filtered_users, total_count = await uow.users.paginate(filters, sort_by, include, fields, sorting_params.count)
+                next_cursor = uow.users.get_next_cursor(filtered_users, sort_by)
+            except ValueError as e:
+                logger.error(f"Некорректный курсор пагинации: {e}")
+                raise InvalidCursor()
             except Exception as e:
                 logger.error(f"Ошибка в получении списка пользователей: {e}")
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка пользователей")
-            return filtered_users
+            return filtered_users, next_cursor, total_count, version
                 
-    async def get_user_by_id(self, id: int,  uow: AbstractUnitOfWork):
+    async def get_users_version(self, uow: AbstractUnitOfWork, filters: UserFilter) -> tuple[int, Optional[datetime]]:
+        async with uow:
+            try:
+                return await uow.users.get_version(filters.model_dump())
+            except Exception as e:
+                logger.error(f"Ошибка при получении версии списка пользователей: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка в получении списка пользователей")
+
+    async def get_updated_at(self, id: int, uow: AbstractUnitOfWork) -> datetime:
+        async with uow:
+            try:
+                updated_at = await uow.users.get_updated_at(id)
+                if updated_at is None:
+                    raise NoResultFound
+                return updated_at
+            except NoResultFound as e:
+                logger.error(f"Пользователя с id '{id}' не существует!")
+                raise ResultNotFound()
+            except Exception as e:
+                logger.error(f"Ошибка при получении версии объекта: {e}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при получении объекта")
+
+    async def get_user_by_id(self, id: int,  uow: AbstractUnitOfWork, include: list[UserIncludeParams] = ()):
         async with uow:
             try:
-                user = await uow.users.get_by_id_or_none(id)
+                user = await uow.users.get_by_id_or_none(id, include)
                 if not user:
                     raise NoResultFound
                 return user
@@ -56,8 +97,58 @@ class UserService:
                 logger.error(f"Ошибка при получении пользователя: {str(e)}")
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при валидации данных")
 
-            
-    
+    async def get_user_stats(self, id: int, uow: AbstractUnitOfWork) -> UserStatsResponse:
+        """
+        Счетчики материалов пользователя из сводной таблицы user_item_stats (поиск по ключу)
+        """
+        async with uow:
+            try:
+                stats = await uow.user_stats.get_by_id_or_none(id)
+                if not stats:
+                    raise NoResultFound
+            except NoResultFound as e:
+                logger.error(f"Пользователя с id '{id}' не существует!")
+                raise ResultNotFound()
+            except Exception as e:
+                logger.error(f"Ошибка при получении статистики пользователя: {str(e)}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при получении статистики пользователя")
+        counters = {
+            dimension: {member: getattr(stats, f"{dimension}_{member.value}") for member in members}
+            for dimension, members in USER_ITEM_STATS_DIMENSIONS.items()
+        }
+        return UserStatsResponse(user_id=stats.user_id, total=stats.total,
+                                 updated_at=stats.updated_at, **counters)
+
+    async def get_user_activity(self, id: int, params: ActivityParams, uow: AbstractUnitOfWork) -> UserActivityResponse:
+        """
+        Переходы статуса или приоритета материалов пользователя по дням, неделям или месяцам
+
+        Читается дневная сводка item_event_rollups, а не журнал item_events
+        """
+        async with uow:
+            try:
+                if not await uow.users.exists_by_id(id):
+                    raise NoResultFound
+                rows = await uow.item_event_rollups.time_buckets(
+                    params.bucket.value, "day", "value", "transitions",
+                    {"user_id": id, "field": params.field.value},
+                    params.date_from, params.date_to)
+            except NoResultFound as e:
+                logger.error(f"Пользователя с id '{id}' не существует!")
+                raise ResultNotFound()
+            except Exception as e:
+                logger.error(f"Ошибка при получении активности пользователя: {str(e)}")
+                raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при получении активности пользователя")
+        # в сводке значения хранятся по именам членов перечисления, как в items
+        members = ITEM_EVENT_FIELDS[params.field.value]
+        periods: dict = {}
+        for period, value, transitions in rows:
+            periods.setdefault(period, {})[members[value].value] = transitions
+        return UserActivityResponse(
+            user_id=id, bucket=params.bucket.value, field=params.field.value,
+            periods=[ActivityPeriod(period=period, transitions=transitions)
+                     for period, transitions in periods.items()])
+
     async def add_user(self, uow: AbstractUnitOfWork, user_data: CreatePutUser) -> UserResponse:
         data = user_data.model_dump()
         logger.info(
@@ -104,14 +195,12 @@ class UserService:
                     )
                 raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при удалении пользователя")
             
-    async def update_user(self, uow: AbstractUnitOfWork, user_id: int, update_data: PatchUser) -> UserResponse:
+    async def update_user(self, uow: AbstractUnitOfWork, user_id: int, update_data: PatchUser, include: list[UserIncludeParams] = ()) -> UserResponse:
         async with uow:
             try:
                 update_data = update_data.model_dump(exclude_unset=True)
-                names = update_data.keys()
-                values = update_data.values()
                 expression = (uow.users.model.id == user_id)
-                result = await uow.users.update_multiple_attrs(names, values, expression)
+                result = await uow.users.update_returning(update_data, expression, include=include)
                 await uow.commit()
                 return result
             except NoResultFound as e:
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import subprocess
+import sys
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional, TypeVar
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.connection import init_engine, dispose_engine
+from settings import settings
+
+ROOT = Path(__file__).parent.parent.parent
+
+T = TypeVar("T")
+
+
+async def create_databases(names: list[str], drop: bool = False) -> None:
+    engine = create_async_engine(settings.DB_URL, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as connection:
+            # шарды с кодировкой и локалью основной БД: слияние страниц опирается на один порядок строк
+            encoding, collate, ctype = (await connection.execute(text(
+                "SELECT pg_encoding_to_char(encoding), datcollate, datctype "
+                "FROM pg_database WHERE datname = current_database()"))).one()
+            for name in names:
+                if drop:
+                    await connection.execute(text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+                else:
+                    await connection.execute(text(
+                        f"CREATE DATABASE {name} TEMPLATE template0 ENCODING '{encoding}' "
+                        f"LC_COLLATE '{collate}' LC_CTYPE '{ctype}'"))
+    finally:
+        await engine.dispose()
+
+
+async def check_connection() -> None:
+    # init_engine не соединяется с БД: доступность проверяется отдельным подключением
+    engine = create_async_engine(settings.DB_URL)
+    try:
+        async with engine.connect():
+            pass
+    finally:
+        await engine.dispose()
+
+
+def migrate(name: str) -> None:
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=ROOT, check=True,
+                   capture_output=True, env={**os.environ, "POSTGRES_DB": name})
+
+
+class Database:
+    """
+    Запуск асинхронного сценария теста с БД
+
+    Каждый сценарий выполняется в своем цикле событий (asyncio.run), поэтому
+    движок создается и закрывается внутри него; недоступная БД пропускает тест.
+    suffix - уникальная часть имен и email создаваемых тестом объектов
+    """
+
+    def __init__(self):
+        self.suffix = uuid.uuid4().hex[:8]
+
+    def run(self, scenario: Callable[..., Awaitable[T]], *args, app: Optional[FastAPI] = None) -> T:
+        """
+        Args:
+            args: аргументы сценария
+            app: приложение, lifespan которого (движок, кэш, шарды) окружает сценарий
+        """
+        return asyncio.run(self.with_engine(scenario, args, app))
+
+    async def with_engine(self, scenario: Callable[..., Awaitable[T]], args: tuple, app: Optional[FastAPI]) -> T:
+        try:
+            await check_connection()
+        except (OSError, OperationalError) as e:
+            pytest.skip(f"База данных недоступна: {e}")
+        lifespan = app.router.lifespan_context(app) if app is not None else None
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        else:
+            await init_engine()
+        try:
+            return await scenario(*args)
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+            else:
+                await dispose_engine()
+
+    @staticmethod
+    def url(name: str) -> str:
+        """
+        URL другой БД того же сервера
+        """
+        return settings.DB_URL.rsplit("/", 1)[0] + f"/{name}"
+
+    @asynccontextmanager
+    async def temporary(self, prefix: str, count: int = 1) -> AsyncIterator[list[str]]:
+        """
+        Временные БД с примененными миграциями (шарды, проверка DDL), удаляются после блока
+        """
+        names = [f"{prefix}_{self.suffix}_{index}" for index in range(count)]
+        await create_databases(names)
+        try:
+            for name in names:
+                migrate(name)
+            yield names
+        finally:
+            await create_databases(names, drop=True)
+
+
+@pytest.fixture
+def database() -> Database:
+    return Database()
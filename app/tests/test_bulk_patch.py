@@ -0,0 +1,24 @@
+import asyncio
+
+import httpx
+
+from main import app
+
+API = "http://bookshelf/api/v1"
+
+
+async def patch_statuses(requests: list[tuple[str, dict]]) -> list[int]:
+    # запросы отклоняются до обращения к БД: приложение запускается без lifespan
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=API) as client:
+        return [(await client.patch(path, json=body)).status_code for path, body in requests]
+
+
+def test_bulk_patch_rejects_empty_and_null_changes():
+    filters = {"user_id": 1}
+    statuses = asyncio.run(patch_statuses([
+        ("/items", {"filters": filters, "changes": {}}),
+        ("/items", {"filters": filters, "changes": {"status": None}}),
+        ("/items", {"filters": filters, "changes": {"user_id": None, "priority": "high"}}),
+        ("/items/1", {"kind": None}),
+    ]))
+    assert statuses == [400, 422, 422, 422]
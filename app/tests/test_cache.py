@@ -0,0 +1,140 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import fakeredis
+import pytest
+
+from database.cache import (
+    ALL_TAG,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+    Snapshot,
+    decode_value,
+    encode_value,
+    user_tag,
+)
+from modules import models  # noqa: F401 - перечисления колонок моделей для decode_value
+from modules.items_manager.schemas.units import Kind, Status
+
+# значение с типами, которые JSON не различает: снимки, кортежи, даты и перечисления
+ROWS = ([Snapshot({"id": 1, "title": "Книга", "kind": Kind.BOOK, "status": Status.PLANNED,
+                   "created_at": datetime(2025, 5, 1, 12, 30, tzinfo=timezone.utc),
+                   "tags": [Snapshot({"id": 2, "name": "python"})]})],
+        1)
+BUCKETS = [(date(2025, 5, 1), Status.DONE, 3)]
+
+
+def test_memory_hit_and_invalidation():
+    async def scenario():
+        cache = MemoryCacheBackend(ttl=60, max_entries=10)
+        await cache.put("own", ROWS, {user_tag(1)})
+        await cache.put("other", ROWS, {user_tag(2)})
+        await cache.put("list", ROWS, {ALL_TAG})
+        hit = await cache.get("own")
+        await cache.invalidate({ALL_TAG, user_tag(1)})
+        return cache, hit, [(await cache.get(key))[0] for key in ("own", "other", "list")]
+
+    cache, hit, found = asyncio.run(scenario())
+    assert hit == (True, ROWS)
+    # инвалидируются только записи с тегами закоммиченных изменений
+    assert found == [False, True, False]
+    assert cache.statistics.invalidations == 2
+
+
+def test_memory_lru_eviction_and_ttl(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("database.cache.time.monotonic", lambda: clock[0])
+
+    async def scenario():
+        cache = MemoryCacheBackend(ttl=30, max_entries=2)
+        await cache.put("a", 1, {ALL_TAG})
+        await cache.put("b", 2, {ALL_TAG})
+        # обращение к "a" делает "b" самой старой записью
+        await cache.get("a")
+        await cache.put("c", 3, {ALL_TAG})
+        after_eviction = [(await cache.get(key))[0] for key in ("a", "b", "c")]
+        clock[0] += 31
+        return cache, after_eviction, await cache.get("a")
+
+    cache, after_eviction, expired = asyncio.run(scenario())
+    assert after_eviction == [True, False, True]
+    assert expired == (False, None)
+    assert cache.statistics.evictions == 2
+
+
+def test_put_with_older_generation_is_rejected():
+    async def scenario():
+        cache = MemoryCacheBackend(ttl=60, max_entries=10)
+        tags = {user_tag(1)}
+        # чтение началось до коммита, запись в кэш - после инвалидации
+        generation = await cache.generation(tags)
+        await cache.invalidate({ALL_TAG, *tags})
+        await cache.put("stale", ROWS, tags, generation)
+        # поколение по all отклоняет запись с любым тегом (чтение по id)
+        by_id = await cache.generation({ALL_TAG})
+        await cache.invalidate({ALL_TAG, user_tag(2)})
+        await cache.put("stale_by_id", ROWS, tags, by_id)
+        fresh = await cache.generation(tags)
+        await cache.put("fresh", ROWS, tags, fresh)
+        return cache, [(await cache.get(key))[0] for key in ("stale", "stale_by_id", "fresh")]
+
+    cache, found = asyncio.run(scenario())
+    assert found == [False, False, True]
+    assert cache.statistics.rejected == 2
+
+
+def test_replica_read_is_not_cached_within_lag_window(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("database.cache.time.monotonic", lambda: clock[0])
+
+    async def scenario():
+        cache = MemoryCacheBackend(ttl=60, max_entries=10)
+        tags = {user_tag(1)}
+        await cache.invalidate(tags)
+        clock[0] += 5
+        generation = await cache.generation(tags)
+        # реплика может еще не видеть коммит: запись отклоняется
+        await cache.put("replica", ROWS, tags, generation, lag_window=10)
+        # чтение с основной БД кэшируется сразу
+        await cache.put("primary", ROWS, tags, generation)
+        clock[0] += 10
+        await cache.put("replica_later", ROWS, tags, generation, lag_window=10)
+        return [(await cache.get(key))[0] for key in ("replica", "primary", "replica_later")]
+
+    assert asyncio.run(scenario()) == [False, True, True]
+
+
+def test_values_roundtrip_through_json():
+    assert decode_value(encode_value(ROWS)) == ROWS
+    decoded = decode_value(encode_value(BUCKETS))
+    assert decoded == BUCKETS
+    assert isinstance(decode_value(encode_value(ROWS))[0][0], Snapshot)
+    with pytest.raises(ValueError):
+        decode_value(b'{"enum": "NotAModelEnum", "value": 1}')
+
+
+def test_redis_backend_with_stand_in_server():
+    async def scenario():
+        # общий сервер для двух процессов приложения
+        server = fakeredis.FakeServer()
+        first = RedisCacheBackend("", ttl=60, client=fakeredis.FakeAsyncRedis(server=server))
+        second = RedisCacheBackend("", ttl=60, client=fakeredis.FakeAsyncRedis(server=server))
+        tags = {user_tag(1)}
+        generation = await first.generation(tags)
+        await first.put("rows", ROWS, tags, generation)
+        await first.put("buckets", BUCKETS, {ALL_TAG}, await first.generation({ALL_TAG}))
+        shared = await second.get("rows"), await second.get("buckets")
+        # запись во втором процессе инвалидирует кэш первого
+        await second.invalidate({ALL_TAG, *tags})
+        invalidated = await first.get("rows"), await first.get("buckets")
+        await first.put("rows", ROWS, tags, generation)
+        stale = await first.get("rows")
+        await first.close()
+        await second.close()
+        return first, shared, invalidated, stale
+
+    first, shared, invalidated, stale = asyncio.run(scenario())
+    assert shared == ((True, ROWS), (True, BUCKETS))
+    assert invalidated == ((False, None), (False, None))
+    assert stale == (False, None)
+    assert first.statistics.rejected == 1
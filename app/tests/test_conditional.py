@@ -0,0 +1,62 @@
+import httpx
+
+from main import app
+
+API = "http://bookshelf/api/v1"
+
+
+async def run_conditional_scenario(suffix: str) -> dict:
+    statuses = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=API) as client:
+        user = (await client.post("/users", json={
+            "email": f"etag-{suffix}@example.com", "display_name": f"etag-{suffix}"})).json()
+        item = (await client.post("/items", json={"user_id": user["id"], "title": f"etag-{suffix}"})).json()
+        params = {"user_id": user["id"]}
+        try:
+            first = await client.get("/items", params=params)
+            # второй ответ может прийти из кэша: ETag должен совпасть с первым
+            cached = await client.get("/items", params=params)
+            statuses["list_etags"] = first.headers["etag"], cached.headers["etag"]
+            statuses["list_not_modified"] = (await client.get(
+                "/items", params=params, headers={"If-None-Match": first.headers["etag"]})).status_code
+
+            detail = await client.get(f"/items/{item['id']}")
+            etag = detail.headers["etag"]
+            statuses["detail_not_modified"] = (await client.get(
+                f"/items/{item['id']}", headers={"If-None-Match": etag})).status_code
+
+            patch = await client.patch(f"/items/{item['id']}", json={"priority": "high"},
+                                       headers={"If-Match": etag})
+            statuses["patch"] = patch.status_code
+            # ETag получен до изменения: повторная запись с ним отклоняется
+            statuses["patch_stale"] = (await client.patch(
+                f"/items/{item['id']}", json={"priority": "low"}, headers={"If-Match": etag})).status_code
+            statuses["patch_missing"] = (await client.patch(
+                "/items/0", json={"priority": "low"}, headers={"If-Match": etag})).status_code
+
+            changed = await client.get("/items", params=params, headers={"If-None-Match": first.headers["etag"]})
+            statuses["list_after_patch"] = changed.status_code
+            statuses["list_after_patch_body"] = [row["priority"] for row in changed.json()]
+            statuses["list_after_patch_etag"] = changed.headers["etag"]
+        finally:
+            await client.delete(f"/items/{item['id']}")
+            await client.delete(f"/users/{user['id']}")
+    return statuses
+
+
+def test_conditional_requests(database):
+    result = database.run(run_conditional_scenario, database.suffix, app=app)
+    first, cached = result["list_etags"]
+    assert first == cached
+    assert result["list_not_modified"] == 304
+    assert result["detail_not_modified"] == 304
+
+    assert result["patch"] == 200
+    assert result["patch_stale"] == 412
+    # несуществующий объект - 404, а не 412
+    assert result["patch_missing"] == 404
+
+    # измененная выборка: новое тело и новый ETag
+    assert result["list_after_patch"] == 200
+    assert result["list_after_patch_body"] == ["high"]
+    assert result["list_after_patch_etag"] != first
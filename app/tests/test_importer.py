@@ -0,0 +1,59 @@
+import json
+
+from sqlalchemy import delete, select
+
+from commands import importer
+from database import connection
+from modules import models
+
+
+def write_ndjson(path, rows: list[dict]) -> None:
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+
+
+async def run_import_scenario(tmp_path, suffix: str) -> dict:
+    users_file, items_file = tmp_path / "users.ndjson", tmp_path / "items.ndjson"
+    jobs = [f"users-{suffix}", f"items-{suffix}"]
+    write_ndjson(users_file, [
+        {"email": f"import-a-{suffix}@example.com", "display_name": f"import-a-{suffix}"},
+        # занятые email и display_name отклоняются, остальная пачка загружается
+        {"email": f"import-a-{suffix}@example.com", "display_name": f"import-b-{suffix}"},
+        {"email": f"import-c-{suffix}@example.com", "display_name": f"import-a-{suffix}"},
+        {"email": f"import-d-{suffix}@example.com", "display_name": f"import-d-{suffix}"},
+    ])
+    result = {"users_rejected": await importer.run("users", str(users_file), batch_size=10, job=jobs[0])}
+    async with connection.async_session_maker() as session:
+        user_ids = (await session.scalars(
+            select(models.Users.id).where(models.Users.email.like(f"import-%-{suffix}@example.com"))
+            .order_by(models.Users.id))).all()
+    result["users"] = len(user_ids)
+    write_ndjson(items_file, [
+        {"user_id": user_ids[0], "title": f"import-{suffix}-0", "tags": [f"import-{suffix}"]},
+        {"title": f"import-{suffix}-1"},
+        {"user_id": -1, "title": f"import-{suffix}-2"},
+        {"user_id": user_ids[1], "title": f"import-{suffix}-3"},
+    ])
+    result["items_rejected"] = await importer.run("items", str(items_file), batch_size=10, job=jobs[1])
+    async with connection.async_session_maker() as session:
+        result["items"] = (await session.scalars(
+            select(models.Items.title).where(models.Items.user_id.in_(user_ids))
+            .order_by(models.Items.title))).all()
+        result["rows_done"] = (await session.scalars(
+            select(models.ImportCheckpoints.rows_done).where(models.ImportCheckpoints.job.in_(jobs))
+            .order_by(models.ImportCheckpoints.job))).all()
+        await session.execute(delete(models.Users).where(models.Users.id.in_(user_ids)))
+        await session.execute(delete(models.ImportCheckpoints).where(models.ImportCheckpoints.job.in_(jobs)))
+        await session.commit()
+    return result
+
+
+def test_rows_rejected_by_database_do_not_abort_batch(tmp_path, database):
+    suffix = database.suffix
+    result = database.run(run_import_scenario, tmp_path, suffix)
+    assert result["users_rejected"] == 2
+    assert result["users"] == 2
+    # без user_id и с несуществующим пользователем
+    assert result["items_rejected"] == 2
+    assert result["items"] == [f"import-{suffix}-0", f"import-{suffix}-3"]
+    # пачки зафиксированы: продолжение задачи не повторяет их
+    assert result["rows_done"] == [4, 4]
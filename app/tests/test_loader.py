@@ -0,0 +1,104 @@
+import asyncio
+
+from database.loader import BatchLoader
+from modules.uow import BookshelfUnitofWork
+
+
+def recording_loader(lock: asyncio.Lock = None, running: list = None) -> tuple[BatchLoader, list, list]:
+    """
+    Загрузчик, запоминающий пакеты и число одновременно выполняемых выборок
+
+    Args:
+        running: [выполняется сейчас, максимум] - общий для нескольких загрузчиков счетчик
+    """
+    calls = []
+    running = running if running is not None else [0, 0]
+
+    async def batch_fn(keys: list[int]) -> dict[int, str]:
+        calls.append(keys)
+        running[0] += 1
+        running[1] = max(running)
+        # выборка уступает цикл событий, как запрос к БД
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        # четные ключи "существуют"
+        return {key: f"value-{key}" for key in keys if key % 2 == 0}
+
+    return BatchLoader(batch_fn, lock), calls, running
+
+
+def test_keys_are_batched_and_deduplicated():
+    async def scenario():
+        loader, calls, _ = recording_loader()
+        values = await loader.load_many([2, 4, 2, 6])
+        # повторный запрос берется из кэша загрузчика
+        again = await loader.load(4)
+        return values, again, calls
+
+    values, again, calls = asyncio.run(scenario())
+    assert values == ["value-2", "value-4", "value-2", "value-6"]
+    assert again == "value-4"
+    assert calls == [[2, 4, 6]]
+
+
+def test_missing_keys_resolve_to_none():
+    async def scenario():
+        loader, calls, _ = recording_loader()
+        return await loader.load_many([1, 2, 3]), calls
+
+    values, calls = asyncio.run(scenario())
+    assert values == [None, "value-2", None]
+    assert calls == [[1, 2, 3]]
+
+
+def test_loaders_of_one_session_do_not_run_concurrently():
+    async def scenario(lock: asyncio.Lock = None):
+        running = [0, 0]
+        by_id, id_calls, _ = recording_loader(lock, running)
+        by_values, values_calls, _ = recording_loader(lock, running)
+        # два загрузчика получают ключи в одном проходе цикла событий
+        results = await asyncio.gather(by_id.load(2), by_values.load(4), by_id.load(6), by_values.load(3))
+        return results, id_calls, values_calls, running[1]
+
+    results, id_calls, values_calls, concurrent = asyncio.run(scenario(asyncio.Lock()))
+    assert results == ["value-2", "value-4", "value-6", None]
+    assert id_calls == [[2, 6]]
+    assert values_calls == [[4, 3]]
+    assert concurrent == 1
+    # без общего lock пакеты выполнялись бы одновременно
+    assert asyncio.run(scenario())[3] == 2
+
+
+async def run_mixed_lookup(suffix: str) -> dict:
+    uow = BookshelfUnitofWork()
+    async with uow:
+        user = await uow.users.get_or_create(
+            {"email": f"loader-{suffix}@example.com", "display_name": f"loader-{suffix}"})
+        first, second = await uow.tags.get_or_create_list([
+            {"name": f"loader-a-{suffix}", "user_id": user.id},
+            {"name": f"loader-b-{suffix}", "user_id": user.id}])
+        new = {"name": f"loader-c-{suffix}", "user_id": user.id}
+        # поиск по id и по значениям в одном вызове: пакеты разных загрузчиков одной сессии
+        mixed = await uow.tags.get_or_create_list([
+            {"id": first.id}, new, {"id": second.id},
+            {"name": f"loader-d-{suffix}", "user_id": user.id}, dict(new)])
+        found = await uow.tags.get_by_id_or_none_list([{"id": first.id}, {"id": -1}, {"id": first.id}])
+        result = {
+            "ids": (first.id, second.id),
+            "mixed": [tag.id for tag in mixed],
+            "found": [tag.id if tag is not None else None for tag in found],
+        }
+        await uow.rollback()
+    return result
+
+
+def test_mixed_id_and_value_lookup(database):
+    result = database.run(run_mixed_lookup, database.suffix)
+    first, second = result["ids"]
+    mixed = result["mixed"]
+    assert mixed[0] == first
+    assert mixed[2] == second
+    # одинаковые значения создают один объект
+    assert mixed[1] == mixed[4]
+    assert len({*mixed}) == 4
+    assert result["found"] == [first, None, first]
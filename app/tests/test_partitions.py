@@ -0,0 +1,112 @@
+from datetime import date
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from commands import partitions
+from database.connection import create_engine
+from modules import models
+from modules.items_manager.schemas.units import Kind, Priority, Status
+
+TABLE = models.ItemEvents.__tablename__
+# больше секций, чем создает миграция: ensure должен создавать новые
+MONTHS_AHEAD = 12
+
+
+async def rollups(session, user_id: int) -> dict[tuple[str, str], int]:
+    rows = await session.execute(
+        select(models.ItemEventRollups.field, models.ItemEventRollups.value,
+               models.ItemEventRollups.transitions)
+        .where(models.ItemEventRollups.user_id == user_id))
+    return {(field, value): transitions for field, value, transitions in rows}
+
+
+async def count_events(session, user_id: int) -> int:
+    return await session.scalar(
+        select(func.count()).select_from(models.ItemEvents).where(models.ItemEvents.user_id == user_id))
+
+
+async def set_status(session_maker: async_sessionmaker, item_id: int, value: Status) -> None:
+    async with session_maker() as session:
+        await session.execute(update(models.Items).where(models.Items.id == item_id).values(status=value))
+        await session.commit()
+
+
+async def run_partitions_scenario(database) -> dict:
+    current = partitions.partition_name(TABLE, date.today().replace(day=1))
+    result = {}
+    async with database.temporary("bookshelf_partitions") as (name,):
+        engine = create_engine(database.url(name))
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with session_maker() as session:
+                user = models.Users(email="events@example.com", display_name="events")
+                session.add(user)
+                await session.flush()
+                item = models.Items(user_id=user.id, title="events", kind=Kind.BOOK,
+                                    status=Status.PLANNED, priority=Priority.NORMAL)
+                session.add(item)
+                await session.commit()
+            await set_status(session_maker, item.id, Status.READING)
+            async with session_maker() as session:
+                result["events"] = await count_events(session, user.id)
+                result["rollups"] = await rollups(session, user.id)
+
+            # секции на текущий месяц нет: запись материала проходит, пишется только сводка
+            async with session_maker() as session:
+                await session.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {current}"))
+                await session.execute(text(f"DROP TABLE {current}"))
+                await session.commit()
+            await set_status(session_maker, item.id, Status.DONE)
+            async with session_maker() as session:
+                result["events_without_partition"] = await count_events(session, user.id)
+                result["rollups_without_partition"] = await rollups(session, user.id)
+            result["recreated"] = await partitions.ensure(0, session_maker)
+
+            # старая секция отсоединяется и удаляется, текущая остается
+            async with session_maker() as session:
+                await session.execute(text(
+                    f"CREATE TABLE {TABLE}_2001_01 PARTITION OF {TABLE} "
+                    f"FOR VALUES FROM ('2001-01-01') TO ('2001-02-01')"))
+                await session.commit()
+            result["detached"] = await partitions.detach(12, drop=True, engine=engine)
+            async with session_maker() as session:
+                result["partitions"] = set(await partitions.list_partitions(session, TABLE))
+            return result
+        finally:
+            await engine.dispose()
+
+
+def test_trigger_rollups_and_detach(database):
+    result = database.run(run_partitions_scenario, database)
+    current = partitions.partition_name(TABLE, date.today().replace(day=1))
+    # создание: переходы status и priority из NULL, затем смена статуса
+    assert result["events"] == 3
+    assert result["rollups"] == {("status", "PLANNED"): 1, ("priority", "NORMAL"): 1, ("status", "READING"): 1}
+
+    # события текущего месяца удалены вместе с секцией, новое событие некуда записать
+    assert result["events_without_partition"] == 0
+    assert result["rollups_without_partition"] == {**result["rollups"], ("status", "DONE"): 1}
+    assert result["recreated"] == [current]
+
+    assert result["detached"] == [f"{TABLE}_2001_01"]
+    assert f"{TABLE}_2001_01" not in result["partitions"]
+    assert current in result["partitions"]
+
+
+async def run_locked_ensure(database) -> list[str]:
+    async with database.temporary("bookshelf_partitions") as (name,):
+        engine = create_engine(database.url(name))
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with session_maker() as holder:
+                # открытая транзакция с чтением журнала держит блокировку родительской таблицы
+                await holder.execute(select(func.count()).select_from(models.ItemEvents))
+                return await partitions.ensure(MONTHS_AHEAD, session_maker)
+        finally:
+            await engine.dispose()
+
+
+def test_ensure_skips_on_lock_timeout(database, monkeypatch):
+    monkeypatch.setattr(partitions, "LOCK_TIMEOUT", "200ms")
+    assert database.run(run_locked_ensure, database) == []
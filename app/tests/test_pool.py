@@ -0,0 +1,42 @@
+from sqlalchemy import text
+
+from database import connection
+from database.connection import create_engine, get_pool_status
+from settings import settings
+
+
+async def run_pool_scenario() -> dict:
+    # второй движок - как у реплики или шарда: свой пул и свои счетчики
+    other = create_engine(settings.DB_URL)
+    try:
+        primary_before = connection.engine.pool.statistics.checkouts
+        for _ in range(3):
+            async with other.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        statistics = other.pool.statistics
+        # dispose() заменяет пул: счетчики сохраняются
+        await other.dispose()
+        async with other.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        status = get_pool_status([other])
+        return {
+            "primary_checkouts": connection.engine.pool.statistics.checkouts - primary_before,
+            "same_statistics": other.pool.statistics is statistics,
+            "status": status,
+        }
+    finally:
+        await other.dispose()
+
+
+def test_pools_are_counted_separately(database):
+    result = database.run(run_pool_scenario)
+    assert result["primary_checkouts"] == 0
+    assert result["same_statistics"]
+    status = result["status"]
+    shard = status["shards"][0]
+    assert shard["checkouts"] == 4
+    assert shard["connects"] == 2
+    assert shard["checked_out"] == 0
+    assert settings.POSTGRES_PASSWORD not in shard["url"]
+    assert status["primary"]["url"] == shard["url"]
+    assert status["replicas"] == []
@@ -0,0 +1,305 @@
+import asyncio
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError, NoResultFound
+
+from commands.stats import stats_counters
+from database.cache import PENDING_INVALIDATION
+from modules import models
+from modules.items_manager.schemas.units import Kind, Priority, Status
+from modules.uow import BookshelfUnitofWork
+
+CONCURRENT_CREATES = 500
+
+
+async def create_concurrently(values: dict) -> list:
+    async def create():
+        uow = BookshelfUnitofWork()
+        async with uow:
+            tag = await uow.tags.get_or_create(values)
+            await uow.commit()
+            return tag.id
+
+    return await asyncio.gather(*(create() for _ in range(CONCURRENT_CREATES)),
+                                return_exceptions=True)
+
+
+async def run_get_or_create_race(suffix: str) -> tuple[list, int]:
+    uow = BookshelfUnitofWork()
+    async with uow:
+        user = await uow.users.get_or_create(
+            {"email": f"race-{suffix}@example.com", "display_name": f"race-{suffix}"})
+        await uow.commit()
+    values = {"user_id": user.id, "name": f"race-{suffix}"}
+    results = await create_concurrently(values)
+    async with uow:
+        rows = await uow.session.scalar(
+            select(func.count()).select_from(models.Tags).filter_by(**values))
+        await uow.session.execute(delete(models.Tags).where(models.Tags.user_id == user.id))
+        await uow.session.execute(delete(models.Users).where(models.Users.id == user.id))
+        await uow.commit()
+    return results, rows
+
+
+def test_get_or_create_concurrent_single_row(database):
+    results, rows = database.run(run_get_or_create_race, database.suffix)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    assert errors == []
+    assert rows == 1
+    assert len(set(results)) == 1
+
+
+async def run_conflict_on_other_key(suffix: str) -> dict:
+    email, display_name = f"conflict-{suffix}@example.com", f"conflict-{suffix}"
+    other_email = f"conflict-other-{suffix}@example.com"
+    result = {}
+    uow = BookshelfUnitofWork()
+    async with uow:
+        user = await uow.users.get_or_create({"email": email, "display_name": display_name})
+        await uow.commit()
+    async with uow:
+        # тот же ключ поиска (email) - существующий объект
+        result["same"] = (await uow.users.get_or_create({"email": email, "display_name": "другое имя"})).id
+        # новый email, но занятое display_name: конфликт не по искомому ключу
+        try:
+            await uow.users.get_or_create({"email": other_email, "display_name": display_name})
+        except IntegrityError:
+            result["other_key"] = "IntegrityError"
+        await uow.rollback()
+    async with uow:
+        # фильтр по email, конфликт по display_name: fallback пуст
+        try:
+            await uow.users.get_by_filter_or_create(
+                {"email": other_email, "display_name": display_name}, models.Users.email == other_email)
+        except HTTPException as e:
+            result["filter"] = e.status_code
+        await uow.rollback()
+    async with uow:
+        await uow.session.execute(delete(models.Users).where(models.Users.id == user.id))
+        await uow.commit()
+    result["user_id"] = user.id
+    return result
+
+
+def test_get_or_create_conflict_on_other_unique_key(database):
+    result = database.run(run_conflict_on_other_key, database.suffix)
+    assert result["same"] == result["user_id"]
+    assert result["other_key"] == "IntegrityError"
+    assert result["filter"] == 409
+
+
+async def count_links(session, item_id: int) -> int:
+    links = models.items_tags_association_table
+    return await session.scalar(select(func.count()).select_from(links).where(links.c.item_id == item_id))
+
+
+async def run_owner_scenario(suffix: str) -> dict:
+    result = {}
+    uow = BookshelfUnitofWork()
+    async with uow:
+        first, second = [await uow.users.get_or_create(
+            {"email": f"owner-{name}-{suffix}@example.com", "display_name": f"owner-{name}-{suffix}"})
+            for name in ("a", "b")]
+        tag = await uow.tags.get_or_create({"user_id": first.id, "name": f"owner-{suffix}"})
+        item = await uow.items.create({"user_id": first.id, "title": f"owner-{suffix}", "kind": Kind.BOOK,
+                                       "status": Status.PLANNED, "priority": Priority.NORMAL})
+        await uow.items.link("tags", [item.id], [tag.id])
+        await uow.commit()
+    try:
+        async with uow:
+            found = await uow.items.get_by_id_or_none(item.id, ["tags"], first.id)
+            result["tags"] = [tag_.id for tag_ in found.tags]
+            # владелец известен клиенту: материал другого владельца не найден
+            result["other_owner"] = await uow.items.get_by_id_or_none(item.id, ["tags"], second.id)
+            result["updated_at_other"] = await uow.items.get_updated_at(item.id, second.id)
+
+            try:
+                await uow.items.update_returning({"user_id": second.id}, uow.items.model.id == item.id,
+                                                 owner=second.id)
+            except NoResultFound:
+                result["pruned_update"] = "NoResultFound"
+            # перенос к другому владельцу: связи с тегами прежнего владельца удаляются
+            moved = await uow.items.update_returning({"user_id": second.id}, uow.items.model.id == item.id,
+                                                     include=["tags"])
+            result["moved"] = moved.user_id, moved.tags
+            result["links_after_move"] = await count_links(uow.session, item.id)
+            result["exists_old_owner"] = await uow.items.exists_by_id(item.id, first.id)
+            try:
+                await uow.items.delete(uow.items.model.id == item.id, owner=first.id)
+            except NoResultFound:
+                result["delete_old_owner"] = "NoResultFound"
+            await uow.items.delete(uow.items.model.id == item.id, owner=second.id)
+            result["exists_after_delete"] = await uow.items.exists_by_id(item.id)
+            await uow.commit()
+    finally:
+        async with uow:
+            await uow.session.execute(delete(models.Users).where(models.Users.id.in_([first.id, second.id])))
+            await uow.commit()
+    result["ids"] = first.id, second.id, tag.id
+    return result
+
+
+def test_owner_lookup_and_owner_change(database):
+    result = database.run(run_owner_scenario, database.suffix)
+    first, second, tag = result["ids"]
+    assert result["tags"] == [tag]
+    assert result["other_owner"] is None
+    assert result["updated_at_other"] is None
+
+    assert result["pruned_update"] == "NoResultFound"
+    # тег остался у прежнего владельца, связь не переносится
+    assert result["moved"] == (second, [])
+    assert result["links_after_move"] == 0
+    assert result["exists_old_owner"] is False
+
+    assert result["delete_old_owner"] == "NoResultFound"
+    assert result["exists_after_delete"] is False
+
+
+def item_values(user_id: int, title: str) -> dict:
+    return {"user_id": user_id, "title": title, "kind": Kind.BOOK,
+            "status": Status.PLANNED, "priority": Priority.NORMAL}
+
+
+async def run_create_many(suffix: str) -> dict:
+    uow = BookshelfUnitofWork()
+    async with uow:
+        user = await uow.users.get_or_create(
+            {"email": f"bulk-{suffix}@example.com", "display_name": f"bulk-{suffix}"})
+        uow.session.info.pop(PENDING_INVALIDATION, None)
+        rows = [item_values(user.id, f"bulk-{suffix}-{index}") for index in range(5)]
+        # несуществующий владелец: пачка [2, 3] не вставляется и повторяется по одной строке
+        rows[3]["user_id"] = -1
+        results = await uow.items.create_many(rows, chunk_size=2)
+        # точки сохранения откатили только ошибочную пачку: транзакция продолжается
+        stored = (await uow.session.scalars(
+            select(models.Items.title).where(models.Items.user_id == user.id).order_by(models.Items.id))).all()
+        result = {
+            "titles": [instance.title if instance is not None else None for instance, _ in results],
+            "errors": [error for _, error in results],
+            "stored": stored,
+            "changed": uow.session.info.get(PENDING_INVALIDATION),
+            "user_id": user.id,
+        }
+        await uow.rollback()
+    return result
+
+
+def test_create_many_falls_back_to_rows_within_chunk(database):
+    result = database.run(run_create_many, database.suffix)
+    titles = [f"bulk-{database.suffix}-{index}" for index in range(5)]
+    assert result["titles"] == [*titles[:3], None, titles[4]]
+    assert [error is None for error in result["errors"]] == [True, True, True, False, True]
+    assert result["errors"][3]
+    assert result["stored"] == [*titles[:3], titles[4]]
+    # владельцы вставленных строк регистрируются для инвалидации кэша
+    assert result["changed"] == {result["user_id"]}
+
+
+async def run_link_unlink(suffix: str) -> dict:
+    uow = BookshelfUnitofWork()
+    result = {}
+
+    async def counted(method, *args) -> tuple[int, set]:
+        uow.session.info.pop(PENDING_INVALIDATION, None)
+        count = await method("tags", *args)
+        return count, uow.session.info.get(PENDING_INVALIDATION)
+
+    async with uow:
+        owner, other = [await uow.users.get_or_create(
+            {"email": f"link-{name}-{suffix}@example.com", "display_name": f"link-{name}-{suffix}"})
+            for name in ("a", "b")]
+        items = [await uow.items.create(item_values(owner.id, f"link-{suffix}-{index}")) for index in range(2)]
+        tags = [await uow.tags.get_or_create({"user_id": owner.id, "name": f"link-{suffix}-{index}"})
+                for index in range(2)]
+        foreign = await uow.tags.get_or_create({"user_id": other.id, "name": f"link-{suffix}"})
+        item_ids, tag_ids = [item.id for item in items], [tag.id for tag in tags]
+
+        # тег другого пользователя не связывается
+        result["link"] = await counted(uow.items.link, item_ids, [*tag_ids, foreign.id])
+        # существующие связи пропускаются
+        result["link_again"] = await counted(uow.items.link, item_ids, tag_ids)
+        result["unlink"] = await counted(uow.items.unlink, [item_ids[0]], [*tag_ids, foreign.id])
+        result["unlink_again"] = await counted(uow.items.unlink, [item_ids[0]], tag_ids)
+        result["linked"] = [await count_links(uow.session, item_id) for item_id in item_ids]
+        result["owner"] = owner.id
+        await uow.rollback()
+    return result
+
+
+def test_link_unlink_counts_and_changed_owners(database):
+    result = database.run(run_link_unlink, database.suffix)
+    owner = result["owner"]
+    assert result["link"] == (4, {owner})
+    assert result["link_again"] == (0, set())
+    assert result["unlink"] == (2, {owner})
+    assert result["unlink_again"] == (0, set())
+    assert result["linked"] == [0, 2]
+
+
+async def stats_snapshot(session, user_ids: list[int]) -> tuple[dict, dict]:
+    """
+    Счетчики сводки, обновленные триггерами, и пересчет по items (как в manage.py rebuild-stats)
+    """
+    counters = stats_counters()
+    stats = models.UserItemStats
+    stored = {row.user_id: {name: getattr(row, name) for name in counters}
+              for row in await session.scalars(select(stats).where(stats.user_id.in_(user_ids)))}
+    recount = {user_id: dict.fromkeys(counters, 0) for user_id in user_ids}
+    rows = await session.execute(
+        select(models.Items.user_id, *(counter.label(name) for name, counter in counters.items()))
+        .where(models.Items.user_id.in_(user_ids)).group_by(models.Items.user_id))
+    for user_id, *values in rows:
+        recount[user_id] = dict(zip(counters, values))
+    return stored, recount
+
+
+async def run_stats_triggers(suffix: str) -> dict:
+    uow = BookshelfUnitofWork()
+    steps = {}
+    async with uow:
+        first, second = [await uow.users.get_or_create(
+            {"email": f"stats-{name}-{suffix}@example.com", "display_name": f"stats-{name}-{suffix}"})
+            for name in ("a", "b")]
+        user_ids = [first.id, second.id]
+        # строка сводки создается триггером на вставку пользователя
+        steps["created"] = await stats_snapshot(uow.session, user_ids)
+        results = await uow.items.create_many([
+            item_values(first.id, f"stats-{suffix}-0"),
+            {**item_values(first.id, f"stats-{suffix}-1"), "kind": Kind.ARTICLE,
+             "status": Status.READING, "priority": Priority.HIGH},
+            item_values(first.id, f"stats-{suffix}-2"),
+        ])
+        book, _, other = [instance.id for instance, _ in results]
+        steps["inserted"] = await stats_snapshot(uow.session, user_ids)
+        await uow.items.update_returning({"status": Status.DONE}, models.Items.id == book)
+        steps["updated"] = await stats_snapshot(uow.session, user_ids)
+        # смена владельца переносит строку в другую секцию: счетчики переходят к новому владельцу
+        await uow.items.update_returning({"user_id": second.id, "priority": Priority.LOW},
+                                         models.Items.id == book)
+        await uow.items.update_by_filters({"user_id": second.id}, {"user_id": first.id, "kind": Kind.ARTICLE})
+        steps["moved"] = await stats_snapshot(uow.session, user_ids)
+        await uow.items.delete(models.Items.id == other)
+        steps["deleted"] = await stats_snapshot(uow.session, user_ids)
+        steps["ids"] = user_ids
+        await uow.rollback()
+    return steps
+
+
+def test_user_item_stats_follow_item_changes(database):
+    steps = database.run(run_stats_triggers, database.suffix)
+    first, second = steps.pop("ids")
+    for name, (stored, recount) in steps.items():
+        # сводка после каждого шага совпадает с пересчетом с нуля
+        assert stored == recount, name
+
+    inserted = steps["inserted"][0][first]
+    assert (inserted["total"], inserted["kind_book"], inserted["status_reading"]) == (3, 2, 1)
+    moved = steps["moved"][0]
+    assert moved[first]["total"] == 1
+    assert (moved[second]["total"], moved[second]["status_done"], moved[second]["priority_low"],
+            moved[second]["kind_article"]) == (2, 1, 1, 1)
+    deleted = steps["deleted"][0]
+    assert deleted[first]["total"] == 0
+    assert deleted[second]["total"] == 2
@@ -0,0 +1,172 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import sharding
+from modules import models
+from modules.items_manager.schemas.units import Kind, Priority, Status
+from modules.uow import ShardedUnitOfWork
+
+SHARDS = 2
+USERS = 6
+ITEMS_PER_USER = 3
+
+
+def sort_params(**params) -> dict:
+    return {"limit": 2, "offset": 0, "cursor": None, "sort_by": "display_name", "desc": False, **params}
+
+
+async def fill_shards(prefix: str) -> dict[int, list[int]]:
+    """
+    Пользователи с материалами: user_id -> id материалов
+    """
+    uow = ShardedUnitOfWork()
+    owned = {}
+    async with uow:
+        for index in range(USERS):
+            user = await uow.users.get_by_display_name_or_create(
+                f"{prefix}-{index}", {"email": f"{prefix}-{index}@example.com"})
+            owned[user.id] = []
+            for number in range(ITEMS_PER_USER):
+                item = await uow.items.create({
+                    "user_id": user.id, "title": f"{prefix}-{index}-{number}",
+                    "kind": Kind.BOOK, "status": Status.PLANNED, "priority": Priority.NORMAL})
+                owned[user.id].append(item.id)
+        await uow.commit()
+    return owned
+
+
+async def collect_pages(sorting: dict, keyset: bool) -> list[str]:
+    names = []
+    uow = ShardedUnitOfWork(read_only=True)
+    async with uow:
+        while True:
+            users, _ = await uow.users.paginate({}, sorting)
+            names += [user.display_name for user in users]
+            cursor = uow.users.get_next_cursor(users, sorting)
+            if not users or (keyset and cursor is None):
+                return names
+            if keyset:
+                sorting = {**sorting, "cursor": cursor}
+            else:
+                sorting = {**sorting, "offset": sorting["offset"] + 1}
+
+
+async def run_sharded_scenario(database) -> dict:
+    async with database.temporary("bookshelf_shard", SHARDS) as names:
+        try:
+            shard_map = await sharding.init_shards([database.url(name) for name in names], {})
+            await sharding.prepare_sequences()
+            owned = await fill_shards("shard")
+
+            placement = {}
+            for index, session_maker in enumerate(sharding.shard_session_makers):
+                async with session_maker() as session:
+                    placement[index] = {
+                        "users": set((await session.scalars(select(models.Users.id))).all()),
+                        "items": set((await session.scalars(select(models.Items.user_id))).all()),
+                    }
+
+            uow = ShardedUnitOfWork()
+            async with uow:
+                user_id = next(iter(owned))
+                own_items, _ = await uow.items.paginate(
+                    {"user_id": user_id}, {**sort_params(sort_by="id"), "limit": 10})
+                own_items = [item.id for item in own_items]
+                other = next(other_id for other_id in owned
+                             if shard_map.shard_for(other_id) != shard_map.shard_for(user_id))
+                try:
+                    await uow.items.update_returning(
+                        {"user_id": other}, models.Items.id == owned[user_id][0])
+                    move_status = None
+                except HTTPException as e:
+                    move_status = e.status_code
+                await uow.rollback()
+
+            return {
+                "shard_map": shard_map,
+                "owned": owned,
+                "placement": placement,
+                "own_items": own_items,
+                "user_id": user_id,
+                "offset_pages": await collect_pages(sort_params(), keyset=False),
+                "keyset_pages": await collect_pages(sort_params(), keyset=True),
+                "desc_pages": await collect_pages(sort_params(desc=True), keyset=True),
+                "move_status": move_status,
+            }
+        finally:
+            await sharding.dispose_shards()
+
+
+def test_sharded_unit_of_work(database):
+    result = database.run(run_sharded_scenario, database)
+    shard_map, owned, placement = result["shard_map"], result["owned"], result["placement"]
+
+    # id пользователя указывает на его шард, материалы лежат рядом с владельцем
+    for shard, rows in placement.items():
+        assert all(shard_map.shard_for(user_id) == shard for user_id in rows["users"])
+        assert rows["items"] <= rows["users"]
+    assert set().union(*(rows["users"] for rows in placement.values())) == set(owned)
+    assert all(rows["users"] for rows in placement.values())
+
+    assert result["own_items"] == sorted(owned[result["user_id"]])
+
+    # слияние страниц шардов дает общий порядок сортировки
+    names = sorted(result["offset_pages"])
+    assert len(names) == USERS
+    assert result["offset_pages"] == names
+    assert result["keyset_pages"] == names
+    assert result["desc_pages"] == names[::-1]
+
+    assert result["move_status"] == 409
+
+
+async def run_partial_commit(database, monkeypatch) -> dict:
+    result = {}
+    async with database.temporary("bookshelf_commit", 3) as names:
+        try:
+            await sharding.init_shards([database.url(name) for name in names], {})
+            await sharding.prepare_sequences()
+            uow = ShardedUnitOfWork()
+            async with uow:
+                # ошибка записи на втором шарде (повтор display_name) возникает до первого коммита
+                for index, session in enumerate(uow.sessions):
+                    session.add_all([
+                        models.Users(email=f"flush-{index}-{number}@example.com", display_name=f"flush-{index}")
+                        for number in range(2 if index == 1 else 1)])
+                try:
+                    await uow.commit()
+                except IntegrityError:
+                    result["flush_error"] = "IntegrityError"
+
+            async with uow:
+                for index, repository in enumerate(uow.users.shards):
+                    await repository.create({"email": f"commit-{index}@example.com", "display_name": f"commit-{index}"})
+
+                async def broken_commit():
+                    raise ConnectionError("соединение с шардом потеряно")
+
+                # коммит второго шарда обрывается после коммита первого
+                monkeypatch.setattr(uow.sessions[1], "commit", broken_commit)
+                try:
+                    await uow.commit()
+                except ConnectionError:
+                    result["commit_error"] = "ConnectionError"
+                result["in_transaction"] = [session.in_transaction() for session in uow.sessions]
+            result["users"] = []
+            for session_maker in sharding.shard_session_makers:
+                async with session_maker() as session:
+                    result["users"].append((await session.scalars(select(models.Users.display_name))).all())
+            return result
+        finally:
+            await sharding.dispose_shards()
+
+
+def test_partial_commit_rolls_back_remaining_shards(database, monkeypatch):
+    result = database.run(run_partial_commit, database, monkeypatch)
+    assert result["flush_error"] == "IntegrityError"
+    assert result["commit_error"] == "ConnectionError"
+    # незафиксированные шарды откатываются сразу, а не при закрытии сессии
+    assert result["in_transaction"] == [False, False, False]
+    # ошибка flush не зафиксировала ни одного шарда; при ошибке коммита первый шард уже зафиксирован
+    assert result["users"] == [["commit-0"], [], []]
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from database.connection import async_session_maker
 
@@ -8,6 +10,9 @@ class AbstractUnitOfWork(ABC):
     @abstractmethod
     def __init__(self):
         self.factory = async_session_maker
+        # в пределах запроса (request_scope) сессия одна на все входы в uow
+        self.request_scoped = False
+        self.depth = 0
 
     @abstractmethod
     async def __aenter__(self):
@@ -23,4 +28,26 @@ class AbstractUnitOfWork(ABC):
 
     @abstractmethod
     async def rollback(self):
-        ...
\ No newline at end of file
+        ...
+
+    @abstractmethod
+    async def end_request(self, commit: bool = True):
+        ...
+
+    @asynccontextmanager
+    async def request_scope(self) -> AsyncIterator["AbstractUnitOfWork"]:
+        """
+        Одна сессия и одна транзакция на запрос
+
+        Все входы в uow внутри блока используют одну сессию, commit сервисов
+        только отправляет изменения в БД (flush). Транзакция фиксируется при выходе
+        из блока или откатывается при исключении, после чего соединение
+        возвращается в пул
+        """
+        self.request_scoped = True
+        try:
+            yield self
+        except BaseException:
+            await self.end_request(commit=False)
+            raise
+        await self.end_request()
@@ -1,27 +1,99 @@
-from typing import List, Any, Union, Annotated
+import csv
+import io
+from collections.abc import Mapping
+from enum import Enum
+from functools import lru_cache
+from typing import List, Any, Union, Annotated, Optional, Callable
 
+from fastapi import HTTPException, Response, status
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.types import Receive, Scope, Send
 
 
-def validation(
-        validation_model: BaseModel,
-        instance_object: Union[List, Any, None]) -> Union[List[dict], dict]:
+@lru_cache(maxsize=None)
+def get_adapter(schema: type[BaseModel], many: bool) -> TypeAdapter:
     """
-    Функция для валидации объектов по заданной pydantic-схеме
+    Закэшированный TypeAdapter для схемы ответа (или списка схем)
     """
+    return TypeAdapter(list[schema] if many else schema)
+
+
+ROWS_ADAPTER = TypeAdapter(list[dict[str, Any]])
+
+
+class DeferredResponse(Response):
+    """
+    JSON-ответ, тело которого кодируется при отправке, а не в эндпоинте
+
+    Зависимость единицы работы (api.dependencies) завершает транзакцию после
+    выхода из эндпоинта, но до отправки ответа, поэтому кодирование объектов
+    выполняется уже без соединения из пула
+    """
+    media_type = "application/json"
+
+    def __init__(self, render_body: Callable[[], bytes], status_code: int = status.HTTP_200_OK,
+                 headers: Optional[dict] = None):
+        self.render_body = render_body
+        super().__init__(None, status_code, headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.body = self.render_body()
+        self.headers["content-length"] = str(len(self.body))
+        await super().__call__(scope, receive, send)
+
+
+def serialize(
+        schema: type[BaseModel],
+        instance_object: Union[List, Any],
+        status_code: int = status.HTTP_200_OK,
+        headers: Optional[dict] = None) -> Response:
+    """
+    Валидация объектов по pydantic-схеме и кодирование в JSON одним вызовом
+
+    Возвращает Response, поэтому FastAPI не валидирует результат повторно
+    по аннотации эндпоинта; кодирование откладывается до отправки (DeferredResponse)
+    """
+    adapter = get_adapter(schema, isinstance(instance_object, list))
+
+    def render_body() -> bytes:
+        try:
+            return adapter.dump_json(
+                adapter.validate_python(instance_object, from_attributes=True))
+        except ValidationError as e:
+            logger.error(f"Validation error occured, {e}")
+            raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Ошибка при формировании ответа")
+
+    return DeferredResponse(render_body, status_code=status_code, headers=headers)
+
+
+def serialize_rows(rows: List[Mapping], headers: Optional[dict] = None) -> Response:
+    """
+    Кодирование строк выборки по колонкам (режим fields) в JSON при отправке ответа
+    """
+    return DeferredResponse(lambda: ROWS_ADAPTER.dump_json([dict(row) for row in rows]),
+                            headers=headers)
+
+
+def encode_csv_rows(rows: List[list]) -> bytes:
+    """
+    Кодирование строк в CSV (для потоковой выгрузки пачками)
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def parse_comma_separated(value: Optional[str], enum_class: type[Enum]) -> list[Enum]:
+    """
+    Разбор параметра запроса вида "a,b,c" в список членов перечисления
+    """
+    if not value:
+        return []
     try:
-        if isinstance(instance_object, list):
-            return [
-                validation_model.model_validate(
-                    instance, from_attributes=True).model_dump()
-                for instance in instance_object
-            ]
-        elif instance_object is None:
-            return {"detail": "no data provided due to status code"}
-        else:
-            return validation_model.model_validate(
-                instance_object, from_attributes=True).model_dump()
-    except Exception as e:
-        logger.error(f"Validation error occured, {e}")
-        return {"detail": "error occured"}
+        members = [enum_class(part.strip()) for part in value.split(",") if part.strip()]
+    except ValueError:
+        allowed = ", ".join(member.value for member in enum_class)
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            f"Недопустимое значение '{value}', допустимые: {allowed}")
+    return list(dict.fromkeys(members))